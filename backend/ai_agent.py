@@ -1,69 +1,86 @@
 import os
-import csv
 import time
 import re
+from functools import cached_property
 import requests
-import speech_recognition as sr
+import asr
+import vad
+import http_clients
+from http_clients import CircuitOpenError
+from intent import IntentClassifier
+from technicians import TechnicianRegistry
+from dispatch import Dispatcher
+import tickets
+import telemetry
+
+log = telemetry.get_logger('agent')
 
 TWILIO_SID = os.getenv('TWILIO_SID', 'ACff9ab56f6046298714a4b29773ccf932')
 TWILIO_TOKEN = os.getenv('TWILIO_TOKEN', '74df57a3673b78e90a87917dc2336fa1')
 TWILIO_NUMBER = os.getenv('TWILIO_NUMBER', '+16466998764')
+TWILIO_API_BASE = os.getenv('TWILIO_API_BASE', 'https://api.twilio.com')
+PUBLIC_BASE_URL = os.getenv('PUBLIC_BASE_URL', 'https://ee7a6c5e298c.ngrok-free.app')
+TWILIO_RECORD_CALLS = os.getenv('TWILIO_RECORD_CALLS', '0') == '1'
 
 class AIAgent:
+    GREETING = 'Hello! Welcome to IT Support. Please describe your problem.'
+    NOT_HEARD = "I didn't catch that. Please describe your problem again."
+    URGENCY_PROMPT = 'Thank you. Is this issue urgent and needs immediate attention?'
+    TICKET_CREATED = 'No problem. A support ticket has been created. Our team will reach out within 24 hours.'
+    SESSION_COMPLETE = 'This conversation is complete. Please refresh to start a new session.'
+    DISPATCH_STARTED = 'Contacting a technician now. I will update you as soon as the call is placed.'
+
     def __init__(self):
-        print("[AIAgent] Initialized with Google Speech Recognition")
-        self.technicians = self.load_technicians()
+        # Models and the technician CSV load on first use, or all at once in warm_up()
+        self.intents = IntentClassifier()
+        self.technicians = TechnicianRegistry()
+        self.dispatcher = Dispatcher(self)
+        self.tickets = tickets.TicketStore()
 
-    def load_technicians(self):
-        techs = []
-        try:
-            with open('technicians.csv', 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    techs.append(row)
-            print(f"[AIAgent] Loaded {len(techs)} technicians")
-        except Exception as e:
-            print(f"[AIAgent] Error loading technicians: {e}")
-        return techs
+    @property
+    def asr(self):
+        return asr.get_engine()
+
+    @cached_property
+    def vad(self):
+        return vad.create_vad()
 
-    def transcribe_audio(self, audio_path):
+    def warm_up(self):
+        engine, detector = self.asr, self.vad
+        log.info(f"[AIAgent] Initialized with {engine.name} speech recognition, {detector.name} VAD, "
+                 f"{len(self.technicians)} technicians")
+
+    @telemetry.traced('transcribe_audio')
+    def transcribe_audio(self, audio):
+        """`audio` is 16 kHz mono int16 PCM, or a path to an audio file"""
         try:
-            recognizer = sr.Recognizer()
-            with sr.AudioFile(audio_path) as source:
-                recognizer.adjust_for_ambient_noise(source, duration=0.2)
-                audio_data = recognizer.record(source)
-            text = recognizer.recognize_google(audio_data)
-            print(f"[Google API] ✅ Transcribed: {text}")
+            pcm = asr.read_audio_file(audio) if isinstance(audio, str) else audio
+            if not len(pcm):
+                return ''
+            with telemetry.span('vad'):
+                speech = self.vad.trim(pcm)
+            if not len(speech):
+                log.info(f"[VAD:{self.vad.name}] No speech in {len(pcm) / asr.SAMPLE_RATE:.1f}s upload; skipping recognition")
+                return ''
+            with telemetry.span('asr'):
+                text = self.asr.transcribe(speech)
+            log.info(f"[ASR:{self.asr.name}] ✅ Transcribed: {text}")
             return text
-        except sr.UnknownValueError:
-            print("[Google API] Could not understand audio")
-            return ''
-        except sr.RequestError as e:
-            print(f"[Google API] Service error: {e}")
+        except asr.ServiceError as e:
+            log.warning(f"[ASR:{self.asr.name}] Service error: {e}")
             return ''
         except Exception as e:
-            print(f"[Google API] Unexpected error: {e}")
+            log.error(f"[ASR:{self.asr.name}] Unexpected error: {e}")
             return ''
 
-    def _has_word(self, text: str, words: list[str]) -> bool:
-        t = (text or '').lower()
-        return any(re.search(rf'\b{re.escape(w.lower())}\b', t) for w in words)
+    def asr_stats(self) -> dict:
+        stats = {'engine': self.asr.name, 'vad': {'backend': self.vad.name, **self.vad.stats.snapshot()}}
+        if hasattr(self.asr, 'stats'):
+            stats['batching'] = self.asr.stats()
+        return stats
 
     def infer_problem_type(self, text):
-        if self._has_word(text, ['vpn','remote','access']): return 'VPN Problem'
-        if self._has_word(text, ['wifi','wi-fi','internet','network','connection','connect']): return 'WiFi Down'
-        if self._has_word(text, ['printer','print','printing']): return 'Printer Error'
-        if self._has_word(text, ['account','login','password','locked','access denied']): return 'Account Locked'
-        if self._has_word(text, ['cloud','aws','azure','storage']): return 'Cloud Failure'
-        if self._has_word(text, ['software','application','bug','crash','error']): return 'Software Bug'
-        if self._has_word(text, ['billing','payment','invoice','charge']): return 'Billing Issue'
-        if self._has_word(text, ['database','db','sql','data']): return 'Database Crash'
-        if self._has_word(text, ['security','breach','hack','malware','virus']): return 'Security Breach'
-        if self._has_word(text, ['server','overload','slow','performance']): return 'Server Overload'
-        if self._has_word(text, ['email','smtp','outlook']): return 'Email Failure'
-        if self._has_word(text, ['backup','restore','recovery']): return 'Data Backup Failure'
-        if self._has_word(text, ['firewall','port','blocked']): return 'Firewall Error'
-        return 'Software Bug'
+        return self.intents.classify(text).problem_type
 
     def get_diagnostic_questions(self, ptype):
         q = {
@@ -83,25 +100,23 @@ class AIAgent:
         }
         return q.get(ptype, ["Can you describe the issue in more detail?","When did this problem first occur?"])
 
+    def static_prompts(self) -> list[str]:
+        """Every agent message process_conversation can produce without user-specific text"""
+        prompts = [self.GREETING, self.NOT_HEARD, self.URGENCY_PROMPT, self.TICKET_CREATED, self.SESSION_COMPLETE,
+                   self.DISPATCH_STARTED]
+        for ptype in self.intents.problem_types:
+            questions = self.get_diagnostic_questions(ptype)
+            prompts.append(f"I understand you're experiencing a {ptype}. {questions[0]}")
+            prompts.extend(questions[1:])
+        names = {t.name for t in self.technicians} | {'on-call technician'}
+        prompts.extend(f'Calling {name}...' for name in sorted(names) if name)
+        return list(dict.fromkeys(prompts))
+
     def _dispatch_intent(self, text: str) -> bool:
-        if not text: return False
-        t = text.lower()
-        phrases = [
-            'call the technician','call technician','call tech','please call technician',
-            'send technician','send someone','dispatch','escalate',
-            'book appointment','schedule visit','need onsite','need on-site',
-            'come now','visit asap','repair now','send engineer'
-        ]
-        return any(p in t for p in phrases)
+        return self.intents.classify(text).dispatch
 
     def is_urgent(self, text: str) -> bool:
-        if not text: return False
-        t = text.lower().strip()
-        if any(w in t for w in ['urgent','critical','immediately','asap','now','emergency','high priority']): return True
-        if any(w in t for w in ['जरूरी','तुरंत','इमरजेंसी','अभी']): return True
-        if any(w in t for w in ['ತುರತು','ತಕ್ಷಣ','அவசரம்','உடனே','అత్యవసరం','ఇప్పుడే']): return True
-        if any(w in t for w in ['عاجل','فوراً','فورا','ضروری','فوری']): return True
-        return False
+        return self.intents.classify(text).urgent
 
     def _normalize_phone(self, s: str) -> str:
         if not s: return ""
@@ -122,43 +137,45 @@ class AIAgent:
         if m: return f"in {m.group(2)} minutes"
         return None
 
+    @telemetry.traced('select_technician')
     def select_technician(self, problem_type):
-        for tech in self.technicians:
-            if tech.get('Problem Type','').strip()==problem_type and tech.get('Availability','').strip()=='24x7':
-                return tech
-        for tech in self.technicians:
-            if tech.get('Problem Type','').strip()==problem_type:
-                return tech
-        for tech in self.technicians:
-            if tech.get('Availability','').strip()=='24x7':
-                return tech
-        return self.technicians[0] if self.technicians else None
+        return self.technicians.select(problem_type)
 
-    def call_technician(self, technician, user_problem, diag_answers):
+    @telemetry.traced('call_technician')
+    def call_technician(self, technician, user_problem, diag_answers, ticket_id=''):
+        """Place one Twilio call. Besides 'final'/'events', reports 'ok' and whether a retry could help."""
         if not technician:
             return {'final': "No technician available at the moment. Please contact support directly.",
-                    'events': ["No technician available right now."]}
-        tech_name = technician.get('Name', 'Unknown')
-        tech_phone = self._normalize_phone(technician.get('Contact', ''))
-        tech_skillset = technician.get('Skillset', 'General Support')
+                    'events': ["No technician available right now."], 'ok': False, 'retryable': False}
+        tech_name = technician.name or 'Unknown'
+        tech_phone = self._normalize_phone(technician.contact)
+        tech_skillset = technician.skillset or 'General Support'
         if not tech_phone:
             return {'final': f"Selected {tech_name}, but no contact number available.",
-                    'events': [f"Could not call {tech_name}: missing number."]}
+                    'events': [f"Could not call {tech_name}: missing number."], 'ok': False, 'retryable': False}
 
         diag_summary = ' '.join(diag_answers) if diag_answers else 'No additional details provided'
         summary = f"{user_problem}. {diag_summary}"
-        events = ["Initiating conversational call with technician..."]
+        events = [f"Initiating conversational call with {tech_name}..."]
 
         try:
-            webhook_url = f"https://ee7a6c5e298c.ngrok-free.app/twilio-ivr?step=greet&problem={requests.utils.quote(summary)}"
+            webhook_url = f"{PUBLIC_BASE_URL}/twilio-ivr?step=greet&problem={requests.utils.quote(summary)}"
+            if ticket_id:
+                # Lets whichever worker takes the IVR confirmation claim the ticket
+                webhook_url += f"&ticket={ticket_id}"
             
-            call_url = f"https://api.twilio.com/2010-04-01/Accounts/{TWILIO_SID}/Calls.json"
+            call_url = f"{TWILIO_API_BASE}/2010-04-01/Accounts/{TWILIO_SID}/Calls.json"
             data = {
                 'To': tech_phone,
                 'From': TWILIO_NUMBER,
-                'Url': webhook_url
+                'Url': webhook_url,
+                # Twilio reports busy / no-answer / completed here so dispatch knows when a call is over
+                'StatusCallback': f"{PUBLIC_BASE_URL}/twilio-call-status"
             }
-            resp = requests.post(call_url, data=data, auth=(TWILIO_SID, TWILIO_TOKEN), timeout=15)
+            if TWILIO_RECORD_CALLS:
+                data.update({'Record': 'true', 'RecordingStatusCallback': f"{PUBLIC_BASE_URL}/twilio-recording",
+                             'RecordingStatusCallbackEvent': 'completed'})
+            resp = http_clients.client('twilio').post(call_url, data=data, auth=(TWILIO_SID, TWILIO_TOKEN))
 
             if resp.status_code not in (200, 201):
                 try:
@@ -169,41 +186,69 @@ class AIAgent:
                 except Exception:
                     events.append(f"Twilio error: {resp.text}")
                     code = None
+                retryable = resp.status_code >= 500 or resp.status_code == 429
                 if code in (21219, 21614, 21215, 21217):
                     return {'final': ("Unable to place the call due to Twilio permissions or an unverified destination number. "
-                                     "Verify the destination number and Voice Geo Permissions in Twilio, then try again."), 'events': events}
-                return {'final': "Unable to reach a technician now. Your urgent ticket is escalated; expect a call within 30 minutes.", 'events': events}
+                                     "Verify the destination number and Voice Geo Permissions in Twilio, then try again."),
+                            'events': events, 'ok': False, 'retryable': False}
+                return {'final': "Unable to reach a technician now. Your urgent ticket is escalated; expect a call within 30 minutes.",
+                        'events': events, 'ok': False, 'retryable': retryable}
 
             call_sid = resp.json().get('sid', '')
             events.append(f"Call initiated successfully (SID: {call_sid})")
             
             return {
                 'final': f"Calling {tech_name} for a real-time conversation. The technician will be asked about appointment availability. This may take up to 2 minutes.",
-                'events': events
+                'events': events, 'ok': True, 'callSid': call_sid
             }
 
+        except CircuitOpenError:
+            # Telephony is failing fast; don't tie up a worker retrying it
+            events.append("Telephony provider degraded; call not attempted.")
+            return {'final': "Our calling system is temporarily degraded. Your urgent ticket has been queued; support will call you within 30 minutes.",
+                    'events': events, 'ok': False, 'retryable': False, 'degraded': True}
         except requests.Timeout:
             events.append("Technician call timed out.")
-            return {'final': "Technician call timed out. Dispatch will retry shortly.", 'events': events}
+            return {'final': "Technician call timed out. Dispatch will retry shortly.", 'events': events, 'ok': False, 'retryable': True}
+        except requests.RequestException as e:
+            events.append(f"Telephony connection error: {str(e)}")
+            return {'final': "Technical error while contacting technician. Your urgent ticket has been logged; support will call you within 30 minutes.",
+                    'events': events, 'ok': False, 'retryable': True}
         except Exception as e:
             events.append(f"Unexpected telephony error: {str(e)}")
-            return {'final': "Technical error while contacting technician. Your urgent ticket has been logged; support will call you within 30 minutes.", 'events': events}
+            return {'final': "Technical error while contacting technician. Your urgent ticket has been logged; support will call you within 30 minutes.",
+                    'events': events, 'ok': False, 'retryable': False}
+
+    def cancel_call(self, call_sid: str) -> bool:
+        """Hang up a placed call, whether it is still ringing or already answered"""
+        url = f"{TWILIO_API_BASE}/2010-04-01/Accounts/{TWILIO_SID}/Calls/{call_sid}.json"
+        try:
+            resp = http_clients.client('twilio').post(url, data={'Status': 'completed'}, auth=(TWILIO_SID, TWILIO_TOKEN))
+        except (CircuitOpenError, requests.RequestException) as e:
+            log.warning(f"[Twilio] Could not cancel call {call_sid}: {e}")
+            return False
+        if resp.status_code != 200:
+            log.warning(f"[Twilio] Cancel of call {call_sid} returned {resp.status_code}: {resp.text[:200]}")
+            return False
+        return True
 
+    @telemetry.traced('process_conversation')
     def process_conversation(self, step, transcript, diag_qns, diag_idx, diag_answers, user_problem, problem_type):
         if step == 'greet':
-            return {'transcript': '', 'agentMessage': 'Hello! Welcome to IT Support. Please describe your problem.',
+            return {'transcript': '', 'agentMessage': self.GREETING,
                     'events': [], 'diagQns': [], 'diagIdx': 0, 'diagAnswers': [],
                     'userProblem': '', 'problemType': '', 'nextStep': 'describe_problem'}
 
         elif step == 'describe_problem':
             if not transcript:
-                return {'transcript': '', 'agentMessage': "I didn't catch that. Please describe your problem again.",
+                return {'transcript': '', 'agentMessage': self.NOT_HEARD,
                         'events': [], 'diagQns': [], 'diagIdx': 0, 'diagAnswers': [],
                         'userProblem': '', 'problemType': '', 'nextStep': 'describe_problem'}
-            problem_type = self.infer_problem_type(transcript)
-            if self._dispatch_intent(transcript) or self.is_urgent(transcript):
+            intent = self.intents.classify(transcript)
+            problem_type = intent.problem_type
+            if intent.dispatch or intent.urgent:
                 tech = self.select_technician(problem_type)
-                tech_name = tech.get('Name','on-call technician') if tech else 'on-call technician'
+                tech_name = tech.name if tech and tech.name else 'on-call technician'
                 return {
                     'transcript': transcript,
                     'agentMessage': f'Calling {tech_name}...',
@@ -219,9 +264,10 @@ class AIAgent:
 
         elif step == 'diagnostic':
             diag_answers.append(transcript)
-            if self._dispatch_intent(transcript) or self.is_urgent(transcript):
+            intent = self.intents.classify(transcript)
+            if intent.dispatch or intent.urgent:
                 tech = self.select_technician(problem_type)
-                tech_name = tech.get('Name','on-call technician') if tech else 'on-call technician'
+                tech_name = tech.name if tech and tech.name else 'on-call technician'
                 return {
                     'transcript': transcript,
                     'agentMessage': f'Calling {tech_name}...',
@@ -235,16 +281,15 @@ class AIAgent:
                 return {'transcript': transcript, 'agentMessage': diag_qns[diag_idx], 'events': [],
                         'diagQns': diag_qns, 'diagIdx': diag_idx, 'diagAnswers': diag_answers,
                         'userProblem': user_problem, 'problemType': problem_type, 'nextStep': 'diagnostic'}
-            return {'transcript': transcript, 'agentMessage': 'Thank you. Is this issue urgent and needs immediate attention?',
+            return {'transcript': transcript, 'agentMessage': self.URGENCY_PROMPT,
                     'events': [], 'diagQns': diag_qns, 'diagIdx': diag_idx, 'diagAnswers': diag_answers,
                     'userProblem': user_problem, 'problemType': problem_type, 'nextStep': 'urgency'}
 
         elif step == 'urgency':
-            t = (transcript or '').lower()
-            yes_tokens = ['yes','y','yeah','yep','ok','okay','sure','please do','go ahead','confirm']
-            if self._dispatch_intent(transcript) or self.is_urgent(transcript) or any(re.search(rf'\b{re.escape(y)}\b', t) for y in yes_tokens):
+            intent = self.intents.classify(transcript)
+            if intent.dispatch or intent.urgent or intent.affirmative:
                 tech = self.select_technician(problem_type)
-                tech_name = tech.get('Name','on-call technician') if tech else 'on-call technician'
+                tech_name = tech.name if tech and tech.name else 'on-call technician'
                 return {
                     'transcript': transcript,
                     'agentMessage': f'Calling {tech_name}...',
@@ -254,18 +299,24 @@ class AIAgent:
                     'nextStep': 'calling'
                 }
             else:
-                return {'transcript': transcript, 'agentMessage': 'No problem. A support ticket has been created. Our team will reach out within 24 hours.',
+                ticket_id = self.tickets.create(problem_type, user_problem, diag_answers,
+                                                [user_problem, *diag_answers, transcript], urgent=False)
+                return {'transcript': transcript, 'agentMessage': self.TICKET_CREATED, 'ticketId': ticket_id,
                         'events': [], 'diagQns': diag_qns, 'diagIdx': diag_idx, 'diagAnswers': diag_answers,
                         'userProblem': user_problem, 'problemType': problem_type, 'nextStep': 'complete'}
 
         elif step == 'calling':
-            tech = self.select_technician(problem_type)
-            result = self.call_technician(tech, user_problem, diag_answers)
-            return {'transcript': transcript, 'agentMessage': result.get('final',''), 'events': result.get('events', []),
+            # The call is placed by a dispatch worker; the client follows it via /dispatch/<jobId>
+            # The ticket is written first; the dispatcher moves it on when the job finishes
+            ticket_id = self.tickets.create(problem_type, user_problem, diag_answers, [user_problem, *diag_answers],
+                                            urgent=True, status=tickets.DISPATCHING)
+            job = self.dispatcher.submit(problem_type, user_problem, diag_answers, ticket_id=ticket_id)
+            return {'transcript': transcript, 'agentMessage': self.DISPATCH_STARTED,
+                    'events': list(job.events), 'dispatchJob': job.id, 'ticketId': ticket_id,
                     'diagQns': diag_qns, 'diagIdx': diag_idx, 'diagAnswers': diag_answers,
                     'userProblem': user_problem, 'problemType': problem_type, 'nextStep': 'complete'}
 
         else:
-            return {'transcript': transcript, 'agentMessage': 'This conversation is complete. Please refresh to start a new session.',
+            return {'transcript': transcript, 'agentMessage': self.SESSION_COMPLETE,
                     'events': [], 'diagQns': diag_qns, 'diagIdx': diag_idx, 'diagAnswers': diag_answers,
                     'userProblem': user_problem, 'problemType': problem_type, 'nextStep': 'complete'}
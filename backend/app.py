@@ -1,299 +1,553 @@
 import os
-import tempfile
+import json
 import base64
-import subprocess
-import requests
 import time
-from flask import Flask, request, jsonify, send_file, Response
+import threading
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context, g
 from flask_cors import CORS
-from ai_agent import AIAgent
+from werkzeug.exceptions import HTTPException
 from dotenv import load_dotenv
-from twilio.twiml.voice_response import VoiceResponse
 
 load_dotenv()
 
+from ai_agent import AIAgent
+import audio_decode
+from streaming import StreamRegistry
+import tts
+import tts_cache
+from tts import TTSError
+import http_clients
+from http_clients import CircuitOpenError
+import call_context
+import ivr
+import sessions
+import recordings
+import tickets
+from recordings import IngestBusy
+from sessions import SessionError, SessionConflict
+import telemetry
+
+log = telemetry.get_logger('app')
+
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', str(16 * 1024 * 1024)))
+
 app = Flask(__name__)
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
 CORS(app)
 agent = AIAgent()
 
-ELEVENLABS_API_KEY = os.getenv('ELEVENLABS_API_KEY')
-ELEVENLABS_VOICE_ID = os.getenv('ELEVENLABS_VOICE_ID')
+TTS_PREWARM = os.getenv('TTS_PREWARM', '1') != '0'
+# background: models load on a thread after import; /ready answers 503 until they have.
+# preload: they load during import, for gunicorn's preload_app, so the forked workers share
+# the model memory copy-on-write (gunicorn.conf.py then calls start_background() per worker).
+WARM_UP = os.getenv('WARM_UP', 'background').lower()
 TWILIO_SID = os.getenv('TWILIO_SID', 'ACff9ab56f6046298714a4b29773ccf932')
 TWILIO_TOKEN = os.getenv('TWILIO_TOKEN', '74df57a3673b78e90a87917dc2336fa1')
 
-# Store conversation context per call (use Redis/DB in production)
-call_contexts = {}
+streams = StreamRegistry(lambda: agent.asr)
+synthesizer = tts.create_synthesizer()
+tts_audio = tts_cache.TTSCache(ext=synthesizer.ext)
+
+# Per-call IVR state; CALL_CONTEXT_BACKEND=sqlite shares it between workers
+call_contexts = call_context.create_store()
+conversation_sessions = sessions.create_store()
+recording_ingest = recordings.RecordingIngestor(agent, auth=(TWILIO_SID, TWILIO_TOKEN))
 
-def save_base64_audio_to_temp(data_url: str) -> str:
+# State the client used to round-trip on every turn; session turns keep it server-side
+SESSION_FIELDS = ('diagQns', 'diagIdx', 'diagAnswers', 'userProblem', 'problemType')
+
+def decode_data_url(data_url: str) -> tuple[bytes, str]:
     if not data_url:
-        return ""
+        return b'', ''
     header, b64 = ("", data_url)
     if "," in data_url:
         header, b64 = data_url.split(",", 1)
-    audio_bytes = base64.b64decode(b64)
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.webm') as tmp:
-        tmp.write(audio_bytes)
-        webm_path = tmp.name
-    wav_path = webm_path.replace('.webm', '.wav')
+    mime = header[5:].split(";", 1)[0] if header.startswith("data:") else ""
+    return base64.b64decode(b64), mime
+
+def read_conversation_request() -> tuple[dict, bytes, str]:
+    """Turn metadata, audio bytes and their MIME type from any of the accepted request shapes:
+
+    - JSON with an audioBase64 data URL (original clients)
+    - multipart/form-data with an `audio` file and a `metadata` JSON field
+    - a raw audio body (audio/* or application/octet-stream) with sessionId/version/step
+      in the query string or X-Session-Id / X-Session-Version / X-Conversation-Step headers
+    """
+    mimetype = request.mimetype
+    if mimetype == 'multipart/form-data':
+        data = json.loads(request.form.get('metadata') or '{}')
+        upload = request.files.get('audio')
+        if not upload:
+            return data, b'', ''
+        return data, upload.read(), upload.mimetype
+    if is_raw_audio(mimetype):
+        data, mime = raw_upload_metadata(mimetype, request.args, request.headers)
+        return data, request.get_data(cache=False), mime
+    data = request.get_json(force=True) or {}
+    audio, mime = decode_data_url(data.get('audioBase64', ''))
+    return data, audio, mime
+
+def is_raw_audio(mimetype: str) -> bool:
+    return mimetype == 'application/octet-stream' or mimetype.startswith('audio/')
+
+def raw_upload_metadata(mimetype: str, args, headers) -> tuple[dict, str]:
+    data = {
+        'sessionId': args.get('sessionId') or headers.get('X-Session-Id'),
+        'version': args.get('version') or headers.get('X-Session-Version'),
+        'step': args.get('step') or headers.get('X-Conversation-Step') or 'greet',
+    }
+    mime = args.get('mime') or ('' if mimetype == 'application/octet-stream' else mimetype)
+    return data, mime
+
+def conversation_params(data: dict) -> dict:
+    return {
+        'step': data.get('step', 'greet'),
+        'diag_qns': data.get('diagQns', []),
+        'diag_idx': data.get('diagIdx', 0),
+        'diag_answers': data.get('diagAnswers', []),
+        'user_problem': data.get('userProblem', ''),
+        'problem_type': data.get('problemType', ''),
+    }
+
+def session_state(resp: dict) -> dict:
+    """The next turn's conversation_params, as kept in the session store"""
+    return {
+        'step': resp.get('nextStep', 'complete'),
+        'diag_qns': resp.get('diagQns', []),
+        'diag_idx': resp.get('diagIdx', 0),
+        'diag_answers': resp.get('diagAnswers', []),
+        'user_problem': resp.get('userProblem', ''),
+        'problem_type': resp.get('problemType', ''),
+    }
+
+def claim_session(data: dict):
+    """Claim a session turn; returns (params, None) or (None, (error body, status))"""
     try:
-        ffmpeg_binary = os.path.join(os.path.dirname(__file__), "ffmpeg.exe")
-        result = subprocess.run(
-            [ffmpeg_binary, '-i', webm_path, '-ar', '16000', '-ac', '1', '-y', wav_path],
-            capture_output=True,
-            timeout=10
-        )
-        if result.returncode == 0 and os.path.exists(wav_path):
-            print(f"[Converted] {wav_path}")
-            try:
-                os.unlink(webm_path)
-            except Exception:
-                pass
-            return wav_path
-        else:
-            print("[Conversion] FFmpeg failed, using webm directly")
-            print(result.stderr.decode())
-            return webm_path
-    except Exception as e:
-        print(f"[Conversion Error] {e}")
-        return webm_path
+        version = int(data.get('version'))
+    except (TypeError, ValueError):
+        return None, ({'error': 'version is required with sessionId'}, 400)
+    try:
+        params, version = conversation_sessions.claim(str(data['sessionId']), version)
+    except SessionConflict as e:
+        return None, ({'error': str(e), 'version': e.version}, 409)
+    except SessionError as e:
+        return None, ({'error': str(e)}, e.status_code)
+    params['session'] = (str(data['sessionId']), version)
+    return params, None
+
+def run_conversation_step(params: dict, transcript: str) -> dict:
+    resp = agent.process_conversation(
+        params['step'], transcript, params['diag_qns'], params['diag_idx'],
+        params['diag_answers'], params['user_problem'], params['problem_type']
+    )
+    session = params.get('session')
+    if session:
+        conversation_sessions.save(*session, session_state(resp))
+        resp = {k: v for k, v in resp.items() if k not in SESSION_FIELDS}
+        resp.update(sessionId=session[0], version=session[1])
+    elif params['step'] == 'greet':
+        # Legacy clients ignore the id and keep sending full state
+        session_id, version = conversation_sessions.create(session_state(resp))
+        resp.update(sessionId=session_id, version=version)
+    return resp
+
+def backend_error(e: Exception) -> dict:
+    return {
+        'transcript': '',
+        'agentMessage': f'Backend error: {str(e)}',
+        'events': [],
+        'diagQns': [], 'diagIdx': 0, 'diagAnswers': [],
+        'userProblem': '', 'problemType': '', 'nextStep': 'complete'
+    }
 
 def transcribe_recording(recording_url):
-    """Download and transcribe a Twilio recording"""
+    """Download and transcribe a Twilio recording in the calling thread"""
     try:
-        audio_response = requests.get(recording_url, auth=(TWILIO_SID, TWILIO_TOKEN), timeout=10)
-        if audio_response.status_code != 200:
-            return "unknown"
-        
-        tmp_path = tempfile.mktemp(suffix='.wav')
-        with open(tmp_path, 'wb') as f:
-            f.write(audio_response.content)
-        
-        transcript = agent.transcribe_audio(tmp_path)
-        
-        try:
-            os.unlink(tmp_path)
-        except:
-            pass
-        
+        transcript = recording_ingest.transcribe_url(recording_url)
         return transcript if transcript else "unknown"
     except Exception as e:
-        print(f"[Transcription error] {e}")
+        log.error(f"[Transcription error] {e}")
         return "unknown"
 
-@app.route('/conversation', methods=['POST'])
-def conversation():
+def recording_callback(values) -> tuple[dict, int]:
+    """Twilio recordingStatusCallback: queue completed recordings for transcription"""
+    call_sid, recording_sid = values.get('CallSid', ''), values.get('RecordingSid', '')
+    url = values.get('RecordingUrl', '')
+    if values.get('RecordingStatus', 'completed') != 'completed':
+        return {'status': 'ignored'}, 200
+    if not (call_sid and recording_sid and url):
+        return {'error': 'CallSid, RecordingSid and RecordingUrl are required'}, 400
     try:
-        data = request.get_json(force=True) or {}
-        audio_base64 = data.get('audioBase64', '')
-        step = data.get('step', 'greet')
-        diag_qns = data.get('diagQns', [])
-        diag_idx = data.get('diagIdx', 0)
-        diag_answers = data.get('diagAnswers', [])
-        user_problem = data.get('userProblem', '')
-        problem_type = data.get('problemType', '')
+        job = recording_ingest.submit(call_sid, recording_sid, url)
+    except IngestBusy as e:
+        # A non-2xx makes Twilio retry the callback later
+        return {'error': str(e)}, 503
+    return job.to_dict(), 202
+
+def call_recordings(call_sid: str) -> tuple[dict, int]:
+    jobs = recording_ingest.for_call(call_sid)
+    if not jobs:
+        return {'error': 'No recordings for this call'}, 404
+    return {'callSid': call_sid, 'recordings': [j.to_dict() for j in jobs]}, 200
+
+def ticket_query(values) -> tuple[dict, int]:
+    """Tickets filtered by problemType and/or status, newest first; page with `before`"""
+    status = values.get('status') or None
+    if status and status not in tickets.STATUSES:
+        return {'error': f"Unknown ticket status; expected one of {', '.join(tickets.STATUSES)}"}, 400
+    try:
+        limit = int(values.get('limit', 50))
+        before = float(values['before']) if values.get('before') else None
+    except ValueError:
+        return {'error': 'limit and before must be numbers'}, 400
+    found = agent.tickets.query(values.get('problemType') or None, status, limit, before)
+    return {'tickets': found, 'before': found[-1]['created'] if found else None}, 200
+
+def ticket_detail(ticket_id: str) -> tuple[dict, int]:
+    ticket = agent.tickets.get(ticket_id)
+    if not ticket:
+        return {'error': 'Unknown ticket'}, 404
+    return ticket, 200
+
+def conversation_turn(data: dict, audio: bytes, mime: str) -> tuple[dict, int]:
+    """Decode, transcribe and advance one turn; shared by the Flask and async servers"""
+    try:
+        if data.get('sessionId'):
+            params, error = claim_session(data)
+            if error:
+                return error
+        else:
+            params = conversation_params(data)
+        step = params['step']
         transcript = ''
-        tmp_path = ""
         try:
-            if audio_base64 and step != 'greet':
-                tmp_path = save_base64_audio_to_temp(audio_base64)
-                transcript = agent.transcribe_audio(tmp_path)
-                print(f"[Transcript] {transcript}")
+            if audio and step != 'greet':
+                with telemetry.span('decode'):
+                    pcm = audio_decode.decode_audio(audio, mime)
+                transcript = agent.transcribe_audio(pcm)
+                log.info(f"[Transcript] {transcript}")
         except Exception as e:
-            print(f"[Transcription Error] {e}")
+            log.error(f"[Transcription Error] {e}")
             transcript = ''
-        finally:
-            if tmp_path and os.path.exists(tmp_path):
-                try:
-                    os.unlink(tmp_path)
-                except Exception:
-                    pass
-
-        resp = agent.process_conversation(
-            step, transcript, diag_qns, diag_idx, diag_answers, user_problem, problem_type
-        )
-        return jsonify(resp), 200
 
+        return run_conversation_step(params, transcript), 200
+    except Exception as e:
+        log.error(f"[Error] {e}")
+        return backend_error(e), 200
+
+def open_stream(data: dict) -> tuple[dict, int]:
+    if data.get('sessionId'):
+        # The turn is claimed when the stream finishes, so an abandoned stream doesn't use it up
+        try:
+            params = {'sessionId': str(data['sessionId']), 'version': int(data.get('version'))}
+        except (TypeError, ValueError):
+            return {'error': 'version is required with sessionId'}, 400
+    else:
+        params = conversation_params(data)
+    session = streams.open(params)
+    return {'streamId': session.id, 'sampleRate': audio_decode.SAMPLE_RATE}, 200
+
+def finish_stream(session) -> tuple[dict, int]:
+    try:
+        params = session.params
+        if params.get('sessionId'):
+            params, error = claim_session(params)
+            if error:
+                return error
+        try:
+            with telemetry.span('stream_finish'):
+                transcript = session.finish(agent.vad)
+            log.info(f"[Transcript] {transcript}")
+        except Exception as e:
+            log.error(f"[Transcription Error] {e}")
+            transcript = ''
+        return run_conversation_step(params, transcript), 200
+    except Exception as e:
+        log.error(f"[Error] {e}")
+        return backend_error(e), 200
+
+@app.route('/conversation', methods=['POST'])
+def conversation():
+    try:
+        data, audio, mime = read_conversation_request()
+    except HTTPException:
+        raise
+    except Exception as e:
+        log.error(f"[Error] {e}")
+        return jsonify(backend_error(e)), 200
+    body, status = conversation_turn(data, audio, mime)
+    return jsonify(body), status
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    return jsonify({'error': f'Upload exceeds {MAX_UPLOAD_BYTES} bytes'}), 413
+
+@app.route('/conversation/stream', methods=['POST'])
+def conversation_stream_start():
+    """Open a streaming utterance; audio follows as raw 16-bit PCM frames"""
+    body, status = open_stream(request.get_json(force=True, silent=True) or {})
+    return jsonify(body), status
+
+@app.route('/conversation/stream/<stream_id>/audio', methods=['POST'])
+def conversation_stream_audio(stream_id):
+    session = streams.get(stream_id)
+    if not session:
+        return jsonify({'error': 'Unknown or expired stream'}), 404
+    rate = request.args.get('rate', audio_decode.SAMPLE_RATE, type=int)
+    try:
+        partial = session.feed(request.get_data(cache=False), rate)
     except Exception as e:
-        print(f"[Error] {e}")
-        return jsonify({
-            'transcript': '',
-            'agentMessage': f'Backend error: {str(e)}',
-            'events': [],
-            'diagQns': [], 'diagIdx': 0, 'diagAnswers': [],
-            'userProblem': '', 'problemType': '', 'nextStep': 'complete'
-        }), 200
+        log.error(f"[Stream Error] {e}")
+        return jsonify({'error': str(e)}), 500
+    return jsonify({'partial': partial}), 200
+
+@app.route('/conversation/stream/<stream_id>/end', methods=['POST'])
+def conversation_stream_end(stream_id):
+    session = streams.close(stream_id)
+    if not session:
+        return jsonify({'error': 'Unknown or expired stream'}), 404
+    body, status = finish_stream(session)
+    return jsonify(body), status
+
+@app.before_request
+def begin_trace():
+    g.trace = telemetry.start_trace(request.url_rule.rule if request.url_rule else 'unmatched',
+                                    method=request.method)
+
+@app.after_request
+def note_status(response):
+    g.status = response.status_code
+    return response
+
+@app.teardown_request
+def finish_trace(exc):
+    # Runs after a streamed body is fully sent, so /tts misses include the relay
+    trace = g.pop('trace', None)
+    if trace is not None:
+        telemetry.end_trace(trace, 500 if exc else g.get('status', 500))
+
+def metrics_snapshot() -> dict:
+    return {
+        **telemetry.snapshot(),
+        'caches': {'tts': tts_audio.stats(), 'intent': agent.intents.cache_stats()},
+        'asr': agent.asr_stats(),
+        'recordings': recording_ingest.stats(),
+        'upstreams': http_clients.upstream_stats(),
+        'tickets': agent.tickets.stats(),
+    }
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return jsonify(metrics_snapshot()), 200
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    body, status = readiness()
+    return jsonify(body), status
+
+@app.route('/upstreams', methods=['GET'])
+def upstreams():
+    return jsonify(http_clients.upstream_stats()), 200
+
+@app.route('/twilio-recording', methods=['POST'])
+def twilio_recording():
+    body, status = recording_callback(request.values)
+    return jsonify(body), status
+
+@app.route('/recordings/<call_sid>', methods=['GET'])
+def recordings_for_call(call_sid):
+    body, status = call_recordings(call_sid)
+    return jsonify(body), status
+
+@app.route('/asr/stats', methods=['GET'])
+def asr_stats():
+    return jsonify(agent.asr_stats()), 200
+
+@app.route('/dispatch/<job_id>', methods=['GET'])
+def dispatch_status(job_id):
+    job = agent.dispatcher.get(job_id)
+    if not job:
+        return jsonify({'error': 'Unknown dispatch job'}), 404
+    return jsonify(job.to_dict()), 200
+
+@app.route('/tickets', methods=['GET'])
+def list_tickets():
+    body, status = ticket_query(request.args)
+    return jsonify(body), status
+
+@app.route('/tickets/backlog', methods=['GET'])
+def ticket_backlog():
+    return jsonify(agent.tickets.counts()), 200
+
+@app.route('/tickets/<ticket_id>', methods=['GET'])
+def ticket(ticket_id):
+    body, status = ticket_detail(ticket_id)
+    return jsonify(body), status
+
+@app.route('/twilio-call-status', methods=['POST'])
+def twilio_call_status():
+    """Twilio StatusCallback for technician calls"""
+    agent.dispatcher.call_status(request.values.get('CallSid', ''), request.values.get('CallStatus', ''))
+    return '', 204
 
 @app.route('/twilio-ivr', methods=['POST', 'GET'])
 def twilio_ivr():
     """Simple IVR using Gather instead of Record for reliability"""
-    call_sid = request.values.get('CallSid', 'unknown')
-    step = request.values.get('step', 'greet')
-    speech_result = request.values.get('SpeechResult', '')
-    user_problem = request.values.get('problem', 'a technical issue')
-    
-    print(f"[IVR] CallSid: {call_sid}, Step: {step}, Speech: {speech_result}, Problem: {user_problem}")
-    
-    response = VoiceResponse()
-    
+    twiml = ivr_twiml(
+        request.values.get('CallSid', 'unknown'),
+        request.values.get('step', 'greet'),
+        request.values.get('SpeechResult', ''),
+        request.values.get('problem', 'a technical issue'),
+        request.values.get('ticket', ''),
+    )
+    return Response(twiml, mimetype='text/xml')
+
+@telemetry.traced('ivr_twiml')
+def ivr_twiml(call_sid: str, step: str, speech_result: str, user_problem: str, ticket_id: str = '') -> str:
+    log.info(f"[IVR] CallSid: {call_sid}, Step: {step}, Speech: {speech_result}, Problem: {user_problem}")
+
     # Initialize context
-    if call_sid not in call_contexts:
-        call_contexts[call_sid] = {
-            'user_problem': user_problem,
-            'tech_name': '',
-            'appointment_time': '',
-            'confirmed': False
-        }
-    
-    ctx = call_contexts[call_sid]
-    
+    ctx = call_contexts.setdefault(call_sid, {
+        'user_problem': user_problem,
+        'tech_name': '',
+        'appointment_time': '',
+        'confirmed': False,
+        'ticket_id': ticket_id  # only the greet webhook carries it
+    })
+
     if step == 'greet':
-        print("[IVR] Greeting step")
-        response.say(
-            "Hello, this is the AI support agent from IT Support. May I know who I am speaking with?",
-            voice='Polly.Joanna',
-            language='en-US'
-        )
-        
-        gather = response.gather(
-            input='speech',
-            timeout=5,
-            speech_timeout='auto',
-            action=f'/twilio-ivr?step=got_name&problem={requests.utils.quote(user_problem)}',
-            method='POST'
-        )
-        
-        # If no input, repeat
-        response.say("I didn't hear anything. Please try again.", voice='Polly.Joanna')
-        response.redirect(f'/twilio-ivr?step=greet&problem={requests.utils.quote(user_problem)}')
-    
+        log.info("[IVR] Greeting step")
+        twiml = ivr.render('greet', problem=user_problem)
+
     elif step == 'got_name':
-        print(f"[IVR] Got name: {speech_result}")
-        ctx['tech_name'] = speech_result if speech_result else "technician"
-        
-        response.say(
-            f"Thank you, {ctx['tech_name']}. The user reported: {ctx['user_problem']}. This is urgent.",
-            voice='Polly.Joanna',
-            language='en-US'
-        )
-        response.pause(length=1)
-        response.say(
-            "What is the earliest time you can visit or call the user?",
-            voice='Polly.Joanna',
-            language='en-US'
-        )
-        
-        gather = response.gather(
-            input='speech',
-            timeout=5,
-            speech_timeout='auto',
-            action=f'/twilio-ivr?step=got_time&problem={requests.utils.quote(user_problem)}',
-            method='POST'
-        )
-        
-        response.say("I didn't hear a time. Let me try again.", voice='Polly.Joanna')
-        response.redirect(f'/twilio-ivr?step=got_name&problem={requests.utils.quote(user_problem)}')
-    
+        log.info(f"[IVR] Got name: {speech_result}")
+        ctx = call_contexts.update(call_sid, tech_name=speech_result if speech_result else "technician")
+        twiml = ivr.render('got_name', problem=user_problem, tech_name=ctx['tech_name'],
+                           user_problem=ctx['user_problem'])
+
     elif step == 'got_time':
-        print(f"[IVR] Got time: {speech_result}")
-        ctx['appointment_time'] = speech_result if speech_result else "your earliest convenience"
-        
-        response.say(
-            f"Great. So you can visit at {ctx['appointment_time']}.",
-            voice='Polly.Joanna',
-            language='en-US'
-        )
-        response.pause(length=1)
-        response.say(
-            "Please say yes to confirm, or no if you cannot make it.",
-            voice='Polly.Joanna',
-            language='en-US'
-        )
-        
-        gather = response.gather(
-            input='speech',
-            timeout=5,
-            speech_timeout='auto',
-            action=f'/twilio-ivr?step=confirmation&problem={requests.utils.quote(user_problem)}',
-            method='POST'
-        )
-        
-        response.say("I didn't hear a response.", voice='Polly.Joanna')
-        response.redirect(f'/twilio-ivr?step=got_time&problem={requests.utils.quote(user_problem)}')
-    
+        log.info(f"[IVR] Got time: {speech_result}")
+        ctx = call_contexts.update(call_sid, appointment_time=speech_result if speech_result else "your earliest convenience")
+        twiml = ivr.render('got_time', problem=user_problem, appointment_time=ctx['appointment_time'])
+
     elif step == 'confirmation':
-        print(f"[IVR] Confirmation: {speech_result}")
+        log.info(f"[IVR] Confirmation: {speech_result}")
         confirmation = speech_result.lower() if speech_result else ""
-        ctx['confirmed'] = 'yes' in confirmation or 'confirm' in confirmation or 'sure' in confirmation or 'okay' in confirmation
-        
-        if ctx['confirmed']:
-            response.say(
-                f"Perfect! Appointment confirmed for {ctx['appointment_time']}. The user will be notified. Thank you!",
-                voice='Polly.Joanna',
-                language='en-US'
-            )
+        confirmed = 'yes' in confirmation or 'confirm' in confirmation or 'sure' in confirmation or 'okay' in confirmation
+        ctx = call_contexts.update(call_sid, confirmed=confirmed)
+        # With several technicians dialed at once only the first yes takes the ticket
+        if ctx['confirmed'] and agent.dispatcher.confirm(call_sid, ctx['appointment_time'], ctx.get('ticket_id', '')):
+            twiml = ivr.render('confirmed', appointment_time=ctx['appointment_time'])
+        elif ctx['confirmed']:
+            twiml = ivr.render('taken')
         else:
-            response.say(
-                "Understood. We will find another technician. Thank you for your time.",
-                voice='Polly.Joanna',
-                language='en-US'
-            )
-        
-        response.hangup()
-        
-        # Clean up
-        if call_sid in call_contexts:
-            del call_contexts[call_sid]
-    
+            agent.dispatcher.decline(call_sid)
+            twiml = ivr.render('declined')
+
+        # Clean up; calls that drop before this step expire after CALL_CONTEXT_TTL
+        call_contexts.pop(call_sid)
+
     else:
-        print(f"[IVR] Unknown step: {step}")
-        response.say(
-            "This is IT Support. We will contact you shortly. Thank you.",
-            voice='Polly.Joanna',
-            language='en-US'
-        )
-        response.hangup()
-    
-    print(f"[IVR] Response: {str(response)[:200]}")
-    return Response(str(response), mimetype='text/xml')
+        log.info(f"[IVR] Unknown step: {step}")
+        twiml = ivr.render('unknown')
+
+    log.info(f"[IVR] Response: {twiml[:200]}")
+    return twiml
+
+
+warmed_up = threading.Event()
+warm_up_ms = None
 
+def warm_up():
+    """Load what the first request would otherwise wait for: ASR model, VAD, technicians,
+    IVR templates and the audio decoders"""
+    global warm_up_ms
+    start = time.perf_counter()
+    with telemetry.span('warm_up'):
+        agent.warm_up()
+        ivr.compile_templates()
+        audio_decode.load_decoders()
+    warm_up_ms = round((time.perf_counter() - start) * 1000, 1)
+    warmed_up.set()
+    log.info(f"[Startup] Warm-up finished in {warm_up_ms:.0f}ms")
+
+def start_background():
+    """Per-process helpers, started after fork: they hold threads and child processes"""
+    # Containers that need ffmpeg get a pre-spawned decoder instead of a fork per request
+    if not audio_decode.AV_AVAILABLE and audio_decode.ffmpeg_decoder.available():
+        audio_decode.ffmpeg_decoder.warm()
+    if TTS_PREWARM and synthesizer.available():
+        threading.Thread(target=prewarm_tts, daemon=True).start()
+
+def readiness() -> tuple[dict, int]:
+    if not warmed_up.is_set():
+        return {'ready': False}, 503
+    return {'ready': True, 'warmUpMs': warm_up_ms, 'pid': os.getpid()}, 200
+
+def warm_up_in_background():
+    try:
+        warm_up()
+    except Exception as e:
+        log.error(f"[Startup] Warm-up failed; not ready: {e}")
+        return
+    start_background()
+
+def prewarm_tts():
+    """Synthesize every static agent prompt ahead of the first caller"""
+    prompts = agent.static_prompts()
+    fetched = 0
+    for text in prompts:
+        key = synthesizer.cache_key(text)
+        if tts_audio.contains(key):
+            continue
+        try:
+            tts_audio.put(key, synthesizer.synthesize(text))
+            fetched += 1
+        except Exception as e:
+            log.warning(f"[TTS Prewarm] Stopped after {fetched} clips: {e}")
+            return
+    log.info(f"[TTS Prewarm] {len(prompts)} prompts cached ({fetched} synthesized)")
 
 @app.route('/tts', methods=['POST'])
 def tts():
     try:
         text = request.json.get('text', '')
-        print("TTS received text:", text)
+        log.info(f"[TTS] Received text: {text}")
         if not text:
             return jsonify({'error': 'No text provided'}), 400
-        if not ELEVENLABS_API_KEY or not ELEVENLABS_VOICE_ID:
+        key = synthesizer.cache_key(text)
+        data, path = tts_audio.get(key)
+        if data is not None:
+            resp = Response(data, mimetype=synthesizer.mimetype)
+            resp.headers['X-TTS-Cache'] = 'memory'
+            return resp
+        if path:
+            # send_file hands the open file to the server's file wrapper (sendfile where supported)
+            resp = send_file(path, mimetype=synthesizer.mimetype, as_attachment=False,
+                             download_name="speech" + synthesizer.ext, conditional=True)
+            resp.headers['X-TTS-Cache'] = 'disk'
+            return resp
+        if not synthesizer.available():
             return jsonify({'error': 'ELEVENLABS API keys not set'}), 500
-        url = f"https://api.elevenlabs.io/v1/text-to-speech/{ELEVENLABS_VOICE_ID}"
-        headers = {
-            "xi-api-key": ELEVENLABS_API_KEY,
-            "Content-Type": "application/json",
-            "Accept": "audio/mpeg"
-        }
-        payload = {
-            "text": text,
-            "model_id": "eleven_monolingual_v1",
-            "voice_settings": {
-                "stability": 0.5,
-                "similarity_boost": 0.75
-            }
-        }
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
-        print("ElevenLabs status:", response.status_code)
-        if response.status_code != 200:
-            print("ElevenLabs error:", response.text)
-            return jsonify({'error': f'ElevenLabs API error: {response.text}'}), response.status_code
-
-        with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as tmp:
-            tmp.write(response.content)
-            tmp_path = tmp.name
-
-        return send_file(tmp_path, mimetype="audio/mpeg", as_attachment=False, download_name="speech.mp3")
+        try:
+            chunks = synthesizer.stream(text)
+        except TTSError as e:
+            return jsonify({'error': e.message}), e.status_code
+        except CircuitOpenError:
+            return jsonify({'error': 'Speech synthesis temporarily unavailable'}), 503
+        # Relay audio as it arrives so playback can start on the first chunk
+        resp = Response(stream_with_context(tts_audio.tee(key, chunks)),
+                        mimetype=synthesizer.mimetype, direct_passthrough=True)
+        resp.headers['X-TTS-Cache'] = 'miss'
+        return resp
     except Exception as e:
-        print(f"[TTS Error] {e}")
+        log.error(f"[TTS Error] {e}")
         return jsonify({'error': str(e)}), 500
 
+if WARM_UP == 'preload':
+    warm_up()
+else:
+    threading.Thread(target=warm_up_in_background, name='warm-up', daemon=True).start()
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
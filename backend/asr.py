@@ -0,0 +1,432 @@
+import os
+import json
+import time
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+
+from audio_decode import decode_file
+import telemetry
+
+log = telemetry.get_logger('asr')
+
+SAMPLE_RATE = 16000
+
+ASR_BACKEND = os.getenv('ASR_BACKEND', 'vosk').lower()
+ASR_FALLBACK = os.getenv('ASR_FALLBACK', 'google').lower()
+ASR_POOL_SIZE = int(os.getenv('ASR_POOL_SIZE') or 0) or (os.cpu_count() or 1)
+VOSK_MODEL_PATH = os.getenv('VOSK_MODEL_PATH') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vosk-model-small-en-us-0.15')
+WHISPER_MODEL = os.getenv('WHISPER_MODEL', 'base.en')
+WHISPER_COMPUTE_TYPE = os.getenv('WHISPER_COMPUTE_TYPE', 'int8')
+# Alternate Google Speech endpoint (e.g. the benchmark fake); needs SpeechRecognition 3.11+
+GOOGLE_SPEECH_ENDPOINT = os.getenv('GOOGLE_SPEECH_ENDPOINT', '')
+# Micro-batching for engines with batched inference (Whisper); off by default, see bench_asr_batch.py.
+# Larger batches / longer waits trade latency for throughput where the hardware rewards batching
+ASR_BATCH_MAX = int(os.getenv('ASR_BATCH_MAX') or 1)
+ASR_BATCH_WAIT_MS = float(os.getenv('ASR_BATCH_WAIT_MS', '20'))
+ASR_BATCH_CONCURRENCY = int(os.getenv('ASR_BATCH_CONCURRENCY', '2'))
+
+
+def read_audio_file(path: str) -> np.ndarray:
+    """Read an audio file as 16 kHz mono int16 PCM"""
+    return decode_file(path)
+
+
+class RecognizerPool:
+    """Fixed set of warm recognizers handed out one request at a time"""
+
+    def __init__(self, factory, size: int):
+        self.size = max(1, size)
+        self._idle = queue.Queue()
+        for _ in range(self.size):
+            self._idle.put(factory())
+
+    @contextmanager
+    def acquire(self):
+        rec = self._idle.get()
+        try:
+            yield rec
+        finally:
+            self._idle.put(rec)
+
+
+class StreamRecognizer:
+    """Incremental recognition of one utterance; the default buffers and transcribes at the end"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._chunks = []
+
+    def accept(self, pcm: np.ndarray) -> str:
+        """Feed more 16 kHz PCM, returns the partial transcript so far"""
+        self._chunks.append(pcm)
+        return ''
+
+    def audio(self) -> np.ndarray:
+        if not self._chunks:
+            return np.zeros(0, dtype=np.int16)
+        return np.concatenate(self._chunks)
+
+    def speech(self, vad=None) -> np.ndarray:
+        """The buffered utterance, trimmed to its speech when a VAD is given"""
+        pcm = self.audio()
+        if vad is None or not len(pcm):
+            return pcm
+        speech = vad.trim(pcm)
+        if not len(speech):
+            log.info(f"[VAD:{vad.name}] No speech in {len(pcm) / SAMPLE_RATE:.1f}s stream; skipping recognition")
+        return speech
+
+    def finish(self, vad=None) -> str:
+        pcm = self.speech(vad)
+        return self.engine.transcribe(pcm) if len(pcm) else ''
+
+
+class ServiceError(Exception):
+    """A hosted recognizer could not be reached or refused the request"""
+
+
+class TranscriptionEngine:
+    name = 'base'
+    # True when transcribe_batch() runs the utterances through the model together; only then
+    # is it worth making callers wait for a batch to fill
+    batched_inference = False
+
+    def transcribe(self, pcm: np.ndarray, sample_rate: int = SAMPLE_RATE) -> str:
+        raise NotImplementedError
+
+    def transcribe_batch(self, pcms: list[np.ndarray]) -> list[str]:
+        """Transcribe several 16 kHz utterances together, results in input order"""
+        return [self.transcribe(pcm) for pcm in pcms]
+
+    def open_stream(self) -> StreamRecognizer:
+        return StreamRecognizer(self)
+
+
+class GoogleEngine(TranscriptionEngine):
+    name = 'google'
+
+    def __init__(self, endpoint: str = GOOGLE_SPEECH_ENDPOINT):
+        import speech_recognition as sr
+        self._sr = sr
+        self.recognizer = sr.Recognizer()
+        self.options = {'endpoint': endpoint} if endpoint else {}
+
+    def transcribe(self, pcm: np.ndarray, sample_rate: int = SAMPLE_RATE) -> str:
+        sr = self._sr
+        audio_data = sr.AudioData(pcm.tobytes(), sample_rate, 2)
+        try:
+            return self.recognizer.recognize_google(audio_data, **self.options)
+        except sr.UnknownValueError:
+            return ''
+        except sr.RequestError as e:
+            raise ServiceError(str(e)) from e
+
+
+class VoskEngine(TranscriptionEngine):
+    name = 'vosk'
+
+    def __init__(self, model_path: str = VOSK_MODEL_PATH, pool_size: int = ASR_POOL_SIZE):
+        import vosk
+        vosk.SetLogLevel(-1)
+        self._vosk = vosk
+        self.model = vosk.Model(model_path)
+        self.pool = RecognizerPool(lambda: vosk.KaldiRecognizer(self.model, SAMPLE_RATE), pool_size)
+
+    def transcribe(self, pcm: np.ndarray, sample_rate: int = SAMPLE_RATE) -> str:
+        if sample_rate != SAMPLE_RATE:
+            raise ValueError(f"Vosk pool expects {SAMPLE_RATE} Hz audio, got {sample_rate}")
+        with self.pool.acquire() as rec:
+            try:
+                rec.AcceptWaveform(pcm.tobytes())
+                result = json.loads(rec.FinalResult())
+            finally:
+                rec.Reset()
+        return result.get('text', '').strip()
+
+    def open_stream(self) -> StreamRecognizer:
+        return VoskStream(self)
+
+
+class VoskStream(StreamRecognizer):
+    """Decodes as audio arrives, so finish() only has the last few frames left to do"""
+
+    def __init__(self, engine: VoskEngine):
+        super().__init__(engine)
+        # Streams live for the whole utterance, so they get their own recognizer rather than a pool slot
+        self.rec = engine._vosk.KaldiRecognizer(engine.model, SAMPLE_RATE)
+        self._segments = []
+
+    def accept(self, pcm: np.ndarray) -> str:
+        super().accept(pcm)
+        if self.rec.AcceptWaveform(pcm.tobytes()):
+            text = json.loads(self.rec.Result()).get('text', '').strip()
+            if text:
+                self._segments.append(text)
+            partial = ''
+        else:
+            partial = json.loads(self.rec.PartialResult()).get('partial', '').strip()
+        return ' '.join(self._segments + ([partial] if partial else []))
+
+    def finish(self, vad=None) -> str:
+        # Already decoded as it arrived, so the VAD can only veto an utterance with no speech in it
+        text = json.loads(self.rec.FinalResult()).get('text', '').strip()
+        if vad is not None and not len(self.speech(vad)):
+            return ''
+        if text:
+            self._segments.append(text)
+        return ' '.join(self._segments)
+
+
+class WhisperEngine(TranscriptionEngine):
+    """faster-whisper. An utterance that fits one 30 s window is decoded greedily in that window;
+    a batch of them is padded to the window, stacked, and encoded and decoded in one model call
+    (what faster-whisper's BatchedInferencePipeline does for the chunks of one long file).
+    Longer utterances go through the model's own long-form transcribe()."""
+    name = 'whisper'
+    batched_inference = True
+
+    def __init__(self, model_name: str = WHISPER_MODEL, pool_size: int = ASR_POOL_SIZE,
+                 max_new_tokens: int | None = None):
+        from faster_whisper import WhisperModel
+        from faster_whisper.tokenizer import Tokenizer
+        from faster_whisper.transcribe import get_suppressed_tokens
+        # One shared model; num_workers lets that many transcriptions run in parallel
+        self.model = WhisperModel(model_name, device='cpu', compute_type=WHISPER_COMPUTE_TYPE,
+                                  cpu_threads=1, num_workers=pool_size)
+        self.pool = RecognizerPool(lambda: self.model, pool_size)
+        self.tokenizer = Tokenizer(self.model.hf_tokenizer, self.model.model.is_multilingual,
+                                   task='transcribe', language='en')
+        self.prompt = self.model.get_prompt(self.tokenizer, [], without_timestamps=True)
+        self.suppress_tokens = get_suppressed_tokens(self.tokenizer, [-1])
+        self.max_length = min(self.model.max_length, len(self.prompt) + max_new_tokens) if max_new_tokens \
+            else self.model.max_length
+        self.window = self.model.feature_extractor.n_samples
+
+    def transcribe(self, pcm: np.ndarray, sample_rate: int = SAMPLE_RATE) -> str:
+        if sample_rate != SAMPLE_RATE:
+            raise ValueError(f"Whisper expects {SAMPLE_RATE} Hz audio, got {sample_rate}")
+        return self.transcribe_batch([pcm])[0]
+
+    def transcribe_batch(self, pcms: list[np.ndarray]) -> list[str]:
+        samples = [pcm.astype(np.float32) / 32768.0 for pcm in pcms]
+        texts = [''] * len(samples)
+        short = [i for i, s in enumerate(samples) if len(s) <= self.window]
+        with self.pool.acquire() as model:
+            if short:
+                for i, text in zip(short, self._decode(model, [samples[i] for i in short])):
+                    texts[i] = text
+            for i in (i for i, s in enumerate(samples) if len(s) > self.window):
+                segments, _ = model.transcribe(samples[i], language='en', beam_size=1, vad_filter=False)
+                texts[i] = ' '.join(s.text.strip() for s in segments).strip()
+        return texts
+
+    def _decode(self, model, samples: list[np.ndarray]) -> list[str]:
+        from faster_whisper.audio import pad_or_trim
+        features = np.stack([pad_or_trim(model.feature_extractor(s)) for s in samples])
+        results = model.model.generate(
+            model.encode(features), [self.prompt] * len(samples), beam_size=1, max_length=self.max_length,
+            suppress_blank=True, suppress_tokens=self.suppress_tokens,
+            return_scores=True, return_no_speech_prob=True,
+        )
+        texts = []
+        for result in results:
+            tokens = result.sequences_ids[0]
+            # Same silence test as faster-whisper: likely no speech, and not confidently decoded
+            avg_logprob = result.scores[0] * len(tokens) / (len(tokens) + 1)
+            if result.no_speech_prob > 0.6 and avg_logprob < -1.0:
+                texts.append('')
+            else:
+                texts.append(self.tokenizer.decode(tokens).strip())
+        return texts
+
+
+ENGINES = {
+    'google': GoogleEngine,
+    'vosk': VoskEngine,
+    'whisper': WhisperEngine,
+}
+
+
+class FallbackEngine(TranscriptionEngine):
+    """Primary local engine with a secondary engine used when it errors"""
+
+    def __init__(self, primary: TranscriptionEngine, fallback: TranscriptionEngine):
+        self.primary = primary
+        self.fallback = fallback
+        self.name = f"{primary.name}+{fallback.name}"
+
+    def transcribe(self, pcm: np.ndarray, sample_rate: int = SAMPLE_RATE) -> str:
+        try:
+            return self.primary.transcribe(pcm, sample_rate)
+        except Exception as e:
+            log.warning(f"[ASR] {self.primary.name} failed ({e}), falling back to {self.fallback.name}")
+            return self.fallback.transcribe(pcm, sample_rate)
+
+    def transcribe_batch(self, pcms: list[np.ndarray]) -> list[str]:
+        try:
+            return self.primary.transcribe_batch(pcms)
+        except Exception as e:
+            log.warning(f"[ASR] {self.primary.name} batch failed ({e}), retrying utterances one by one")
+            return [self.transcribe(pcm) for pcm in pcms]
+
+    def open_stream(self) -> StreamRecognizer:
+        return FallbackStream(self)
+
+
+class FallbackStream(StreamRecognizer):
+    def __init__(self, engine: FallbackEngine):
+        super().__init__(engine)
+        self.inner = engine.primary.open_stream()
+
+    def accept(self, pcm: np.ndarray) -> str:
+        return self.inner.accept(pcm)
+
+    def audio(self) -> np.ndarray:
+        return self.inner.audio()
+
+    def finish(self, vad=None) -> str:
+        try:
+            return self.inner.finish(vad)
+        except Exception as e:
+            log.warning(f"[ASR] {self.engine.primary.name} stream failed ({e}), falling back to {self.engine.fallback.name}")
+            pcm = self.inner.speech(vad)
+            return self.engine.fallback.transcribe(pcm) if len(pcm) else ''
+
+
+class BatchingEngine(TranscriptionEngine):
+    """Gathers concurrent transcribe() calls into micro-batches for a local engine.
+
+    A scheduler thread takes the first waiting utterance, then whatever else arrives within
+    `max_wait_ms` (up to `max_batch`), and hands the batch to the engine's transcribe_batch().
+    At most `concurrency` batches run at once; while they do, new requests pile up and the
+    next batch is larger. Each caller blocks on its own future.
+    """
+
+    def __init__(self, inner: TranscriptionEngine, max_batch: int = ASR_BATCH_MAX,
+                 max_wait_ms: float = ASR_BATCH_WAIT_MS, concurrency: int = ASR_BATCH_CONCURRENCY):
+        self.inner = inner
+        self.name = inner.name
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000.0
+        self.concurrency = max(1, concurrency)
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.utterances = 0
+        self._pid = None
+
+    def _start(self):
+        """Threads are started by the first transcribe() in each process: a model loaded in the
+        gunicorn master before fork is shared by the workers, but its threads are not"""
+        with self._stats_lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._slots = threading.Semaphore(self.concurrency)
+            self._runners = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='asr-batch')
+            threading.Thread(target=self._schedule, name='asr-scheduler', daemon=True).start()
+            self._pid = os.getpid()
+
+    def transcribe(self, pcm: np.ndarray, sample_rate: int = SAMPLE_RATE) -> str:
+        if sample_rate != SAMPLE_RATE:
+            return self.inner.transcribe(pcm, sample_rate)
+        if self._pid != os.getpid():
+            self._start()
+        future = Future()
+        self._queue.put((pcm, future))
+        return future.result()
+
+    def transcribe_batch(self, pcms: list[np.ndarray]) -> list[str]:
+        return self.inner.transcribe_batch(pcms)
+
+    def open_stream(self) -> StreamRecognizer:
+        return self.inner.open_stream()
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {'batches': self.batches, 'utterances': self.utterances, 'queued': self._queue.qsize(),
+                    'meanBatch': self.utterances / self.batches if self.batches else 0.0}
+
+    def _schedule(self):
+        while True:
+            self._slots.acquire()
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            self._runners.submit(self._run, batch)
+
+    def _run(self, batch: list):
+        try:
+            with self._stats_lock:
+                self.batches += 1
+                self.utterances += len(batch)
+            try:
+                texts = self.inner.transcribe_batch([pcm for pcm, _ in batch])
+            except Exception:
+                # Retry individually so one bad utterance doesn't fail its neighbours
+                for pcm, future in batch:
+                    try:
+                        future.set_result(self.inner.transcribe(pcm))
+                    except Exception as e:
+                        future.set_exception(e)
+                return
+            for (_, future), text in zip(batch, texts):
+                future.set_result(text)
+        finally:
+            self._slots.release()
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def create_engine(backend: str = ASR_BACKEND, fallback: str = ASR_FALLBACK) -> TranscriptionEngine:
+    primary = None
+    try:
+        primary = ENGINES[backend]()
+        log.info(f"[ASR] Loaded {backend} engine")
+    except Exception as e:
+        log.warning(f"[ASR] Could not load {backend} engine: {e}")
+    if not fallback or fallback == 'none' or fallback == backend:
+        if primary is None:
+            raise RuntimeError(f"ASR backend '{backend}' unavailable and no fallback configured")
+        return primary
+    try:
+        secondary = ENGINES[fallback]()
+    except Exception as e:  # KeyError for an unknown name, ImportError for a missing package
+        if primary is None:
+            raise RuntimeError(f"ASR backend '{backend}' and fallback '{fallback}' both unavailable") from e
+        log.warning(f"[ASR] Could not load {fallback} fallback engine ({e!r}); using {backend} alone")
+        return primary
+    if primary is None:
+        log.info(f"[ASR] Using {fallback} engine")
+        return secondary
+    return FallbackEngine(primary, secondary)
+
+
+def create_batching_engine(backend: str = ASR_BACKEND, fallback: str = ASR_FALLBACK) -> TranscriptionEngine:
+    """create_engine() behind the micro-batch scheduler when the primary engine batches inference"""
+    engine = create_engine(backend, fallback)
+    local = engine.primary if isinstance(engine, FallbackEngine) else engine
+    if ASR_BATCH_MAX > 1 and local.batched_inference:
+        log.info(f"[ASR] Micro-batching up to {ASR_BATCH_MAX} utterances, {ASR_BATCH_WAIT_MS:g} ms wait")
+        return BatchingEngine(engine)
+    return engine
+
+
+def get_engine() -> TranscriptionEngine:
+    """Process-wide engine, loaded once on first use"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_batching_engine()
+    return _engine
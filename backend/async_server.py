@@ -0,0 +1,292 @@
+"""aiohttp front end serving the same routes as app.py from one event loop.
+
+    python async_server.py --port 5000
+    gunicorn -c gunicorn.conf.py            (production, see gunicorn.conf.py)
+
+State (agent, sessions, call contexts, TTS cache, dispatcher) is shared with the Flask
+module. Upstream speech synthesis is awaited on the loop; anything else that can block
+(decoding, transcription, the SQLite stores, the dispatcher's lock) runs on a bounded
+thread pool so a burst of requests queues there instead of stalling the loop.
+"""
+import os
+import json
+import asyncio
+import contextvars
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+import app as core
+import http_clients
+from http_clients import CircuitOpenError
+from tts import TTSError
+import telemetry
+
+log = telemetry.get_logger('async_server')
+
+# Work sent to the pool includes cloud ASR calls that mostly wait on the network, so it is
+# sized like ThreadPoolExecutor's default rather than one thread per core
+ASYNC_CPU_WORKERS = int(os.getenv('ASYNC_CPU_WORKERS') or 0) or min(32, (os.cpu_count() or 1) + 4)
+
+cpu_pool = ThreadPoolExecutor(max_workers=ASYNC_CPU_WORKERS, thread_name_prefix='cpu')
+
+
+async def blocking(fn, *args):
+    # Carry the request trace into the worker so its spans are attributed to this request
+    ctx = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(cpu_pool, ctx.run, fn, *args)
+
+
+async def read_conversation_request(request: web.Request) -> tuple[dict, bytes, str]:
+    """Async read_conversation_request(): the body is read once into a single buffer"""
+    mimetype = request.content_type
+    if mimetype == 'multipart/form-data':
+        form = await request.post()
+        data = json.loads(form.get('metadata') or '{}')
+        upload = form.get('audio')
+        if not isinstance(upload, web.FileField):
+            return data, b'', ''
+        return data, upload.file.read(), upload.content_type
+    if core.is_raw_audio(mimetype):
+        data, mime = core.raw_upload_metadata(mimetype, request.query, request.headers)
+        return data, await request.read(), mime
+    raw = await request.read()
+    data = json.loads(raw) if raw else {}
+    audio, mime = await blocking(core.decode_data_url, data.get('audioBase64', ''))
+    return data, audio, mime
+
+
+async def conversation(request: web.Request) -> web.Response:
+    try:
+        data, audio, mime = await read_conversation_request(request)
+    except web.HTTPException:
+        raise
+    except Exception as e:
+        log.error(f"[Error] {e}")
+        return web.json_response(core.backend_error(e))
+    body, status = await blocking(core.conversation_turn, data, audio, mime)
+    return web.json_response(body, status=status)
+
+
+async def conversation_stream_start(request: web.Request) -> web.Response:
+    try:
+        data = await request.json()
+    except ValueError:
+        data = {}
+    body, status = await blocking(core.open_stream, data or {})
+    return web.json_response(body, status=status)
+
+
+async def conversation_stream_audio(request: web.Request) -> web.Response:
+    session = core.streams.get(request.match_info['stream_id'])
+    if not session:
+        return web.json_response({'error': 'Unknown or expired stream'}, status=404)
+    try:
+        rate = int(request.query.get('rate', core.audio_decode.SAMPLE_RATE))
+    except ValueError:
+        rate = core.audio_decode.SAMPLE_RATE
+    data = await request.read()
+    try:
+        partial = await blocking(session.feed, data, rate)
+    except Exception as e:
+        log.error(f"[Stream Error] {e}")
+        return web.json_response({'error': str(e)}, status=500)
+    return web.json_response({'partial': partial})
+
+
+async def conversation_stream_end(request: web.Request) -> web.Response:
+    session = core.streams.close(request.match_info['stream_id'])
+    if not session:
+        return web.json_response({'error': 'Unknown or expired stream'}, status=404)
+    body, status = await blocking(core.finish_stream, session)
+    return web.json_response(body, status=status)
+
+
+async def metrics(request: web.Request) -> web.Response:
+    return web.json_response(await blocking(core.metrics_snapshot))
+
+
+async def upstreams(request: web.Request) -> web.Response:
+    return web.json_response(http_clients.upstream_stats())
+
+
+async def twilio_recording(request: web.Request) -> web.Response:
+    values = dict(request.query)
+    values.update(await request.post())
+    body, status = await blocking(core.recording_callback, values)
+    return web.json_response(body, status=status)
+
+
+async def recordings_for_call(request: web.Request) -> web.Response:
+    body, status = await blocking(core.call_recordings, request.match_info['call_sid'])
+    return web.json_response(body, status=status)
+
+
+async def ready(request: web.Request) -> web.Response:
+    body, status = core.readiness()
+    return web.json_response(body, status=status)
+
+
+async def asr_stats(request: web.Request) -> web.Response:
+    # The first call loads the ASR model if warm-up hasn't yet
+    return web.json_response(await blocking(core.agent.asr_stats))
+
+
+async def dispatch_status(request: web.Request) -> web.Response:
+    job = await blocking(core.agent.dispatcher.get, request.match_info['job_id'])
+    if not job:
+        return web.json_response({'error': 'Unknown dispatch job'}, status=404)
+    return web.json_response(job.to_dict())
+
+
+async def list_tickets(request: web.Request) -> web.Response:
+    body, status = await blocking(core.ticket_query, request.query)
+    return web.json_response(body, status=status)
+
+
+async def ticket_backlog(request: web.Request) -> web.Response:
+    return web.json_response(await blocking(core.agent.tickets.counts))
+
+
+async def ticket(request: web.Request) -> web.Response:
+    body, status = await blocking(core.ticket_detail, request.match_info['ticket_id'])
+    return web.json_response(body, status=status)
+
+
+async def twilio_call_status(request: web.Request) -> web.Response:
+    values = await request.post()
+    await blocking(core.agent.dispatcher.call_status, values.get('CallSid', ''), values.get('CallStatus', ''))
+    return web.Response(status=204)
+
+
+async def twilio_ivr(request: web.Request) -> web.Response:
+    values = dict(request.query)
+    if request.method == 'POST':
+        values.update(await request.post())
+    twiml = await blocking(
+        core.ivr_twiml,
+        values.get('CallSid', 'unknown'),
+        values.get('step', 'greet'),
+        values.get('SpeechResult', ''),
+        values.get('problem', 'a technical issue'),
+        values.get('ticket', ''),
+    )
+    return web.Response(text=twiml, content_type='text/xml')
+
+
+async def tts(request: web.Request) -> web.StreamResponse:
+    synthesizer, cache = core.synthesizer, core.tts_audio
+    try:
+        text = (await request.json()).get('text', '')
+        log.info(f"[TTS] Received text: {text}")
+        if not text:
+            return web.json_response({'error': 'No text provided'}, status=400)
+        key = synthesizer.cache_key(text)
+        data, path = await blocking(cache.get, key)
+        if data is not None:
+            return web.Response(body=data, content_type=synthesizer.mimetype, headers={'X-TTS-Cache': 'memory'})
+        if path:
+            return web.FileResponse(path, headers={'Content-Type': synthesizer.mimetype, 'X-TTS-Cache': 'disk'})
+        if not synthesizer.available():
+            return web.json_response({'error': 'ELEVENLABS API keys not set'}, status=500)
+        try:
+            chunks = await synthesizer.astream(text)
+        except TTSError as e:
+            return web.json_response({'error': e.message}, status=e.status_code)
+        except CircuitOpenError:
+            return web.json_response({'error': 'Speech synthesis temporarily unavailable'}, status=503)
+    except Exception as e:
+        log.error(f"[TTS Error] {e}")
+        return web.json_response({'error': str(e)}, status=500)
+
+    resp = web.StreamResponse(headers={'Content-Type': synthesizer.mimetype, 'X-TTS-Cache': 'miss'})
+    relay = cache.atee(key, chunks)
+    try:
+        await resp.prepare(request)
+        async for chunk in relay:
+            await resp.write(chunk)
+        await resp.write_eof()
+    finally:
+        await relay.aclose()
+        await chunks.aclose()
+    return resp
+
+
+async def preflight(request: web.Request) -> web.Response:
+    return web.Response(headers={
+        'Access-Control-Allow-Methods': request.headers.get('Access-Control-Request-Method', 'GET, POST'),
+        'Access-Control-Allow-Headers': request.headers.get('Access-Control-Request-Headers', ''),
+    })
+
+
+async def allow_cors(request: web.Request, response: web.StreamResponse):
+    # Same open policy as flask_cors.CORS(app)
+    response.headers['Access-Control-Allow-Origin'] = '*'
+
+
+@web.middleware
+async def trace_requests(request: web.Request, handler):
+    resource = request.match_info.route.resource
+    trace = telemetry.start_trace(resource.canonical if resource else 'unmatched', method=request.method)
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        telemetry.end_trace(trace, status)
+
+
+@web.middleware
+async def json_errors(request: web.Request, handler):
+    try:
+        return await handler(request)
+    except web.HTTPRequestEntityTooLarge:
+        return web.json_response({'error': f'Upload exceeds {core.MAX_UPLOAD_BYTES} bytes'}, status=413)
+
+
+async def close_clients(app: web.Application):
+    await http_clients.close_async_sessions()
+    cpu_pool.shutdown(wait=False)
+
+
+async def create_app() -> web.Application:
+    app = web.Application(client_max_size=core.MAX_UPLOAD_BYTES, middlewares=[trace_requests, json_errors])
+    app.router.add_post('/conversation', conversation)
+    app.router.add_post('/conversation/stream', conversation_stream_start)
+    app.router.add_post('/conversation/stream/{stream_id}/audio', conversation_stream_audio)
+    app.router.add_post('/conversation/stream/{stream_id}/end', conversation_stream_end)
+    app.router.add_get('/metrics', metrics)
+    app.router.add_get('/ready', ready)
+    app.router.add_get('/upstreams', upstreams)
+    app.router.add_post('/twilio-recording', twilio_recording)
+    app.router.add_get('/recordings/{call_sid}', recordings_for_call)
+    app.router.add_get('/asr/stats', asr_stats)
+    app.router.add_get('/dispatch/{job_id}', dispatch_status)
+    app.router.add_get('/tickets', list_tickets)
+    app.router.add_get('/tickets/backlog', ticket_backlog)
+    app.router.add_get('/tickets/{ticket_id}', ticket)
+    app.router.add_post('/twilio-call-status', twilio_call_status)
+    app.router.add_route('GET', '/twilio-ivr', twilio_ivr)
+    app.router.add_route('POST', '/twilio-ivr', twilio_ivr)
+    app.router.add_post('/tts', tts)
+    app.router.add_route('OPTIONS', '/{tail:.*}', preflight)
+    app.on_response_prepare.append(allow_cors)
+    app.on_cleanup.append(close_clients)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args()
+    web.run_app(create_app(), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
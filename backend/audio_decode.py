@@ -0,0 +1,205 @@
+import io
+import os
+import shutil
+import importlib.util
+import subprocess
+import threading
+import wave
+
+import numpy as np
+
+import telemetry
+
+log = telemetry.get_logger('decode')
+
+SAMPLE_RATE = 16000
+
+FFMPEG_BINARY = os.getenv('FFMPEG_BINARY') or shutil.which('ffmpeg') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'ffmpeg.exe')
+
+# PyAV is slower to import than the rest of the app together, so it is only checked for here
+# and imported by the first compressed upload (or load_decoders() during warm-up)
+AV_AVAILABLE = importlib.util.find_spec('av') is not None
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+
+class DecodeError(Exception):
+    pass
+
+
+def to_mono(samples: np.ndarray) -> np.ndarray:
+    if samples.ndim == 2:
+        samples = samples.mean(axis=1)
+    return samples
+
+
+def resample(samples: np.ndarray, rate: int, target: int = SAMPLE_RATE) -> np.ndarray:
+    """Float mono samples -> target rate (box-filter decimation for integer ratios)"""
+    if rate == target or not len(samples):
+        return samples
+    if rate > target and rate % target == 0:
+        factor = rate // target
+        n = len(samples) // factor * factor
+        return samples[:n].reshape(-1, factor).mean(axis=1)
+    n_out = int(round(len(samples) * target / rate))
+    x_old = np.arange(len(samples), dtype=np.float64) / rate
+    x_new = np.arange(n_out, dtype=np.float64) / target
+    return np.interp(x_new, x_old, samples)
+
+
+def to_pcm16(samples: np.ndarray) -> np.ndarray:
+    return np.clip(samples, -32768, 32767).astype(np.int16)
+
+
+def _decode_wav(f, block_seconds: float | None = None) -> np.ndarray:
+    """WAV from a file object; with `block_seconds` it is read and converted a block at a time"""
+    with wave.open(f, 'rb') as w:
+        channels, width, rate = w.getnchannels(), w.getsampwidth(), w.getframerate()
+        if block_seconds is None:
+            return _wav_frames(w.readframes(w.getnframes()), channels, width, rate)
+        block = max(1, int(rate * block_seconds))
+        blocks = []
+        while True:
+            frames = w.readframes(block)
+            if not frames:
+                break
+            blocks.append(_wav_frames(frames, channels, width, rate))
+    return np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.int16)
+
+
+def _wav_frames(frames: bytes, channels: int, width: int, rate: int) -> np.ndarray:
+    if width == 2:
+        samples = np.frombuffer(frames, dtype='<i2').astype(np.float32)
+    elif width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128) * 256
+    elif width == 4:
+        samples = np.frombuffer(frames, dtype='<i4').astype(np.float32) / 65536
+    else:
+        raise DecodeError(f"Unsupported WAV sample width: {width}")
+    if channels > 1:
+        samples = samples.reshape(-1, channels)
+    return to_pcm16(resample(to_mono(samples), rate))
+
+
+def _decode_soundfile(f) -> np.ndarray:
+    samples, rate = soundfile.read(f, dtype='int16', always_2d=False)
+    samples = samples.astype(np.float32)
+    return to_pcm16(resample(to_mono(samples), rate))
+
+
+def _decode_av(f) -> np.ndarray:
+    import av
+    resampler = av.AudioResampler(format='s16', layout='mono', rate=SAMPLE_RATE)
+    chunks = []
+    with av.open(f, mode='r') as container:
+        stream = container.streams.audio[0]
+        for frame in container.decode(stream):
+            for out in resampler.resample(frame):
+                chunks.append(out.to_ndarray().reshape(-1))
+        for out in resampler.resample(None):
+            chunks.append(out.to_ndarray().reshape(-1))
+    if not chunks:
+        return np.zeros(0, dtype=np.int16)
+    return np.concatenate(chunks).astype(np.int16, copy=False)
+
+
+class FFmpegDecoder:
+    """Keeps one ffmpeg process spawned and waiting on stdin so requests don't pay for the fork"""
+
+    def __init__(self, binary: str = FFMPEG_BINARY):
+        self.binary = binary
+        self._lock = threading.Lock()
+        self._spare = None
+
+    def available(self) -> bool:
+        return bool(self.binary) and os.path.exists(self.binary)
+
+    def _spawn(self):
+        return subprocess.Popen(
+            [self.binary, '-hide_banner', '-loglevel', 'error', '-i', 'pipe:0',
+             '-f', 's16le', '-ac', '1', '-ar', str(SAMPLE_RATE), 'pipe:1'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def warm(self):
+        try:
+            proc = self._spawn()
+        except Exception as e:
+            log.warning(f"[Decode] Could not start ffmpeg: {e}")
+            return
+        with self._lock:
+            if self._spare is None:
+                self._spare = proc
+                return
+        proc.kill()
+
+    def decode(self, data: bytes, timeout: float = 10) -> np.ndarray:
+        with self._lock:
+            proc, self._spare = self._spare, None
+        if proc is None:
+            proc = self._spawn()
+        threading.Thread(target=self.warm, daemon=True).start()
+        try:
+            out, err = proc.communicate(input=data, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            raise DecodeError("ffmpeg timed out")
+        if proc.returncode != 0:
+            raise DecodeError(f"ffmpeg failed: {err.decode(errors='replace').strip()}")
+        return np.frombuffer(out, dtype='<i2').copy()
+
+
+ffmpeg_decoder = FFmpegDecoder()
+
+
+def decode_audio(data: bytes, mime: str = '') -> np.ndarray:
+    """Decode an in-memory audio file to 16 kHz mono int16 PCM"""
+    if not data:
+        return np.zeros(0, dtype=np.int16)
+    if data[:4] == b'RIFF' and data[8:12] == b'WAVE':
+        return _decode_wav(io.BytesIO(data))
+    return _decode_compressed(io.BytesIO(data), data[:4], mime)
+
+
+def decode_stream(f, mime: str = '') -> np.ndarray:
+    """decode_audio() for a seekable binary file (e.g. a download spool), read from the file
+    in blocks rather than copied into memory first"""
+    head = f.read(12)
+    f.seek(0)
+    if not head:
+        return np.zeros(0, dtype=np.int16)
+    if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+        return _decode_wav(f, block_seconds=10.0)
+    return _decode_compressed(f, head[:4], mime)
+
+
+def _decode_compressed(f, magic: bytes, mime: str) -> np.ndarray:
+    errors = []
+    if soundfile is not None and 'webm' not in mime and magic != b'\x1a\x45\xdf\xa3':
+        try:
+            return _decode_soundfile(f)
+        except Exception as e:
+            errors.append(f"soundfile: {e}")
+            f.seek(0)
+    if AV_AVAILABLE:
+        try:
+            return _decode_av(f)
+        except Exception as e:
+            errors.append(f"av: {e}")
+            f.seek(0)
+    if ffmpeg_decoder.available():
+        return ffmpeg_decoder.decode(f.read())
+    raise DecodeError(f"No decoder could handle {mime or 'audio'} ({'; '.join(errors) or 'no decoders installed'})")
+
+
+def load_decoders():
+    if AV_AVAILABLE:
+        import av  # noqa: F401
+
+
+def decode_file(path: str) -> np.ndarray:
+    with open(path, 'rb') as f:
+        return decode_stream(f)
@@ -0,0 +1,120 @@
+"""Micro-batched transcription benchmark: utterances/sec per core and latency percentiles.
+
+Runs the same utterances through the real engine unbatched (every caller hits it directly)
+and, for engines with batched inference, through BatchingEngine at several batch sizes and
+wait times.
+
+    python benchmarks/bench_asr_batch.py [--engine whisper|vosk] [--model NAME_OR_DIR] [--callers 16]
+                                         [--utterances 200] [--audio-dir DIR] [--max-new-tokens N]
+
+--max-new-tokens caps decoding for Whisper, so runs with and without batching decode the
+same number of tokens (needed for a model that never emits end-of-text, e.g. random weights).
+"""
+import os
+
+# One BLAS thread per worker, so "per core" means what it says
+for _var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+    os.environ.setdefault(_var, '1')
+
+import sys
+import glob
+import time
+import random
+import argparse
+import threading
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asr
+from audio_decode import decode_file
+
+
+def load_engine(name: str, model: str | None, max_new_tokens: int | None) -> asr.TranscriptionEngine:
+    if name == 'whisper':
+        return asr.WhisperEngine(model or asr.WHISPER_MODEL, max_new_tokens=max_new_tokens)
+    return asr.VoskEngine(model or asr.VOSK_MODEL_PATH)
+
+
+def make_utterances(count: int, audio_dir: str | None) -> list[np.ndarray]:
+    if audio_dir:
+        files = sorted(glob.glob(os.path.join(audio_dir, '*.wav')))
+        if not files:
+            raise SystemExit(f"no .wav files in {audio_dir}")
+        clips = [decode_file(f) for f in files]
+        return [clips[i % len(clips)] for i in range(count)]
+    rng = random.Random(7)
+    return [(np.random.default_rng(i).standard_normal(int(asr.SAMPLE_RATE * rng.uniform(1.0, 6.0))) * 2000)
+            .astype(np.int16) for i in range(count)]
+
+
+def run(engine: asr.TranscriptionEngine, utterances: list[np.ndarray], callers: int) -> dict:
+    it = iter(range(len(utterances)))
+    lock = threading.Lock()
+    latencies = []
+
+    def caller():
+        while True:
+            with lock:
+                i = next(it, None)
+            if i is None:
+                return
+            start = time.perf_counter()
+            engine.transcribe(utterances[i])
+            latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=caller) for _ in range(callers)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+    return {'rate': len(utterances) / elapsed, 'p50': pct(0.50), 'p99': pct(0.99)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--engine', default='whisper', choices=['whisper', 'vosk'])
+    parser.add_argument('--model', help='model name or directory (default: WHISPER_MODEL / VOSK_MODEL_PATH)')
+    parser.add_argument('--max-new-tokens', type=int)
+    parser.add_argument('--callers', type=int, default=16)
+    parser.add_argument('--utterances', type=int, default=200)
+    parser.add_argument('--audio-dir')
+    parser.add_argument('--batch', default='4,8,16', help='max batch sizes to try')
+    parser.add_argument('--wait', default='5,20,50', help='max waits (ms) to try')
+    parser.add_argument('--concurrency', type=int, default=asr.ASR_BATCH_CONCURRENCY, help='batches in flight')
+    args = parser.parse_args()
+
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    engine = load_engine(args.engine, args.model, args.max_new_tokens)
+    utterances = make_utterances(args.utterances, args.audio_dir)
+    seconds = sum(len(u) for u in utterances) / asr.SAMPLE_RATE
+    print(f"engine={engine.name} cores={cores} callers={args.callers} "
+          f"utterances={len(utterances)} audio={seconds:.0f}s")
+    print(f"{'mode':<22} {'utt/s':>8} {'utt/s/core':>11} {'p50 ms':>8} {'p99 ms':>8} {'batch':>6}")
+
+    def report(label, r, mean_batch=1.0):
+        print(f"{label:<22} {r['rate']:>8.1f} {r['rate'] / cores:>11.2f} {r['p50']:>8.1f} {r['p99']:>8.1f} "
+              f"{mean_batch:>6.1f}")
+
+    report('unbatched', run(engine, utterances, args.callers))
+    if not engine.batched_inference:
+        print(f"{engine.name} has no batched inference; BatchingEngine is not used for it")
+        return 0
+    for max_batch in (int(b) for b in args.batch.split(',')):
+        for wait in (float(w) for w in args.wait.split(',')):
+            batching = asr.BatchingEngine(engine, max_batch=max_batch, max_wait_ms=wait,
+                                          concurrency=args.concurrency)
+            r = run(batching, utterances, args.callers)
+            report(f"batch={max_batch} wait={wait:g}ms", r, batching.stats()['meanBatch'])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""Sequential vs parallel technician dispatch against a simulated phone network.
+
+Runs the backend in-process, with the twilio fake's CallSimulator playing the technicians:
+each call rings, may go unanswered, and otherwise walks the real IVR webhooks and says yes
+or no. Every ticket is dispatched once per mode; a ticket is resolved when a technician
+confirms or none of its calls can any more.
+
+    python benchmarks/bench_dispatch.py [--tickets 40] [--parallel 3] [--answer-rate 0.7] [--confirm-rate 0.5]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeService, TwilioHandler, CallSimulator
+
+
+def percentile(values: list[float], p: float) -> float | None:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))] if values else None
+
+
+def resolved(job) -> bool:
+    return job.status == 'confirmed' or (job.done and all(state != 'ringing' for _, state in job.calls.values()))
+
+
+def run_mode(app, parallel: int, args, twilio: FakeService) -> dict:
+    from dispatch import Dispatcher
+    agent = app.agent
+    agent.dispatcher = Dispatcher(agent, parallel_calls=parallel, confirm_timeout=args.timeout, backoff=0.05)
+    problems = sorted({t.problem_type for t in agent.technicians})
+    twilio.calls.outcomes.clear()
+    jobs = [agent.dispatcher.submit(problems[i % len(problems)], 'benchmark ticket', []) for i in range(args.tickets)]
+    deadline = time.monotonic() + args.timeout + 15
+    while time.monotonic() < deadline and not all(resolved(j) for j in jobs):
+        time.sleep(0.1)
+    confirmed = [j.updated - j.created for j in jobs if j.status == 'confirmed']
+    outcomes = list(twilio.calls.outcomes.values())
+    return {
+        'tickets': len(jobs),
+        'confirmed': len(confirmed),
+        'unresolved': sum(not resolved(j) for j in jobs),
+        'p50': percentile(confirmed, 0.5), 'p95': percentile(confirmed, 0.95),
+        'calls': sum(len(j.calls) for j in jobs),
+        'hungUp': outcomes.count('hung-up'),
+        'taken': outcomes.count('taken'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tickets', type=int, default=40)
+    parser.add_argument('--parallel', type=int, default=3)
+    parser.add_argument('--answer-rate', type=float, default=0.7)
+    parser.add_argument('--confirm-rate', type=float, default=0.5)
+    parser.add_argument('--timeout', type=float, default=20.0, help='confirmation timeout per ticket (s)')
+    args = parser.parse_args()
+
+    twilio = FakeService(TwilioHandler).start()
+    twilio.calls = CallSimulator(args.answer_rate, args.confirm_rate, ring=(0.5, 3.0), think=0.2, seed=7)
+
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args):
+            pass
+    server = make_server('127.0.0.1', 0, None, threaded=True, request_handler=QuietHandler)  # bound first for the port
+    scratch = tempfile.mkdtemp(prefix='bench-dispatch-')
+    os.environ.update(TWILIO_API_BASE=twilio.url, PUBLIC_BASE_URL=f"http://127.0.0.1:{server.server_port}",
+                      TICKET_DB=os.path.join(scratch, 'tickets.db'), RECORDING_DB=os.path.join(scratch, 'recordings.db'),
+                      TTS_PREWARM='0', LOG_TRACES='0', LOG_LEVEL='ERROR',
+                      CALL_CONTEXT_BACKEND='memory', SESSION_BACKEND='memory',
+                      UPSTREAM_TWILIO_BREAKER_THRESHOLD='1000000')
+    os.chdir(BACKEND_DIR)
+    import app
+    server.app = app.app
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    print(f"{args.tickets} tickets, answer rate {args.answer_rate}, confirm rate {args.confirm_rate}")
+    print(f"{'mode':<12}{'confirmed':>10}{'p50 s':>8}{'p95 s':>8}{'calls':>7}{'hung up':>9}{'taken':>7}{'stuck':>7}")
+    for parallel in (1, args.parallel):
+        r = run_mode(app, parallel, args, twilio)
+        name = 'sequential' if parallel == 1 else f"parallel {parallel}"
+
+        def fmt(v):
+            return f"{v:.2f}" if v is not None else '-'
+        print(f"{name:<12}{r['confirmed']:>7}/{r['tickets']:<2}{fmt(r['p50']):>8}{fmt(r['p95']):>8}"
+              f"{r['calls']:>7}{r['hungUp']:>9}{r['taken']:>7}{r['unresolved']:>7}")
+    server.shutdown()
+    twilio.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,322 @@
+"""End-to-end benchmark: /conversation, /tts and the /twilio-ivr state machine against local fakes.
+
+Google Speech, ElevenLabs and Twilio are replaced with the fakes in fakes.py, each with its
+own latency. Every scenario gets a fresh server process (Flask or the async server) and is
+driven by `--concurrency` clients over keep-alive connections. Throughput, latency
+percentiles and the server's peak RSS are reported per scenario.
+
+    python benchmarks/bench_e2e.py [--target flask|async] [--scenarios conversation,tts,ivr]
+                                   [--concurrency 20] [--iterations 200]
+                                   [--asr-latency 0.3] [--tts-latency 0.25] [--twilio-latency 0.1]
+                                   [--save results.json] [--compare baseline.json] [--tolerance 0.15]
+
+`--save` writes the results (with the commit they were taken at) as a baseline; `--compare`
+prints the change against one and exits non-zero when a metric regressed beyond
+`--tolerance`.
+
+Conversation turns upload recorded utterances from a generated corpus: each scripted sentence
+is a tone the fake recognizer maps back to its text (see fakes.tone_utterance), padded with
+quiet noise so the server's VAD has silence to trim.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import itertools
+import subprocess
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeService, GoogleSpeechHandler, ElevenLabsHandler, TwilioHandler, tone_utterance
+from load_test import TARGETS, BACKEND_DIR, free_port, wait_ready
+
+SENTENCES = [
+    "my printer is not printing anything",
+    "it is switched on and plugged in",
+    "there is a blinking orange light on the panel",
+    "no it can wait until tomorrow",
+    "the vpn keeps dropping when I work from home",
+    "the login page loads fine",
+    "it says authentication failed",
+    "yes please send someone",
+    "our database server crashed and this is an emergency",
+]
+
+# (sentence index or None for an audio-less turn, expected nextStep) after the greeting
+FLOWS = {
+    'ticket': [(0, 'diagnostic'), (1, 'diagnostic'), (2, 'urgency'), (3, 'complete')],
+    'dispatch': [(4, 'diagnostic'), (5, 'diagnostic'), (6, 'urgency'), (7, 'calling'), (None, 'complete')],
+    'urgent': [(8, 'calling'), (None, 'complete')],
+}
+
+TTS_PROMPTS = [
+    'Hello! Welcome to IT Support. Please describe your problem.',
+    "I didn't catch that. Please describe your problem again.",
+    'Thank you. Is this issue urgent and needs immediate attention?',
+    'Contacting a technician now. I will update you as soon as the call is placed.',
+]
+
+IVR_SCRIPT = [('greet', ''), ('got_name', 'Ravi'), ('got_time', 'tomorrow at 3 pm'), ('confirmation', 'yes')]
+
+# metric -> True when bigger is better
+COMPARED = {'rps': True, 'p50': False, 'p95': False, 'p99': False, 'rssPeakMb': False}
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = 0
+        self.requests = 0
+
+    def observe(self, name: str, seconds: float, ok: bool):
+        self.requests += 1
+        self.errors += not ok
+        self.latencies.setdefault(name, []).append(seconds)
+
+    def summary(self, elapsed: float) -> dict:
+        every = sorted(s for series in self.latencies.values() for s in series)
+        return {'requests': self.requests, 'errors': self.errors, 'seconds': round(elapsed, 2),
+                'rps': round(self.requests / elapsed, 1) if elapsed else 0.0, **percentiles(every),
+                'stages': {name: percentiles(sorted(series)) for name, series in sorted(self.latencies.items())}}
+
+
+def percentiles(sorted_seconds: list[float]) -> dict:
+    def pct(p):
+        if not sorted_seconds:
+            return None
+        return round(sorted_seconds[min(len(sorted_seconds) - 1, int(p * len(sorted_seconds)))] * 1000, 1)
+    return {'p50': pct(0.50), 'p95': pct(0.95), 'p99': pct(0.99), 'maxMs': pct(1.0)}
+
+
+def rss_mb(pid: int, field: str) -> float | None:
+    """VmHWM (peak) or VmRSS of a process, from /proc; None where that isn't available"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+async def timed(rec: Recorder, name: str, request) -> tuple[dict | str | None, bool]:
+    start = time.perf_counter()
+    body, ok = None, False
+    try:
+        async with request as r:
+            ok = r.status == 200
+            body = await (r.json() if r.content_type == 'application/json' else r.text())
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+        ok = False
+    rec.observe(name, time.perf_counter() - start, ok)
+    return body, ok
+
+
+async def conversation_flow(session, base: str, rec: Recorder, corpus: list[bytes], n: int):
+    name, turns = list(FLOWS.items())[n % len(FLOWS)]
+    body, ok = await timed(rec, 'greet', session.post(f"{base}/conversation", json={'audioBase64': '', 'step': 'greet'}))
+    if not ok:
+        return
+    for index, expected in turns:
+        params = {'sessionId': body['sessionId'], 'version': body['version']}
+        if index is None:
+            req = session.post(f"{base}/conversation", json=params)
+        else:
+            req = session.post(f"{base}/conversation", params=params, data=corpus[index],
+                               headers={'Content-Type': 'audio/wav'})
+        step = body.get('nextStep', '?')
+        body, ok = await timed(rec, step, req)
+        if not ok or body.get('nextStep') != expected:
+            if ok:
+                rec.errors += 1
+                print(f"  {name} flow: {step} turn gave nextStep={body.get('nextStep')!r}, expected {expected!r}")
+            return
+    job = body.get('dispatchJob')
+    if job:
+        # Time from the 'calling' response until the fake Twilio accepted the call(s); nobody
+        # answers them here, so parallel dispatch stops at 'ringing'
+        start = time.perf_counter()
+        while True:
+            async with session.get(f"{base}/dispatch/{job}") as r:
+                status = (await r.json()).get('status') if r.status == 200 else 'failed'
+            if status in ('placed', 'ringing', 'confirmed', 'failed'):
+                rec.latencies.setdefault('dispatch', []).append(time.perf_counter() - start)
+                rec.errors += status == 'failed'
+                return
+            await asyncio.sleep(0.05)
+
+
+async def tts_request(session, base: str, rec: Recorder, corpus, n: int):
+    # Half repeated prompts (cache hits after the first), half unique text (upstream misses)
+    text = TTS_PROMPTS[n % len(TTS_PROMPTS)] if n % 2 else f"Benchmark sentence number {n}."
+    start = time.perf_counter()
+    ok, source = False, 'error'
+    try:
+        async with session.post(f"{base}/tts", json={'text': text}) as r:
+            await r.read()
+            ok, source = r.status == 200, r.headers.get('X-TTS-Cache', 'miss')
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        pass
+    rec.observe(f"tts {source}", time.perf_counter() - start, ok)
+
+
+async def ivr_call(session, base: str, rec: Recorder, corpus, n: int):
+    call_sid = f"CA{n:032d}"
+    for step, speech in IVR_SCRIPT:
+        body, ok = await timed(rec, step, session.post(
+            f"{base}/twilio-ivr", params={'step': step, 'problem': 'printer offline'},
+            data={'CallSid': call_sid, 'SpeechResult': speech}))
+        if not ok or '<Response>' not in body:
+            return
+
+
+SCENARIOS = {
+    'conversation': conversation_flow,
+    'tts': tts_request,
+    'ivr': ivr_call,
+}
+
+
+async def drive(base: str, scenario: str, concurrency: int, iterations: int, corpus: list[bytes]) -> tuple[Recorder, float]:
+    rec = Recorder()
+    counter = itertools.count()
+    run_one = SCENARIOS[scenario]
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=120)) as session:
+        async def client():
+            while (n := next(counter)) < iterations:
+                await run_one(session, base, rec, corpus, n)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        return rec, time.perf_counter() - start
+
+
+def server_env(fakes: dict, concurrency: int, cache_dir: str) -> dict:
+    pool = str(max(16, concurrency))
+    return dict(os.environ,
+                ASR_BACKEND='google', ASR_FALLBACK='google',
+                GOOGLE_SPEECH_ENDPOINT=f"{fakes['google'].url}/speech-api/v2/recognize",
+                TTS_BACKEND='elevenlabs', ELEVENLABS_API_BASE=fakes['elevenlabs'].url,
+                ELEVENLABS_API_KEY='bench', ELEVENLABS_VOICE_ID='bench',
+                TWILIO_API_BASE=fakes['twilio'].url, PUBLIC_BASE_URL='http://127.0.0.1',
+                TTS_CACHE_DIR=cache_dir, TTS_PREWARM='0', LOG_TRACES='0',
+                TICKET_DB=os.path.join(cache_dir, 'tickets.db'), RECORDING_DB=os.path.join(cache_dir, 'recordings.db'),
+                SESSION_BACKEND='memory', CALL_CONTEXT_BACKEND='memory',
+                UPSTREAM_ELEVENLABS_POOL_SIZE=pool, UPSTREAM_TWILIO_POOL_SIZE=pool,
+                UPSTREAM_ELEVENLABS_BREAKER_THRESHOLD='1000000', UPSTREAM_TWILIO_BREAKER_THRESHOLD='1000000')
+
+
+def run_scenario(target: str, scenario: str, args, fakes: dict, corpus: list[bytes]) -> dict:
+    port = free_port()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        proc = subprocess.Popen(TARGETS[target](port), cwd=BACKEND_DIR, env=server_env(fakes, args.concurrency, cache_dir),
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            base = f"http://127.0.0.1:{port}"
+            asyncio.run(wait_ready(base))
+            idle = rss_mb(proc.pid, 'VmRSS')
+            rec, elapsed = asyncio.run(drive(base, scenario, args.concurrency, args.iterations, corpus))
+            peak = rss_mb(proc.pid, 'VmHWM')
+        finally:
+            proc.terminate()
+            proc.wait(timeout=10)
+    return {**rec.summary(elapsed), 'rssIdleMb': idle, 'rssPeakMb': peak}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> int:
+    settings = ('target', 'concurrency', 'iterations', 'asrLatency', 'ttsLatency', 'twilioLatency')
+    changed = [k for k in settings if baseline['meta'].get(k) != results['meta'].get(k)]
+    if changed:
+        print(f"warning: baseline was taken with different settings ({', '.join(changed)})")
+    print(f"\nvs baseline {baseline['meta'].get('commit') or '?'} (tolerance {tolerance:.0%})")
+    regressions = 0
+    for scenario, now in results['scenarios'].items():
+        before = baseline['scenarios'].get(scenario)
+        if not before:
+            continue
+        for metric, higher_is_better in COMPARED.items():
+            a, b = before.get(metric), now.get(metric)
+            if not a or b is None:
+                continue
+            change = (b - a) / a
+            worse = -change if higher_is_better else change
+            flag = 'REGRESSION' if worse > tolerance else ''
+            regressions += bool(flag)
+            print(f"  {scenario:<13} {metric:<10} {a:>9} -> {b:>9} {change:>+7.1%} {flag}")
+    print(f"{regressions} regression(s)")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--target', choices=sorted(TARGETS), default='flask')
+    parser.add_argument('--scenarios', default='conversation,tts,ivr')
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--iterations', type=int, default=200,
+                        help='conversation flows / tts requests / ivr calls per scenario')
+    parser.add_argument('--asr-latency', type=float, default=0.3)
+    parser.add_argument('--tts-latency', type=float, default=0.25)
+    parser.add_argument('--twilio-latency', type=float, default=0.1)
+    parser.add_argument('--save', metavar='PATH', help='write results as a baseline')
+    parser.add_argument('--compare', metavar='PATH', help='baseline to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.15)
+    args = parser.parse_args()
+
+    GoogleSpeechHandler.transcripts = SENTENCES
+    corpus = [tone_utterance(i) for i in range(len(SENTENCES))]
+    fakes = {
+        'google': FakeService(GoogleSpeechHandler, latency=args.asr_latency).start(),
+        'elevenlabs': FakeService(ElevenLabsHandler, latency=args.tts_latency).start(),
+        'twilio': FakeService(TwilioHandler, latency=args.twilio_latency).start(),
+    }
+    results = {
+        'meta': {'commit': git_commit(), 'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'target': args.target,
+                 'concurrency': args.concurrency, 'iterations': args.iterations, 'asrLatency': args.asr_latency,
+                 'ttsLatency': args.tts_latency, 'twilioLatency': args.twilio_latency,
+                 'python': platform.python_version(), 'cpus': os.cpu_count()},
+        'scenarios': {},
+    }
+    print(f"target={args.target} concurrency={args.concurrency} iterations={args.iterations} "
+          f"fake latency asr={args.asr_latency * 1000:.0f}ms tts={args.tts_latency * 1000:.0f}ms "
+          f"twilio={args.twilio_latency * 1000:.0f}ms")
+    print(f"{'scenario':<13} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} {'peak MB':>8}")
+    try:
+        for scenario in args.scenarios.split(','):
+            r = run_scenario(args.target, scenario, args, fakes, corpus)
+            results['scenarios'][scenario] = r
+            print(f"{scenario:<13} {r['rps']:>8.1f} {r['p50']:>8} {r['p95']:>8} {r['p99']:>8} {r['errors']:>7} "
+                  f"{r['rssPeakMb'] if r['rssPeakMb'] is not None else '-':>8}")
+            for stage, s in r['stages'].items():
+                print(f"  {stage:<20} {s['p50']:>8} {s['p95']:>8} {s['p99']:>8}")
+    finally:
+        for svc in fakes.values():
+            svc.stop()
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"saved {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            return compare(results, json.load(f), args.tolerance)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""Intent classifier micro-benchmark.
+
+Checks IntentClassifier against the labeled corpus and against the keyword-by-keyword
+functions it replaced, then times both.
+
+    python benchmarks/bench_intent.py [--rounds 200] [--write-labels]
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intent import IntentClassifier
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'intent_corpus.jsonl')
+
+
+# --- previous implementation from AIAgent, kept verbatim as the reference ---
+
+def legacy_has_word(text, words):
+    t = (text or '').lower()
+    return any(re.search(rf'\b{re.escape(w.lower())}\b', t) for w in words)
+
+
+def legacy_infer_problem_type(text):
+    if legacy_has_word(text, ['vpn','remote','access']): return 'VPN Problem'
+    if legacy_has_word(text, ['wifi','wi-fi','internet','network','connection','connect']): return 'WiFi Down'
+    if legacy_has_word(text, ['printer','print','printing']): return 'Printer Error'
+    if legacy_has_word(text, ['account','login','password','locked','access denied']): return 'Account Locked'
+    if legacy_has_word(text, ['cloud','aws','azure','storage']): return 'Cloud Failure'
+    if legacy_has_word(text, ['software','application','bug','crash','error']): return 'Software Bug'
+    if legacy_has_word(text, ['billing','payment','invoice','charge']): return 'Billing Issue'
+    if legacy_has_word(text, ['database','db','sql','data']): return 'Database Crash'
+    if legacy_has_word(text, ['security','breach','hack','malware','virus']): return 'Security Breach'
+    if legacy_has_word(text, ['server','overload','slow','performance']): return 'Server Overload'
+    if legacy_has_word(text, ['email','smtp','outlook']): return 'Email Failure'
+    if legacy_has_word(text, ['backup','restore','recovery']): return 'Data Backup Failure'
+    if legacy_has_word(text, ['firewall','port','blocked']): return 'Firewall Error'
+    return 'Software Bug'
+
+
+def legacy_dispatch_intent(text):
+    if not text: return False
+    t = text.lower()
+    phrases = [
+        'call the technician','call technician','call tech','please call technician',
+        'send technician','send someone','dispatch','escalate',
+        'book appointment','schedule visit','need onsite','need on-site',
+        'come now','visit asap','repair now','send engineer'
+    ]
+    return any(p in t for p in phrases)
+
+
+def legacy_is_urgent(text):
+    if not text: return False
+    t = text.lower().strip()
+    if any(w in t for w in ['urgent','critical','immediately','asap','now','emergency','high priority']): return True
+    if any(w in t for w in ['जरूरी','तुरंत','इमरजेंसी','अभी']): return True
+    if any(w in t for w in ['ತುರತು','ತಕ್ಷಣ','அவசரம்','உடனே','అత్యవసరం','ఇప్పుడే']): return True
+    if any(w in t for w in ['عاجل','فوراً','فورا','ضروری','فوری']): return True
+    return False
+
+
+def legacy_affirmative(text):
+    t = (text or '').lower()
+    yes_tokens = ['yes','y','yeah','yep','ok','okay','sure','please do','go ahead','confirm']
+    return any(re.search(rf'\b{re.escape(y)}\b', t) for y in yes_tokens)
+
+
+def legacy_turn(text):
+    """What one urgency-step turn used to cost: every scan run separately"""
+    return (legacy_infer_problem_type(text), legacy_is_urgent(text),
+            legacy_dispatch_intent(text), legacy_affirmative(text))
+
+
+def load_corpus():
+    with open(CORPUS_PATH, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def time_per_call(fn, texts, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for t in texts:
+            fn(t)
+    return (time.perf_counter() - start) / (rounds * len(texts))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--write-labels', action='store_true',
+                        help='relabel the corpus from the legacy functions')
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    if args.write_labels:
+        with open(CORPUS_PATH, 'w', encoding='utf-8') as f:
+            for row in corpus:
+                p, u, d, a = legacy_turn(row['text'])
+                f.write(json.dumps({'text': row['text'], 'problem_type': p, 'urgent': u,
+                                    'dispatch': d, 'affirmative': a}, ensure_ascii=False) + '\n')
+        corpus = load_corpus()
+
+    clf = IntentClassifier()
+    mismatches = 0
+    for row in corpus:
+        expected = (row['problem_type'], row['urgent'], row['dispatch'], row['affirmative'])
+        got = tuple(clf._classify(row['text']))
+        if got != expected or legacy_turn(row['text']) != expected:
+            mismatches += 1
+            print(f"MISMATCH {row['text']!r}: label={expected} new={got} legacy={legacy_turn(row['text'])}")
+    print(f"corpus: {len(corpus)} utterances, {mismatches} mismatches")
+
+    texts = [row['text'] for row in corpus]
+    legacy = time_per_call(legacy_turn, texts, args.rounds)
+    single = time_per_call(clf._classify, texts, args.rounds)
+    cached = time_per_call(clf.classify, texts, args.rounds)
+    print(f"legacy scans      {legacy * 1e6:8.2f} us/utterance")
+    print(f"single pass       {single * 1e6:8.2f} us/utterance  ({legacy / single:.1f}x)")
+    print(f"single pass+cache {cached * 1e6:8.2f} us/utterance  ({legacy / cached:.1f}x)")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,161 @@
+"""IVR TwiML micro-benchmark.
+
+Checks that the precompiled templates in ivr.py produce byte-identical TwiML to building a
+VoiceResponse per request (over fuzzed names, problems and times), then times both.
+
+    python benchmarks/bench_ivr.py [--cases 2000] [--rounds 20000]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from twilio.twiml.voice_response import VoiceResponse
+
+import ivr
+
+
+# --- previous per-request VoiceResponse construction from app.ivr_twiml, kept as the reference ---
+
+def legacy_twiml(step, user_problem, tech_name='', ctx_problem='', appointment_time='', confirmed=False):
+    response = VoiceResponse()
+    if step == 'greet':
+        response.say(
+            "Hello, this is the AI support agent from IT Support. May I know who I am speaking with?",
+            voice='Polly.Joanna',
+            language='en-US'
+        )
+        gather = response.gather(
+            input='speech',
+            timeout=5,
+            speech_timeout='auto',
+            action=f'/twilio-ivr?step=got_name&problem={requests.utils.quote(user_problem)}',
+            method='POST'
+        )
+        response.say("I didn't hear anything. Please try again.", voice='Polly.Joanna')
+        response.redirect(f'/twilio-ivr?step=greet&problem={requests.utils.quote(user_problem)}')
+    elif step == 'got_name':
+        response.say(
+            f"Thank you, {tech_name}. The user reported: {ctx_problem}. This is urgent.",
+            voice='Polly.Joanna',
+            language='en-US'
+        )
+        response.pause(length=1)
+        response.say(
+            "What is the earliest time you can visit or call the user?",
+            voice='Polly.Joanna',
+            language='en-US'
+        )
+        gather = response.gather(
+            input='speech',
+            timeout=5,
+            speech_timeout='auto',
+            action=f'/twilio-ivr?step=got_time&problem={requests.utils.quote(user_problem)}',
+            method='POST'
+        )
+        response.say("I didn't hear a time. Let me try again.", voice='Polly.Joanna')
+        response.redirect(f'/twilio-ivr?step=got_name&problem={requests.utils.quote(user_problem)}')
+    elif step == 'got_time':
+        response.say(
+            f"Great. So you can visit at {appointment_time}.",
+            voice='Polly.Joanna',
+            language='en-US'
+        )
+        response.pause(length=1)
+        response.say(
+            "Please say yes to confirm, or no if you cannot make it.",
+            voice='Polly.Joanna',
+            language='en-US'
+        )
+        gather = response.gather(
+            input='speech',
+            timeout=5,
+            speech_timeout='auto',
+            action=f'/twilio-ivr?step=confirmation&problem={requests.utils.quote(user_problem)}',
+            method='POST'
+        )
+        response.say("I didn't hear a response.", voice='Polly.Joanna')
+        response.redirect(f'/twilio-ivr?step=got_time&problem={requests.utils.quote(user_problem)}')
+    elif step == 'confirmation':
+        if confirmed:
+            response.say(
+                f"Perfect! Appointment confirmed for {appointment_time}. The user will be notified. Thank you!",
+                voice='Polly.Joanna',
+                language='en-US'
+            )
+        else:
+            response.say(
+                "Understood. We will find another technician. Thank you for your time.",
+                voice='Polly.Joanna',
+                language='en-US'
+            )
+        response.hangup()
+    else:
+        response.say(
+            "This is IT Support. We will contact you shortly. Thank you.",
+            voice='Polly.Joanna',
+            language='en-US'
+        )
+        response.hangup()
+    return str(response)
+
+
+def template_twiml(step, user_problem, tech_name='', ctx_problem='', appointment_time='', confirmed=False):
+    if step == 'greet':
+        return ivr.render('greet', problem=user_problem)
+    if step == 'got_name':
+        return ivr.render('got_name', problem=user_problem, tech_name=tech_name, user_problem=ctx_problem)
+    if step == 'got_time':
+        return ivr.render('got_time', problem=user_problem, appointment_time=appointment_time)
+    if step == 'confirmation':
+        return ivr.render('confirmed', appointment_time=appointment_time) if confirmed else ivr.render('declined')
+    return ivr.render('unknown')
+
+
+ALPHABET = 'abc XYZ 0123&<>"\'\t\r\n%/?=#;é漢😀{}'
+
+
+def make_cases(count: int) -> list[tuple]:
+    rng = random.Random(3)
+
+    def text():
+        return ''.join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 24)))
+    steps = ['greet', 'got_name', 'got_time', 'confirmation', 'unknown']
+    return [(steps[i % len(steps)], text(), text(), text(), text(), rng.random() < 0.5) for i in range(count)]
+
+
+def time_per_call(fn, cases, rounds):
+    start = time.perf_counter()
+    for i in range(rounds):
+        fn(*cases[i % len(cases)])
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cases', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=20000)
+    args = parser.parse_args()
+
+    cases = make_cases(args.cases)
+    mismatches = 0
+    for case in cases:
+        expected, got = legacy_twiml(*case), template_twiml(*case)
+        if expected != got:
+            mismatches += 1
+            print(f"MISMATCH {case!r}:\n  legacy   {expected}\n  template {got}")
+    print(f"{len(cases)} fuzzed responses, {mismatches} mismatches")
+
+    legacy = time_per_call(legacy_twiml, cases, args.rounds)
+    template = time_per_call(template_twiml, cases, args.rounds)
+    print(f"VoiceResponse per request {legacy * 1e6:8.2f} us/response")
+    print(f"precompiled template      {template * 1e6:8.2f} us/response  ({legacy / template:.1f}x)")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,329 @@
+"""Local stand-ins for the upstream services, for load tests and manual runs.
+
+    python benchmarks/fakes.py twilio --port 8801 --latency 0.2 --fail-rate 0.1
+
+then point the backend at it with TWILIO_API_BASE=http://127.0.0.1:8801
+(ELEVENLABS_API_BASE for the elevenlabs fake, GOOGLE_SPEECH_ENDPOINT=<url>/speech-api/v2/recognize
+for the google fake). The twilio fake also serves call
+recordings at /2010-04-01/Accounts/<sid>/Recordings/<sid>.wav, and with --answer-calls it
+answers placed calls and walks the backend's IVR (PUBLIC_BASE_URL must reach the backend).
+"""
+import re
+import sys
+import json
+import math
+import array
+import struct
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # the default backlog of 5 stalls load tests on SYN retries
+
+
+class FakeService:
+    """Threaded HTTP server with configurable latency and failure injection"""
+
+    def __init__(self, handler_cls, port: int = 0, latency: float = 0.0, fail_rate: float = 0.0):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.requests = []
+        self.calls = None  # twilio: a CallSimulator that plays the called party
+        self._lock = threading.Lock()
+        service = self
+
+        class Handler(handler_cls):
+            pass
+        Handler.service = service
+        self.server = _Server(('127.0.0.1', port), Handler)
+        self.port = self.server.server_address[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._thread = None
+
+    def record(self, entry: dict):
+        with self._lock:
+            self.requests.append(entry)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    service: FakeService = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self) -> bytes:
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send(self, status: int, body: bytes, content_type: str = 'application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, status: int, obj):
+        self._send(status, json.dumps(obj).encode())
+
+    def _simulate(self) -> bool:
+        """Sleep for the configured latency; True if this request should fail"""
+        if self.service.latency:
+            time.sleep(self.service.latency)
+        return random.random() < self.service.fail_rate
+
+
+def _wav(seconds: float, rate: int = 8000) -> bytes:
+    """Mono 16-bit WAV of a warbling tone, the shape of a Twilio call recording"""
+    n = int(seconds * rate)
+    t = [i / rate for i in range(n)]
+    samples = array.array('h', (int(8000 * math.sin(2 * math.pi * 220 * x) * (0.6 + 0.4 * math.sin(2 * math.pi * 0.5 * x)))
+                                for x in t))
+    if sys.byteorder != 'little':
+        samples.byteswap()
+    data = samples.tobytes()
+    return (b'RIFF' + struct.pack('<I', 36 + len(data)) + b'WAVEfmt ' +
+            struct.pack('<IHHIIHH', 16, 1, 1, rate, rate * 2, 2, 16) + b'data' + struct.pack('<I', len(data)) + data)
+
+
+class TwilioHandler(_Handler):
+    CALLS = re.compile(r'^/2010-04-01/Accounts/([^/]+)/Calls\.json$')
+    CALL = re.compile(r'^/2010-04-01/Accounts/([^/]+)/Calls/([^/]+)\.json$')
+    RECORDING = re.compile(r'^/2010-04-01/Accounts/([^/]+)/Recordings/([^/.]+)(\.wav)?$')
+    RECORDING_SECONDS = 30.0
+    CHUNK_BYTES = 16 * 1024
+    _recordings = {}
+
+    def do_GET(self):
+        self.service.record({'method': 'GET', 'path': self.path})
+        m = self.RECORDING.match(self.path.split('?', 1)[0])
+        if not m:
+            return self._json(404, {'code': 20404, 'message': 'Not found'})
+        if self._simulate():
+            return self._json(503, {'code': 20503, 'message': 'Service unavailable (injected)'})
+        body = self._recordings.get(self.RECORDING_SECONDS)
+        if body is None:
+            body = self._recordings[self.RECORDING_SECONDS] = _wav(self.RECORDING_SECONDS)
+        self.send_response(200)
+        self.send_header('Content-Type', 'audio/x-wav')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for i in range(0, len(body), self.CHUNK_BYTES):
+            chunk = body[i:i + self.CHUNK_BYTES]
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+        self.wfile.write(b'0\r\n\r\n')
+
+    def do_POST(self):
+        form = {k: v[0] for k, v in parse_qs(self._body().decode()).items()}
+        self.service.record({'method': 'POST', 'path': self.path, 'form': form})
+        if self._simulate():
+            return self._json(503, {'code': 20503, 'message': 'Service unavailable (injected)'})
+        if self.CALLS.match(self.path):
+            sid = 'CA' + uuid.uuid4().hex
+            if self.service.calls:
+                self.service.calls.start(sid, form)
+            return self._json(201, {'sid': sid, 'status': 'queued', 'to': form.get('To')})
+        m = self.CALL.match(self.path)
+        if m:
+            if self.service.calls and form.get('Status') in ('canceled', 'completed'):
+                self.service.calls.hang_up(m.group(2))
+            return self._json(200, {'sid': m.group(2), 'status': form.get('Status', 'in-progress')})
+        self._json(404, {'code': 20404, 'message': 'Not found'})
+
+
+class CallSimulator:
+    """Plays the technician on calls placed through the twilio fake.
+
+    Each call rings for a while, may go unanswered, and otherwise walks the IVR like Twilio
+    would: fetch the call's Url, then post SpeechResult to each <Gather> action in turn,
+    ending with a yes or no. A hang-up (Calls/<sid>.json with Status=completed) stops the walk.
+    The StatusCallback, if any, gets the final CallStatus.
+    """
+    GATHER_ACTION = re.compile(r'<Gather [^>]*action="([^"]+)"')
+
+    def __init__(self, answer_rate: float = 0.8, confirm_rate: float = 0.5,
+                 ring: tuple[float, float] = (1.0, 4.0), think: float = 0.5, seed: int | None = None):
+        self.answer_rate = answer_rate
+        self.confirm_rate = confirm_rate
+        self.ring = ring
+        self.think = think
+        self.outcomes = {}  # call sid -> 'no-answer' | 'confirmed' | 'declined' | 'taken' | 'hung-up'
+        self._hangups = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def start(self, sid: str, form: dict):
+        with self._lock:
+            ring = self._rng.uniform(*self.ring)
+            answers = self._rng.random() < self.answer_rate
+            confirms = self._rng.random() < self.confirm_rate
+            self._hangups[sid] = threading.Event()
+        threading.Thread(target=self._call, args=(sid, form, ring, answers, confirms), daemon=True).start()
+
+    def hang_up(self, sid: str):
+        with self._lock:
+            hangup = self._hangups.get(sid)
+        if hangup:
+            hangup.set()
+
+    def _call(self, sid: str, form: dict, ring: float, answers: bool, confirms: bool):
+        import html
+        import requests
+        from urllib.parse import urljoin
+        hangup = self._hangups[sid]
+        status, outcome = 'completed', 'hung-up'
+        if hangup.wait(ring):
+            status = 'canceled'
+        elif not answers:
+            status, outcome = 'no-answer', 'no-answer'
+        else:
+            url, values = form['Url'], {'CallSid': sid}
+            speech = [f"Technician {form.get('To', '')[-4:]}", self._rng.choice(['10 am', 'noon', '3 pm']),
+                      'yes' if confirms else 'no']
+            try:
+                for said in [None] + speech:
+                    if said is not None:
+                        if hangup.wait(self.think):
+                            break
+                        values['SpeechResult'] = said
+                    twiml = requests.post(url, data=values, timeout=10).text
+                    action = self.GATHER_ACTION.search(twiml)
+                    if not action:
+                        outcome = ('taken' if 'already taken' in twiml else
+                                   'confirmed' if 'confirmed' in twiml else 'declined')
+                        break
+                    url = urljoin(url, html.unescape(action.group(1)))
+            except requests.RequestException:
+                status = 'failed'
+        with self._lock:
+            self.outcomes[sid] = outcome if status != 'canceled' else 'hung-up'
+            self._hangups.pop(sid, None)
+        if form.get('StatusCallback'):
+            try:
+                requests.post(form['StatusCallback'], data={'CallSid': sid, 'CallStatus': status}, timeout=10)
+            except requests.RequestException:
+                pass
+
+
+class ElevenLabsHandler(_Handler):
+    """Streams a fixed-size fake MP3 body in chunks after the configured first-byte latency"""
+    STREAM = re.compile(r'^/v1/text-to-speech/([^/]+)/stream$')
+    BODY_BYTES = 24 * 1024
+    CHUNK_BYTES = 4096
+
+    def do_POST(self):
+        payload = json.loads(self._body() or b'{}')
+        self.service.record({'method': 'POST', 'path': self.path, 'text': payload.get('text')})
+        if not self.STREAM.match(self.path):
+            return self._json(404, {'detail': 'Not found'})
+        if self._simulate():
+            return self._json(500, {'detail': 'Upstream error (injected)'})
+        self.send_response(200)
+        self.send_header('Content-Type', 'audio/mpeg')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        body = b'\xff\xfb' + bytes(self.BODY_BYTES - 2)
+        for i in range(0, len(body), self.CHUNK_BYTES):
+            chunk = body[i:i + self.CHUNK_BYTES]
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+        self.wfile.write(b'0\r\n\r\n')
+
+
+# Fake recognition: utterance i is a warbling tone at TONE_BASE_HZ + i * TONE_STEP_HZ, so the
+# fake can tell which scripted sentence it was sent without a real model
+TONE_BASE_HZ = 300.0
+TONE_STEP_HZ = 40.0
+TONE_MAX_INDEX = 80
+
+
+def tone_utterance(index: int, seconds: float = 1.5, rate: int = 16000, lead: float = 0.4) -> bytes:
+    """WAV for scripted utterance `index`: tone surrounded by quiet noise, like a recorded turn"""
+    import numpy as np
+    rng = np.random.default_rng(index)
+    t = np.arange(int(seconds * rate)) / rate
+    speech = np.sin(2 * np.pi * (TONE_BASE_HZ + index * TONE_STEP_HZ) * t) * (0.55 + 0.45 * np.sin(2 * np.pi * 4 * t))
+    quiet = int(lead * rate)
+    pcm = np.concatenate([rng.standard_normal(quiet) * 30, speech * 9000, rng.standard_normal(quiet) * 30]).astype('<i2')
+    return (b'RIFF' + struct.pack('<I', 36 + pcm.nbytes) + b'WAVEfmt ' +
+            struct.pack('<IHHIIHH', 16, 1, 1, rate, rate * 2, 2, 16) + b'data' + struct.pack('<I', pcm.nbytes) +
+            pcm.tobytes())
+
+
+def tone_index(samples, rate: int) -> int | None:
+    import numpy as np
+    if not len(samples):
+        return None
+    spectrum = np.abs(np.fft.rfft(samples.astype(np.float32)))
+    peak = np.argmax(spectrum[1:]) + 1
+    index = round((peak * rate / len(samples) - TONE_BASE_HZ) / TONE_STEP_HZ)
+    return index if 0 <= index <= TONE_MAX_INDEX else None
+
+
+class GoogleSpeechHandler(_Handler):
+    """Google Speech v2 stand-in: decodes the FLAC body and answers with transcripts[tone index]"""
+    transcripts: list[str] = []
+
+    def do_POST(self):
+        import io
+        import soundfile
+        body = self._body()
+        self.service.record({'method': 'POST', 'path': self.path, 'bytes': len(body)})
+        if self._simulate():
+            return self._send(500, b'', 'text/plain')
+        samples, rate = soundfile.read(io.BytesIO(body), dtype='int16')
+        index = tone_index(samples, rate)
+        lines = ['{"result":[]}']
+        if index is not None and index < len(self.transcripts):
+            lines.append(json.dumps({'result': [{'alternative': [{'transcript': self.transcripts[index],
+                                                                  'confidence': 0.92}], 'final': True}],
+                                     'result_index': 0}))
+        self._send(200, ('\n'.join(lines) + '\n').encode(), 'application/json; charset=utf-8')
+
+
+SERVICES = {
+    'twilio': TwilioHandler,
+    'elevenlabs': ElevenLabsHandler,
+    'google': GoogleSpeechHandler,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('service', choices=sorted(SERVICES))
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--answer-calls', action='store_true',
+                        help='twilio: ring, answer and walk the IVR of placed calls (see CallSimulator)')
+    parser.add_argument('--answer-rate', type=float, default=0.8)
+    parser.add_argument('--confirm-rate', type=float, default=0.5)
+    args = parser.parse_args()
+    svc = FakeService(SERVICES[args.service], args.port, args.latency, args.fail_rate)
+    if args.answer_calls:
+        svc.calls = CallSimulator(args.answer_rate, args.confirm_rate)
+    print(f"fake {args.service} listening on {svc.url}")
+    try:
+        svc.server.serve_forever()
+    except KeyboardInterrupt:
+        svc.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""Concurrent-session load test: Flask server vs the async server.
+
+Each target is started in a subprocess against a fake ElevenLabs with the given upstream
+latency, then driven by `--concurrency` simulated clients over keep-alive connections.
+
+    python benchmarks/load_test.py [--targets flask,async] [--route tts|ivr|mix]
+                                   [--concurrency 200] [--requests 2000] [--latency 0.25]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import itertools
+import subprocess
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeService, ElevenLabsHandler
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = {
+    'flask': lambda port: [sys.executable, '-c',
+                           f"import app; app.app.run(host='127.0.0.1', port={port}, threaded=True)"],
+    'async': lambda port: [sys.executable, 'async_server.py', '--port', str(port)],
+}
+
+
+def free_port() -> int:
+    import socket
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_target(name: str, port: int, upstream: str, concurrency: int, cache_dir: str) -> subprocess.Popen:
+    env = dict(os.environ,
+               TTS_BACKEND='elevenlabs', ELEVENLABS_API_BASE=upstream,
+               ELEVENLABS_API_KEY='load-test', ELEVENLABS_VOICE_ID='load-test',
+               TTS_CACHE_DIR=cache_dir, TTS_PREWARM='0',
+               TICKET_DB=os.path.join(cache_dir, 'tickets.db'), RECORDING_DB=os.path.join(cache_dir, 'recordings.db'),
+               UPSTREAM_ELEVENLABS_POOL_SIZE=str(concurrency),
+               UPSTREAM_ELEVENLABS_BREAKER_THRESHOLD='1000000')
+    return subprocess.Popen(TARGETS[name](port), cwd=BACKEND_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_ready(base: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(f"{base}/ready") as r:
+                    if r.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f"{base} did not come up")
+
+
+async def one_request(session: aiohttp.ClientSession, base: str, route: str, n: int) -> bool:
+    if route == 'mix':
+        route = 'tts' if n % 2 else 'ivr'
+    if route == 'tts':
+        # Unique text so every request is a cache miss that goes upstream
+        req = session.post(f"{base}/tts", json={'text': f"load test sentence number {n}"})
+    else:
+        req = session.post(f"{base}/twilio-ivr?step=got_name&problem=wifi",
+                           data={'CallSid': f"CA{n}", 'SpeechResult': 'Ravi'})
+    async with req as r:
+        await r.read()
+        return r.status == 200
+
+
+async def drive(base: str, route: str, concurrency: int, total: int) -> dict:
+    latencies, errors = [], 0
+    counter = itertools.count()
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=120)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        async def client():
+            nonlocal errors
+            while (n := next(counter)) < total:
+                start = time.perf_counter()
+                try:
+                    ok = await one_request(session, base, route, n)
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    ok = False
+                latencies.append(time.perf_counter() - start)
+                errors += not ok
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+    return {'requests': total, 'errors': errors, 'seconds': elapsed, 'rps': total / elapsed,
+            'p50': pct(0.50), 'p95': pct(0.95), 'p99': pct(0.99)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--targets', default='flask,async')
+    parser.add_argument('--route', choices=['tts', 'ivr', 'mix'], default='tts')
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.25, help='fake upstream first-byte latency (s)')
+    args = parser.parse_args()
+
+    upstream = FakeService(ElevenLabsHandler, latency=args.latency).start()
+    print(f"route={args.route} concurrency={args.concurrency} requests={args.requests} "
+          f"upstream latency={args.latency * 1000:.0f}ms")
+    print(f"{'target':<8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    try:
+        for name in args.targets.split(','):
+            port = free_port()
+            with tempfile.TemporaryDirectory() as cache_dir:
+                proc = start_target(name, port, upstream.url, args.concurrency, cache_dir)
+                try:
+                    base = f"http://127.0.0.1:{port}"
+                    asyncio.run(wait_ready(base))
+                    r = asyncio.run(drive(base, args.route, args.concurrency, args.requests))
+                finally:
+                    proc.terminate()
+                    proc.wait(timeout=10)
+            print(f"{name:<8} {r['rps']:>8.1f} {r['p50']:>8.1f} {r['p95']:>8.1f} {r['p99']:>8.1f} {r['errors']:>7}")
+    finally:
+        upstream.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+CALL_CONTEXT_BACKEND = os.getenv('CALL_CONTEXT_BACKEND', 'memory').lower()
+CALL_CONTEXT_TTL = float(os.getenv('CALL_CONTEXT_TTL', '1800'))
+CALL_CONTEXT_MAX = int(os.getenv('CALL_CONTEXT_MAX', '10000'))
+CALL_CONTEXT_DB = os.getenv('CALL_CONTEXT_DB') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'call_contexts.db')
+
+
+class CallContextStore:
+    """Per-call IVR state keyed by CallSid. Every write refreshes the entry's TTL."""
+    name = 'base'
+
+    def setdefault(self, call_sid: str, defaults: dict) -> dict:
+        """Return the context for a call, creating it from `defaults` if missing or expired"""
+        raise NotImplementedError
+
+    def update(self, call_sid: str, **fields) -> dict:
+        """Atomically merge `fields` into the context and return the result"""
+        raise NotImplementedError
+
+    def pop(self, call_sid: str) -> dict | None:
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+
+class MemoryCallContextStore(CallContextStore):
+    """Single-process store; least recently written calls are dropped beyond `max_entries`"""
+    name = 'memory'
+
+    def __init__(self, ttl: float = CALL_CONTEXT_TTL, max_entries: int = CALL_CONTEXT_MAX):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # call_sid -> (expires, ctx)
+        self._lock = threading.Lock()
+
+    def _live(self, call_sid: str, now: float) -> dict | None:
+        entry = self._entries.get(call_sid)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del self._entries[call_sid]
+            return None
+        return entry[1]
+
+    def _store(self, call_sid: str, ctx: dict, now: float):
+        self._entries[call_sid] = (now + self.ttl, ctx)
+        self._entries.move_to_end(call_sid)
+        # Oldest writes sit at the front, so expired entries are always found there first
+        while self._entries:
+            oldest, (expires, _) = next(iter(self._entries.items()))
+            if expires > now and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[oldest]
+
+    def setdefault(self, call_sid: str, defaults: dict) -> dict:
+        now = time.time()
+        with self._lock:
+            ctx = self._live(call_sid, now)
+            if ctx is None:
+                ctx = dict(defaults)
+                self._store(call_sid, ctx, now)
+            return dict(ctx)
+
+    def update(self, call_sid: str, **fields) -> dict:
+        now = time.time()
+        with self._lock:
+            ctx = dict(self._live(call_sid, now) or {})
+            ctx.update(fields)
+            self._store(call_sid, ctx, now)
+            return dict(ctx)
+
+    def pop(self, call_sid: str) -> dict | None:
+        with self._lock:
+            entry = self._entries.pop(call_sid, None)
+        return entry[1] if entry and entry[0] > time.time() else None
+
+    def __len__(self):
+        now = time.time()
+        with self._lock:
+            while self._entries and next(iter(self._entries.values()))[0] <= now:
+                self._entries.popitem(last=False)
+            return len(self._entries)
+
+
+class SqliteCallContextStore(CallContextStore):
+    """Shared store for multi-worker deployments; every worker on the host opens the same WAL database"""
+    name = 'sqlite'
+    PURGE_SECONDS = 60
+
+    def __init__(self, path: str = CALL_CONTEXT_DB, ttl: float = CALL_CONTEXT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._purged = 0.0
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS call_contexts ('
+            'call_sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS call_contexts_expires ON call_contexts (expires)')
+        # Not kept for this thread: under gunicorn's preload_app that is the master, and an
+        # SQLite connection must not be carried across fork into the workers
+        conn.close()
+        del self._local.conn
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _write(self, call_sid: str, merge) -> dict:
+        """Read-modify-write under a write lock so concurrent steps for one call cannot interleave"""
+        conn = self._conn()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT data FROM call_contexts WHERE call_sid = ? AND expires > ?', (call_sid, now)
+            ).fetchone()
+            ctx = merge(json.loads(row[0]) if row else None)
+            conn.execute(
+                'INSERT OR REPLACE INTO call_contexts (call_sid, data, expires) VALUES (?, ?, ?)',
+                (call_sid, json.dumps(ctx), now + self.ttl)
+            )
+            if now - self._purged >= self.PURGE_SECONDS:
+                self._purged = now
+                conn.execute('DELETE FROM call_contexts WHERE expires <= ?', (now,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return ctx
+
+    def setdefault(self, call_sid: str, defaults: dict) -> dict:
+        return self._write(call_sid, lambda ctx: ctx if ctx is not None else dict(defaults))
+
+    def update(self, call_sid: str, **fields) -> dict:
+        return self._write(call_sid, lambda ctx: {**(ctx or {}), **fields})
+
+    def pop(self, call_sid: str) -> dict | None:
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT data, expires FROM call_contexts WHERE call_sid = ?', (call_sid,)
+            ).fetchone()
+            conn.execute('DELETE FROM call_contexts WHERE call_sid = ?', (call_sid,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return json.loads(row[0]) if row and row[1] > time.time() else None
+
+    def __len__(self):
+        row = self._conn().execute('SELECT COUNT(*) FROM call_contexts WHERE expires > ?', (time.time(),)).fetchone()
+        return row[0]
+
+
+STORES = {
+    'memory': MemoryCallContextStore,
+    'sqlite': SqliteCallContextStore,
+}
+
+
+def create_store(backend: str = CALL_CONTEXT_BACKEND) -> CallContextStore:
+    return STORES[backend]()
@@ -0,0 +1,385 @@
+import os
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import telemetry
+import tickets
+
+log = telemetry.get_logger('dispatch')
+
+DISPATCH_WORKERS = int(os.getenv('DISPATCH_WORKERS', '4'))
+DISPATCH_RETRIES = int(os.getenv('DISPATCH_RETRIES', '2'))
+DISPATCH_BACKOFF_SECONDS = float(os.getenv('DISPATCH_BACKOFF_SECONDS', '1.0'))
+DISPATCH_MAX_CANDIDATES = int(os.getenv('DISPATCH_MAX_CANDIDATES', '3'))
+DISPATCH_JOB_TTL = float(os.getenv('DISPATCH_JOB_TTL', '3600'))
+# Technicians dialed at once per ticket; 1 calls them one after another
+DISPATCH_PARALLEL_CALLS = int(os.getenv('DISPATCH_PARALLEL_CALLS', '3'))
+DISPATCH_CONFIRM_TIMEOUT = float(os.getenv('DISPATCH_CONFIRM_TIMEOUT', '120'))
+
+QUEUED, CALLING, RINGING, PLACED, CONFIRMED, FAILED = 'queued', 'calling', 'ringing', 'placed', 'confirmed', 'failed'
+
+# Where each finished job leaves its ticket
+TICKET_STATUS = {PLACED: tickets.DISPATCHED, CONFIRMED: tickets.SCHEDULED, FAILED: tickets.ESCALATED}
+
+# Per-call states; Twilio's own terminal statuses (busy, no-answer, ...) are stored as reported
+LEG_RINGING, LEG_CONFIRMED, LEG_DECLINED, LEG_CANCELED = 'ringing', 'confirmed', 'declined', 'canceled'
+
+
+class DispatchJob:
+    __slots__ = ('id', 'status', 'problem_type', 'user_problem', 'diag_answers', 'events',
+                 'final', 'technician', 'call_sid', 'attempts', 'created', 'updated',
+                 'parallel', 'calls', 'appointment_time', 'timer', 'ticket_id')
+
+    def __init__(self, problem_type: str, user_problem: str, diag_answers: list[str], ticket_id: str = ''):
+        self.id = uuid.uuid4().hex
+        self.ticket_id = ticket_id
+        self.status = QUEUED
+        self.problem_type = problem_type
+        self.user_problem = user_problem
+        self.diag_answers = list(diag_answers or [])
+        self.events = []
+        self.final = ''
+        self.technician = ''
+        self.call_sid = ''
+        self.attempts = 0
+        self.created = self.updated = time.time()
+        self.parallel = False
+        self.calls = {}  # call_sid -> [technician name, leg state]
+        self.appointment_time = ''
+        self.timer = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in (PLACED, CONFIRMED, FAILED)
+
+    def to_dict(self) -> dict:
+        return {
+            'jobId': self.id, 'status': self.status, 'done': self.done,
+            'events': list(self.events), 'final': self.final,
+            'technician': self.technician, 'callSid': self.call_sid, 'attempts': self.attempts,
+            'appointmentTime': self.appointment_time, 'ticketId': self.ticket_id,
+            'calls': [{'callSid': sid, 'technician': name, 'status': state}
+                      for sid, (name, state) in self.calls.items()],
+        }
+
+
+class Dispatcher:
+    """Places technician calls on a worker pool so the conversation request returns immediately.
+
+    Each job walks the ranked candidates for its problem type. Transient failures (timeouts,
+    5xx, 429) are retried with exponential backoff; anything else moves on to the next
+    technician.
+
+    With parallel_calls > 1 and more than one specialist on shift, up to parallel_calls of them
+    are dialed at once instead. The job then stays 'ringing' until one of them says yes in the
+    IVR (confirm), which hangs up the others, or until every call is declined or over, or
+    confirm_timeout passes. The first yes claims the ticket in the shared ticket store, so it
+    wins even when the IVR webhook reaches a worker other than the one that placed the calls.
+    """
+
+    def __init__(self, agent, workers: int = DISPATCH_WORKERS, retries: int = DISPATCH_RETRIES,
+                 backoff: float = DISPATCH_BACKOFF_SECONDS, max_candidates: int = DISPATCH_MAX_CANDIDATES,
+                 parallel_calls: int = DISPATCH_PARALLEL_CALLS, confirm_timeout: float = DISPATCH_CONFIRM_TIMEOUT):
+        self.agent = agent
+        self.retries = retries
+        self.backoff = backoff
+        self.max_candidates = max_candidates
+        self.parallel_calls = max(1, parallel_calls)
+        self.confirm_timeout = confirm_timeout
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dispatch')
+        # Bounds the calls being placed at once across all jobs
+        self._dialer = ThreadPoolExecutor(max_workers=workers * self.parallel_calls, thread_name_prefix='dispatch-dial')
+        # Hang-ups get their own threads: every job worker may be blocked waiting on its dialers
+        self._hangups = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dispatch-hangup')
+        self._jobs = {}
+        self._calls = {}  # call_sid -> job, for the IVR and status callbacks
+        self._lock = threading.Lock()
+
+    def submit(self, problem_type: str, user_problem: str, diag_answers: list[str], ticket_id: str = '') -> DispatchJob:
+        job = DispatchJob(problem_type, user_problem, diag_answers, ticket_id)
+        with self._lock:
+            self._evict_expired()
+            self._jobs[job.id] = job
+        self._pool.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> DispatchJob | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _evict_expired(self):
+        cutoff = time.time() - DISPATCH_JOB_TTL
+        for jid in [jid for jid, j in self._jobs.items() if j.done and j.updated < cutoff]:
+            for call_sid in self._jobs[jid].calls:
+                self._calls.pop(call_sid, None)
+            del self._jobs[jid]
+
+    def _update(self, job: DispatchJob, status: str | None = None, event: str | None = None):
+        with self._lock:
+            if status:
+                job.status = status
+            if event:
+                job.events.append(event)
+            job.updated = time.time()
+            if status in TICKET_STATUS:
+                self._record(job)
+
+    def _record(self, job: DispatchJob):
+        """Write the outcome to the job's ticket (queued, so cheap under the lock). Only a
+        confirmation may overwrite another worker's confirmation of the ticket."""
+        if job.ticket_id:
+            self.agent.tickets.update(job.ticket_id, TICKET_STATUS[job.status], {
+                'jobId': job.id, 'status': job.status, 'technician': job.technician, 'callSid': job.call_sid,
+                'appointmentTime': job.appointment_time, 'attempts': job.attempts, 'final': job.final,
+            }, unclaimed=job.status != CONFIRMED)
+
+    def _run(self, job: DispatchJob):
+        try:
+            self._dispatch(job)
+        except Exception as e:
+            log.error(f"[Dispatch] Job {job.id} crashed: {e}")
+            job.final = "Technical error while contacting technician. Your urgent ticket has been logged; support will call you within 30 minutes."
+            self._update(job, FAILED, f"Unexpected dispatch error: {e}")
+
+    def _candidates(self, job: DispatchJob) -> list:
+        candidates = self.agent.technicians.candidates(job.problem_type)[:self.max_candidates]
+        if not candidates:
+            fallback = self.agent.select_technician(job.problem_type)
+            candidates = [fallback] if fallback else []
+        return candidates
+
+    def _dispatch(self, job: DispatchJob):
+        candidates = self._candidates(job)
+        if not candidates:
+            result = self.agent.call_technician(None, job.user_problem, job.diag_answers)
+            job.final = result['final']
+            for event in result['events']:
+                self._update(job, event=event)
+            self._update(job, FAILED)
+            return
+        if self.parallel_calls > 1:
+            # Only specialists on shift are rung together; anyone else is tried one at a time
+            on_shift = self.agent.technicians.available_now(job.problem_type)
+            if len(on_shift) > 1:
+                return self._broadcast(job, on_shift[:self.parallel_calls])
+        self._update(job, CALLING)
+        for tech in candidates:
+            job.technician = tech.name
+            result = self._place(job, tech)
+            if result.get('ok'):
+                job.call_sid = result.get('callSid', '')
+                job.final = result.get('final', '')
+                with self._lock:
+                    self._track(job, job.call_sid, tech.name)
+                self._update(job, PLACED)
+                log.info(f"[Dispatch] Job {job.id}: call placed to {tech.name} after {job.attempts} attempt(s)")
+                return
+            if result.get('degraded'):
+                break
+            if tech is not candidates[-1]:
+                self._update(job, event=f"{tech.name} unreachable, trying the next technician.")
+        job.final = result.get('final', '')
+        self._update(job, FAILED)
+        log.warning(f"[Dispatch] Job {job.id}: all {len(candidates)} candidate(s) failed")
+
+    def _place(self, job: DispatchJob, tech) -> dict:
+        """Call one technician, retrying transient failures; returns the last call_technician result"""
+        for attempt in range(self.retries + 1):
+            with self._lock:
+                job.attempts += 1
+            result = self.agent.call_technician(tech, job.user_problem, job.diag_answers, job.ticket_id)
+            for event in result.get('events', []):
+                self._update(job, event=event)
+            if result.get('ok') or result.get('degraded') or not result.get('retryable') or attempt == self.retries:
+                return result
+            delay = self.backoff * (2 ** attempt)
+            self._update(job, event=f"Retrying {tech.name} in {delay:.1f}s...")
+            time.sleep(delay)
+        return result
+
+    def _track(self, job: DispatchJob, call_sid: str, tech_name: str):
+        if call_sid:
+            job.calls[call_sid] = [tech_name, LEG_RINGING]
+            self._calls[call_sid] = job
+
+    # --- parallel dispatch ---
+
+    def _broadcast(self, job: DispatchJob, techs: list):
+        job.parallel = True
+        self._update(job, CALLING, f"Calling {len(techs)} technicians at once; the first to confirm takes the ticket.")
+        results = list(self._dialer.map(lambda tech: self._ring(job, tech), techs))
+        with self._lock:
+            if job.status != CALLING:
+                return  # someone confirmed while the other calls were still being placed
+            if not job.calls:
+                job.final = next((r.get('final') for r in results if r.get('final')), '')
+                job.status = FAILED
+                job.updated = time.time()
+                self._record(job)
+                log.warning(f"[Dispatch] Job {job.id}: none of {len(techs)} call(s) could be placed")
+                return
+            job.status = RINGING
+            job.final = "No technician confirmed in time. Your urgent ticket is escalated; expect a call within 30 minutes."
+            job.updated = time.time()
+            job.timer = threading.Timer(self.confirm_timeout, self._expire, (job,))
+            job.timer.daemon = True
+            job.timer.start()
+            log.info(f"[Dispatch] Job {job.id}: ringing {len(job.calls)} technician(s)")
+            others = self._settle(job)  # every call may already have been declined, ended or confirmed
+        self._hang_up(job, others)
+
+    def _ring(self, job: DispatchJob, tech) -> dict:
+        result = self._place(job, tech)
+        call_sid = result.get('callSid', '') if result.get('ok') else ''
+        if not call_sid:
+            return result
+        with self._lock:
+            late = job.done
+            if late:
+                job.calls[call_sid] = [tech.name, LEG_CANCELED]
+                self._calls[call_sid] = job
+            else:
+                self._track(job, call_sid, tech.name)
+        if late:
+            self._hang_up(job, [call_sid])
+        return result
+
+    def confirm(self, call_sid: str, appointment_time: str, ticket_id: str = '') -> bool:
+        """A technician said yes in the IVR. False if another call already took the ticket.
+
+        The ticket is claimed in the shared store first (outside the lock: the claim waits on
+        SQLite), so of all the yeses across workers exactly one wins. A call this process didn't
+        place is settled by that claim alone; without a ticket to claim it is refused, since
+        nothing here can say the job is still open.
+        """
+        with self._lock:
+            job = self._calls.get(call_sid)
+            if job is not None:
+                leg = job.calls[call_sid]
+                if job.status in (CONFIRMED, FAILED) or leg[1] != LEG_RINGING:
+                    if leg[1] == LEG_RINGING:
+                        leg[1] = LEG_CANCELED
+                    return False
+                ticket_id = job.ticket_id
+        if job is None and not ticket_id:
+            log.warning(f"[Dispatch] Refusing confirmation of unknown call {call_sid}")
+            return False
+        won = not ticket_id or self.agent.tickets.claim(ticket_id, tickets.SCHEDULED, {
+            'jobId': job.id if job else '', 'status': CONFIRMED, 'technician': leg[0] if job else '',
+            'callSid': call_sid, 'appointmentTime': appointment_time})
+        if job is None:
+            log.info(f"[Dispatch] Call {call_sid} placed elsewhere {'claimed' if won else 'lost'} ticket {ticket_id}")
+            return won
+        others = []
+        with self._lock:
+            if not won:
+                # A technician confirmed through another worker first
+                if leg[1] == LEG_RINGING:
+                    leg[1] = LEG_CANCELED
+                if job.parallel and not job.done:
+                    others = self._adopt(job) or []
+            elif not job.parallel:
+                leg[1] = LEG_CONFIRMED
+                job.appointment_time = appointment_time
+                job.status = CONFIRMED
+                job.events.append(f"{leg[0]} confirmed for {appointment_time}.")
+                job.updated = time.time()
+                self._record(job)
+            elif job.done:
+                # The job was closed while the claim ran; _settle/_expire adopted this claim
+                won = job.call_sid == call_sid
+            else:
+                others = self._confirmed(job, call_sid, appointment_time)
+                log.info(f"[Dispatch] Job {job.id}: {job.technician} confirmed, hanging up {len(others)} other call(s)")
+        self._hang_up(job, others)
+        return won
+
+    def _confirmed(self, job: DispatchJob, call_sid: str, appointment_time: str) -> list[str]:
+        """Give a parallel job to `call_sid`; returns the other calls to hang up. Caller holds the lock."""
+        leg = job.calls[call_sid]
+        leg[1] = LEG_CONFIRMED
+        job.call_sid = call_sid
+        job.technician = leg[0]
+        job.appointment_time = appointment_time
+        job.final = f"{leg[0]} confirmed and will visit or call you at {appointment_time}."
+        job.events.append(f"{leg[0]} confirmed for {appointment_time}.")
+        return self._close(job, CONFIRMED)
+
+    def _adopt(self, job: DispatchJob) -> list[str] | None:
+        """Close a job whose ticket was claimed through another worker, as _confirmed does;
+        None if nobody has. Caller holds the lock."""
+        ticket = self.agent.tickets.get(job.ticket_id) if job.ticket_id else None
+        if not ticket or ticket['status'] != tickets.SCHEDULED:
+            return None
+        claim = ticket['dispatch'] or {}
+        if claim.get('callSid') not in job.calls:
+            return None
+        return self._confirmed(job, claim['callSid'], claim.get('appointmentTime', ''))
+
+    def decline(self, call_sid: str):
+        with self._lock:
+            job = self._calls.get(call_sid)
+            if job is None or job.calls[call_sid][1] != LEG_RINGING:
+                return
+            job.calls[call_sid][1] = LEG_DECLINED
+            job.events.append(f"{job.calls[call_sid][0]} can't take it.")
+            job.updated = time.time()
+            others = self._settle(job)
+        self._hang_up(job, others)
+
+    def call_status(self, call_sid: str, status: str):
+        """Twilio StatusCallback: a call that ends while still ringing is out of the running"""
+        with self._lock:
+            job = self._calls.get(call_sid)
+            if job is None or job.calls[call_sid][1] != LEG_RINGING:
+                return
+            job.calls[call_sid][1] = status
+            if status != 'completed':
+                job.events.append(f"{job.calls[call_sid][0]}: {status.replace('-', ' ')}.")
+            job.updated = time.time()
+            others = self._settle(job)
+        self._hang_up(job, others)
+
+    def _settle(self, job: DispatchJob) -> list[str]:
+        """Close a ringing job that another worker's confirmation took, or fail it once none of
+        its calls can still confirm. Returns the calls to hang up. Caller holds the lock."""
+        if job.status != RINGING:
+            return []
+        others = self._adopt(job)
+        if others is not None:
+            return others
+        if any(state == LEG_RINGING for _, state in job.calls.values()):
+            return []
+        job.final = "None of the technicians could take it. Your urgent ticket is escalated; expect a call within 30 minutes."
+        self._close(job, FAILED)
+        log.warning(f"[Dispatch] Job {job.id}: no technician confirmed")
+        return []
+
+    def _expire(self, job: DispatchJob):
+        with self._lock:
+            if job.done:
+                return
+            others = self._adopt(job)
+            if others is None:
+                others = self._close(job, FAILED)
+                job.events.append("No technician confirmed in time.")
+                log.warning(f"[Dispatch] Job {job.id}: no confirmation after {self.confirm_timeout:.0f}s")
+        self._hang_up(job, others)
+
+    def _close(self, job: DispatchJob, status: str) -> list[str]:
+        """Finish the job and return the calls still ringing, now marked canceled. Caller holds the lock."""
+        job.status = status
+        job.updated = time.time()
+        self._record(job)
+        if job.timer:
+            job.timer.cancel()
+        others = [sid for sid, leg in job.calls.items() if leg[1] == LEG_RINGING]
+        for sid in others:
+            job.calls[sid][1] = LEG_CANCELED
+        return others
+
+    def _hang_up(self, job: DispatchJob, call_sids: list[str]):
+        for call_sid in call_sids:
+            self._hangups.submit(self.agent.cancel_call, call_sid)
@@ -0,0 +1,50 @@
+"""Production launcher, run from backend/:
+
+    gunicorn -c gunicorn.conf.py
+
+SERVER_MODE=async (default) serves async_server on aiohttp workers; one worker holds
+hundreds of concurrent sessions. SERVER_MODE=sync serves the Flask app on threaded workers.
+Both default to one worker: dispatch jobs, streams and recordings live in the process that
+created them, so WEB_CONCURRENCY > 1 needs sticky routing in front.
+
+PRELOAD_APP=1 (default) imports the app and loads the models once in the master, then forks
+the workers from it: they start ready, and share the model memory copy-on-write instead of
+each loading a copy. PRELOAD_APP=0 loads per worker, in the background; /ready reports 503
+until it is done.
+"""
+import os
+
+SERVER_MODE = os.getenv('SERVER_MODE', 'async')
+preload_app = os.getenv('PRELOAD_APP', '1') != '0'
+if preload_app:
+    os.environ.setdefault('WARM_UP', 'preload')
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '5000')}"
+timeout = 120
+graceful_timeout = 30
+keepalive = 5
+
+if SERVER_MODE == 'async':
+    wsgi_app = 'async_server:create_app'
+    worker_class = 'aiohttp.GunicornWebWorker'
+else:
+    wsgi_app = 'app:app'
+    worker_class = 'gthread'
+    threads = int(os.getenv('GUNICORN_THREADS') or 32)
+workers = int(os.getenv('WEB_CONCURRENCY') or 1)
+
+if workers > 1:
+    # IVR call state and conversation sessions must be visible to every worker.
+    # Dispatch jobs, in-flight recordings and streaming-ASR utterances still live in the
+    # worker that created them, so those routes need sticky routing (or a single worker).
+    # IVR confirmations don't: the first yes claims the ticket in the shared ticket database,
+    # and the worker that placed the calls picks that up on its next status callback.
+    os.environ.setdefault('CALL_CONTEXT_BACKEND', 'sqlite')
+    os.environ.setdefault('SESSION_BACKEND', 'sqlite')
+
+
+def post_fork(server, worker):
+    if preload_app:
+        # Threads and helper processes don't survive fork; start this worker's own
+        import app
+        app.start_background()
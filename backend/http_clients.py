@@ -0,0 +1,247 @@
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import telemetry
+
+log = telemetry.get_logger('upstream')
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+# name -> (connect timeout, read timeout, pool size)
+UPSTREAM_DEFAULTS = {
+    'twilio': (3.05, 15, 16),
+    'twilio-recordings': (3.05, 30, 8),
+    'elevenlabs': (3.05, 30, 16),
+}
+
+
+def _env(name: str, key: str, default):
+    value = os.getenv(f"UPSTREAM_{name.upper().replace('-', '_')}_{key}")
+    return type(default)(value) if value else default
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of calling an upstream whose breaker is open"""
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures; after `reset_seconds` lets one trial call through.
+
+    A trial that never reports back (its caller was cancelled) is given up after another
+    `reset_seconds`, so the breaker can't stay half-open with nothing let through.
+    """
+
+    def __init__(self, threshold: int = 5, reset_seconds: float = 30.0):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial = False
+        self._trial_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = HALF_OPEN
+                self._trial = False
+            if self.state == HALF_OPEN and self._trial and time.monotonic() - self._trial_at >= self.reset_seconds:
+                self._trial = False
+            if self.state == HALF_OPEN and not self._trial:
+                self._trial = True
+                self._trial_at = time.monotonic()
+                return True
+            return False
+
+    def release(self):
+        """The call allow() let through ended without an answer from the upstream (cancelled,
+        interrupted): neither a success nor a failure, but the trial slot is free again"""
+        with self._lock:
+            self._trial = False
+
+    def success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.threshold:
+                if self.state != OPEN:
+                    log.warning(f"[Upstream] Circuit opened after {self.failures} failure(s)")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self._trial = False
+
+
+class UpstreamMetrics:
+    def __init__(self, window: int = 1024):
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, ok: bool):
+        with self._lock:
+            self.requests += 1
+            if not ok:
+                self.errors += 1
+            self._latencies.append(seconds)
+
+    def reject(self):
+        with self._lock:
+            self.rejected += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lat = sorted(self._latencies)
+            requests_, errors, rejected = self.requests, self.errors, self.rejected
+
+        def pct(p):
+            return round(lat[min(len(lat) - 1, int(p * len(lat)))] * 1000, 1) if lat else None
+        return {'requests': requests_, 'errors': errors, 'rejected': rejected,
+                'errorRate': errors / requests_ if requests_ else 0.0,
+                'latencyMs': {'p50': pct(0.50), 'p95': pct(0.95), 'p99': pct(0.99)}}
+
+
+class OutboundClient:
+    """Keep-alive session, default timeouts, a circuit breaker and metrics for one upstream"""
+
+    def __init__(self, name: str, connect_timeout: float = 3.05, read_timeout: float = 15,
+                 pool_size: int = 16, threshold: int = 5, reset_seconds: float = 30.0,
+                 total_timeout: float | None = None):
+        self.name = name
+        self.timeout = (connect_timeout, read_timeout)
+        # aiohttp only: bounds a whole request, body included, however steadily it trickles in
+        self.total_timeout = total_timeout or connect_timeout + 2 * read_timeout
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.breaker = CircuitBreaker(threshold, reset_seconds)
+        self.metrics = UpstreamMetrics()
+        self._async_session = None
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        if not self.breaker.allow():
+            self.metrics.reject()
+            raise CircuitOpenError(f"{self.name} circuit open")
+        kwargs.setdefault('timeout', self.timeout)
+        start = time.perf_counter()
+        try:
+            resp = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            self.metrics.observe(time.perf_counter() - start, False)
+            self.breaker.failure()
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+        ok = resp.status_code < 500 and resp.status_code != 429
+        self.metrics.observe(time.perf_counter() - start, ok)
+        if ok:
+            self.breaker.success()
+        else:
+            self.breaker.failure()
+        return resp
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def async_session(self) -> 'aiohttp.ClientSession':
+        """aiohttp session for the running event loop, created on first use"""
+        import aiohttp  # only the async server needs it, and it is slow to import
+        if self._async_session is None or self._async_session.closed:
+            connect, read = self.timeout
+            self._async_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.total_timeout, sock_connect=connect, sock_read=read),
+            )
+        return self._async_session
+
+    async def arequest(self, method: str, url: str, **kwargs) -> 'aiohttp.ClientResponse':
+        """request() for the async server: same breaker and metrics, awaited on the event loop"""
+        if not self.breaker.allow():
+            self.metrics.reject()
+            raise CircuitOpenError(f"{self.name} circuit open")
+        import aiohttp
+        start = time.perf_counter()
+        try:
+            resp = await self.async_session().request(method, url, **kwargs)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.metrics.observe(time.perf_counter() - start, False)
+            self.breaker.failure()
+            raise
+        except BaseException:  # CancelledError: the caller went away, the upstream didn't fail
+            self.breaker.release()
+            raise
+        ok = resp.status < 500 and resp.status != 429
+        self.metrics.observe(time.perf_counter() - start, ok)
+        if ok:
+            self.breaker.success()
+        else:
+            self.breaker.failure()
+        return resp
+
+    async def aclose(self):
+        if self._async_session is not None:
+            await self._async_session.close()
+            self._async_session = None
+
+    def stats(self) -> dict:
+        return {'circuit': self.breaker.state, 'consecutiveFailures': self.breaker.failures,
+                **self.metrics.snapshot()}
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def client(name: str) -> OutboundClient:
+    """Shared client for an upstream; settings come from UPSTREAM_<NAME>_* env vars"""
+    c = _clients.get(name)
+    if c is None:
+        with _clients_lock:
+            c = _clients.get(name)
+            if c is None:
+                connect, read, pool = UPSTREAM_DEFAULTS.get(name, (3.05, 15, 16))
+                c = OutboundClient(
+                    name,
+                    connect_timeout=_env(name, 'CONNECT_TIMEOUT', float(connect)),
+                    read_timeout=_env(name, 'READ_TIMEOUT', float(read)),
+                    total_timeout=_env(name, 'TOTAL_TIMEOUT', 0.0) or None,
+                    pool_size=_env(name, 'POOL_SIZE', pool),
+                    threshold=_env(name, 'BREAKER_THRESHOLD', 5),
+                    reset_seconds=_env(name, 'BREAKER_RESET_SECONDS', 30.0),
+                )
+                _clients[name] = c
+    return c
+
+
+def upstream_stats() -> dict:
+    with _clients_lock:
+        clients = list(_clients.values())
+    return {c.name: c.stats() for c in clients}
+
+
+async def close_async_sessions():
+    with _clients_lock:
+        clients = list(_clients.values())
+    for c in clients:
+        await c.aclose()
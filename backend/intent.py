@@ -0,0 +1,99 @@
+import os
+import re
+import json
+from functools import lru_cache
+from typing import NamedTuple
+
+INTENTS_PATH = os.getenv('INTENTS_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'intents.json'))
+
+PROBLEM, DISPATCH, URGENT, AFFIRMATIVE = range(4)
+
+
+class Intent(NamedTuple):
+    problem_type: str
+    urgent: bool
+    dispatch: bool
+    affirmative: bool
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == '_'
+
+
+def _at_boundary(text: str, pos: int) -> bool:
+    """Same test as regex \\b at `pos`"""
+    before = pos > 0 and _is_word_char(text[pos - 1])
+    after = pos < len(text) and _is_word_char(text[pos])
+    return before != after
+
+
+class IntentClassifier:
+    """Classifies a transcript in one scan of one compiled pattern.
+
+    Every keyword from intents.json goes into a single longest-first alternation wrapped in
+    a lookahead, so finditer reports the longest keyword starting at each position.  Any
+    other keyword that matches at that position must be a prefix of it; those are
+    precomputed per keyword, which makes the result identical to testing each keyword
+    separately.  Problem types and affirmatives are whole-word matches (like `\\bkw\\b`),
+    dispatch phrases and urgency terms are plain substring matches.
+    """
+
+    def __init__(self, path: str = INTENTS_PATH):
+        with open(path, 'r', encoding='utf-8') as f:
+            table = json.load(f)
+        self.default_problem_type = table['default_problem_type']
+        self.problem_types = [entry['type'] for entry in table['problem_types']]
+
+        tags = {}
+        def add(keyword, kind, rank, whole_word):
+            tags.setdefault(keyword.lower(), set()).add((kind, rank, whole_word))
+
+        for rank, entry in enumerate(table['problem_types']):
+            for kw in entry['keywords']:
+                add(kw, PROBLEM, rank, True)
+        for kw in table['dispatch']:
+            add(kw, DISPATCH, 0, False)
+        for terms in table['urgency'].values():
+            for kw in terms:
+                add(kw, URGENT, 0, False)
+        for kw in table['affirmative']:
+            add(kw, AFFIRMATIVE, 0, True)
+
+        # keyword -> (length, kind, rank, whole_word) for itself and every keyword that is a prefix of it
+        self._hits = {}
+        for kw in tags:
+            self._hits[kw] = tuple(sorted(
+                (len(p), kind, rank, whole)
+                for p, ptags in tags.items() if kw.startswith(p)
+                for kind, rank, whole in ptags
+            ))
+        alternation = '|'.join(re.escape(kw) for kw in sorted(tags, key=len, reverse=True))
+        self._pattern = re.compile(f'(?=({alternation}))')
+        self.classify = lru_cache(maxsize=1024)(self._classify)
+
+    def cache_stats(self) -> dict:
+        info = self.classify.cache_info()
+        lookups = info.hits + info.misses
+        return {'entries': info.currsize, 'hits': info.hits, 'misses': info.misses,
+                'hitRate': info.hits / lookups if lookups else 0.0}
+
+    def _classify(self, text: str) -> Intent:
+        t = (text or '').lower()
+        best = len(self.problem_types)
+        urgent = dispatch = affirmative = False
+        for m in self._pattern.finditer(t):
+            start = m.start()
+            for length, kind, rank, whole in self._hits[m.group(1)]:
+                if whole and not (_at_boundary(t, start) and _at_boundary(t, start + length)):
+                    continue
+                if kind == PROBLEM:
+                    if rank < best:
+                        best = rank
+                elif kind == URGENT:
+                    urgent = True
+                elif kind == DISPATCH:
+                    dispatch = True
+                else:
+                    affirmative = True
+        problem_type = self.problem_types[best] if best < len(self.problem_types) else self.default_problem_type
+        return Intent(problem_type, urgent, dispatch, affirmative)
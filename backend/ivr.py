@@ -0,0 +1,139 @@
+"""TwiML for the technician IVR, precompiled from a table of steps.
+
+Each step is a list of verbs in the shape VoiceResponse takes them. On first use (or at
+warm-up) every step is serialized once by VoiceResponse itself, with a marker where each {slot} goes, and split into
+static chunks. Rendering a response is then a join of those chunks with the slot values
+escaped the way ElementTree escapes text or attributes, so the output is byte-identical to
+building the VoiceResponse per request.
+"""
+import re
+import string
+import threading
+
+from requests.utils import quote
+
+VOICE = {'voice': 'Polly.Joanna', 'language': 'en-US'}
+GATHER = {'input': 'speech', 'timeout': 5, 'speech_timeout': 'auto', 'method': 'POST'}
+
+# step -> verbs: ('say', text, attrs), ('gather', attrs), ('pause', attrs), ('redirect', url), ('hangup',)
+# {problem_url} is the URL-quoted problem from the webhook query; other slots come from the call context
+STEPS = {
+    'greet': [
+        ('say', "Hello, this is the AI support agent from IT Support. May I know who I am speaking with?", VOICE),
+        ('gather', {**GATHER, 'action': '/twilio-ivr?step=got_name&problem={problem_url}'}),
+        ('say', "I didn't hear anything. Please try again.", {'voice': 'Polly.Joanna'}),
+        ('redirect', '/twilio-ivr?step=greet&problem={problem_url}'),
+    ],
+    'got_name': [
+        ('say', "Thank you, {tech_name}. The user reported: {user_problem}. This is urgent.", VOICE),
+        ('pause', {'length': 1}),
+        ('say', "What is the earliest time you can visit or call the user?", VOICE),
+        ('gather', {**GATHER, 'action': '/twilio-ivr?step=got_time&problem={problem_url}'}),
+        ('say', "I didn't hear a time. Let me try again.", {'voice': 'Polly.Joanna'}),
+        ('redirect', '/twilio-ivr?step=got_name&problem={problem_url}'),
+    ],
+    'got_time': [
+        ('say', "Great. So you can visit at {appointment_time}.", VOICE),
+        ('pause', {'length': 1}),
+        ('say', "Please say yes to confirm, or no if you cannot make it.", VOICE),
+        ('gather', {**GATHER, 'action': '/twilio-ivr?step=confirmation&problem={problem_url}'}),
+        ('say', "I didn't hear a response.", {'voice': 'Polly.Joanna'}),
+        ('redirect', '/twilio-ivr?step=got_time&problem={problem_url}'),
+    ],
+    'confirmed': [
+        ('say', "Perfect! Appointment confirmed for {appointment_time}. The user will be notified. Thank you!", VOICE),
+        ('hangup',),
+    ],
+    'declined': [
+        ('say', "Understood. We will find another technician. Thank you for your time.", VOICE),
+        ('hangup',),
+    ],
+    'taken': [
+        ('say', "Thank you, but another technician has already taken this ticket. No visit is needed. Goodbye.", VOICE),
+        ('hangup',),
+    ],
+    'unknown': [
+        ('say', "This is IT Support. We will contact you shortly. Thank you.", VOICE),
+        ('hangup',),
+    ],
+}
+
+
+def escape_text(value: str) -> str:
+    """xml.etree.ElementTree's escaping of element text"""
+    return value.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def escape_attr(value: str) -> str:
+    """xml.etree.ElementTree's escaping of attribute values"""
+    return (escape_text(value).replace('"', '&quot;')
+            .replace('\r', '&#13;').replace('\n', '&#10;').replace('\t', '&#09;'))
+
+
+class Template:
+    """A serialized step: static chunks around (slot, escape) holes"""
+    _MARK = re.compile(r'IVRSLOT(\d+)X')
+
+    def __init__(self, verbs: list[tuple]):
+        from twilio.twiml.voice_response import VoiceResponse
+        self.holes = []
+        response = VoiceResponse()
+        for verb, *args in verbs:
+            if verb == 'say':
+                text, attrs = args
+                response.say(self._mark(text, escape_text), **attrs)
+            elif verb == 'gather':
+                attrs, = args
+                response.gather(**{k: self._mark(v, escape_attr) if isinstance(v, str) else v
+                                   for k, v in attrs.items()})
+            elif verb == 'pause':
+                attrs, = args
+                response.pause(**attrs)
+            elif verb == 'redirect':
+                url, = args
+                response.redirect(self._mark(url, escape_text))
+            elif verb == 'hangup':
+                response.hangup()
+            else:
+                raise ValueError(f"Unknown TwiML verb {verb!r}")
+        pieces = self._MARK.split(str(response))
+        self.chunks = pieces[::2]
+        self.holes = [self.holes[int(i)] for i in pieces[1::2]]  # in document order
+        self.slots = {slot for slot, _ in self.holes}
+
+    def _mark(self, text: str, escape) -> str:
+        """Replace each {slot} in `text` with a numbered marker that serializes unchanged"""
+        out = []
+        for literal, slot, _, _ in string.Formatter().parse(text):
+            out.append(literal)
+            if slot is not None:
+                out.append(f"IVRSLOT{len(self.holes)}X")
+                self.holes.append((slot, escape))
+        return ''.join(out)
+
+    def render(self, **values: str) -> str:
+        parts = [self.chunks[0]]
+        for (slot, escape), chunk in zip(self.holes, self.chunks[1:]):
+            parts.append(escape(values[slot]))
+            parts.append(chunk)
+        return ''.join(parts)
+
+
+TEMPLATES = None
+_compile_lock = threading.Lock()
+
+
+def compile_templates() -> dict:
+    global TEMPLATES
+    with _compile_lock:
+        if TEMPLATES is None:
+            TEMPLATES = {name: Template(verbs) for name, verbs in STEPS.items()}
+    return TEMPLATES
+
+
+def render(step: str, **values: str) -> str:
+    """TwiML for `step`; `problem` is URL-quoted once into {problem_url} if the step needs it"""
+    template = (TEMPLATES or compile_templates())[step]
+    if 'problem_url' in template.slots:
+        values['problem_url'] = quote(values.pop('problem'))
+    return template.render(**values)
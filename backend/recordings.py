@@ -0,0 +1,261 @@
+import os
+import time
+import sqlite3
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import http_clients
+import audio_decode
+import telemetry
+
+log = telemetry.get_logger('recordings')
+
+RECORDING_WORKERS = int(os.getenv('RECORDING_WORKERS', '2'))
+RECORDING_MAX_PENDING = int(os.getenv('RECORDING_MAX_PENDING', '64'))
+RECORDING_SPOOL_BYTES = int(os.getenv('RECORDING_SPOOL_BYTES', str(4 * 1024 * 1024)))
+RECORDING_CHUNK_BYTES = int(os.getenv('RECORDING_CHUNK_BYTES', str(64 * 1024)))
+RECORDING_MAX_BYTES = int(os.getenv('RECORDING_MAX_BYTES', str(200 * 1024 * 1024)))
+RECORDING_TTL = float(os.getenv('RECORDING_TTL', '86400'))
+RECORDING_DB = os.getenv('RECORDING_DB') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recordings.db')
+
+QUEUED, DOWNLOADING, TRANSCRIBING, DONE, FAILED = 'queued', 'downloading', 'transcribing', 'done', 'failed'
+
+
+class RecordingError(Exception):
+    pass
+
+
+class IngestBusy(Exception):
+    """Too many recordings waiting; the callback should be retried later"""
+
+
+class RecordingJob:
+    __slots__ = ('recording_sid', 'call_sid', 'url', 'status', 'transcript', 'error',
+                 'bytes', 'seconds', 'created', 'updated')
+
+    def __init__(self, call_sid: str, recording_sid: str, url: str):
+        self.recording_sid = recording_sid
+        self.call_sid = call_sid
+        self.url = url
+        self.status = QUEUED
+        self.transcript = ''
+        self.error = ''
+        self.bytes = 0
+        self.seconds = 0.0
+        self.created = self.updated = time.time()
+
+    @property
+    def done(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def to_dict(self) -> dict:
+        return {
+            'recordingSid': self.recording_sid, 'callSid': self.call_sid, 'status': self.status,
+            'done': self.done, 'transcript': self.transcript, 'error': self.error,
+            'bytes': self.bytes, 'seconds': round(self.seconds, 2),
+        }
+
+    @classmethod
+    def from_row(cls, row: tuple) -> 'RecordingJob':
+        job = cls(row[1], row[0], row[2])
+        job.status, job.transcript, job.error, job.bytes, job.seconds, job.created, job.updated = row[3:]
+        return job
+
+
+class TranscriptStore:
+    """Finished recordings in a WAL database every worker on the host shares, kept for RECORDING_TTL"""
+    COLUMNS = 'recording_sid, call_sid, url, status, transcript, error, bytes, seconds, created, updated'
+    PURGE_SECONDS = 60
+
+    def __init__(self, path: str = RECORDING_DB, ttl: float = RECORDING_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._purged = 0.0
+        conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS recordings ('
+            'recording_sid TEXT PRIMARY KEY, call_sid TEXT NOT NULL, url TEXT NOT NULL, status TEXT NOT NULL, '
+            'transcript TEXT NOT NULL, error TEXT NOT NULL, bytes INTEGER NOT NULL, seconds REAL NOT NULL, '
+            'created REAL NOT NULL, updated REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS recordings_call ON recordings (call_sid, created)')
+        conn.close()  # not kept: under preload_app this runs in the gunicorn master
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def save(self, job: RecordingJob, status: str | None = None):
+        """Store `job`, as `status` if given rather than its current one"""
+        conn = self._conn()
+        conn.execute(
+            f"INSERT OR REPLACE INTO recordings ({self.COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job.recording_sid, job.call_sid, job.url, status or job.status, job.transcript, job.error,
+             job.bytes, job.seconds, job.created, job.updated)
+        )
+        now = time.time()
+        if now - self._purged >= self.PURGE_SECONDS:
+            self._purged = now
+            conn.execute('DELETE FROM recordings WHERE updated < ?', (now - self.ttl,))
+
+    def get(self, recording_sid: str) -> RecordingJob | None:
+        row = self._conn().execute(
+            f"SELECT {self.COLUMNS} FROM recordings WHERE recording_sid = ? AND updated >= ?",
+            (recording_sid, time.time() - self.ttl)
+        ).fetchone()
+        return RecordingJob.from_row(row) if row else None
+
+    def for_call(self, call_sid: str) -> list[RecordingJob]:
+        rows = self._conn().execute(
+            f"SELECT {self.COLUMNS} FROM recordings WHERE call_sid = ? AND updated >= ? ORDER BY created",
+            (call_sid, time.time() - self.ttl)
+        ).fetchall()
+        return [RecordingJob.from_row(row) for row in rows]
+
+
+def download(url: str, auth=None, chunk_bytes: int = RECORDING_CHUNK_BYTES,
+             spool_bytes: int = RECORDING_SPOOL_BYTES, max_bytes: int = RECORDING_MAX_BYTES):
+    """Stream a recording into a spool that stays in memory up to `spool_bytes`, then moves to disk.
+
+    Returns the spool rewound to the start; the caller closes it.
+    """
+    resp = http_clients.client('twilio-recordings').get(url, auth=auth, stream=True)
+    try:
+        if resp.status_code != 200:
+            raise RecordingError(f"download failed with HTTP {resp.status_code}")
+        spool = tempfile.SpooledTemporaryFile(max_size=spool_bytes, suffix='.wav')
+        size = 0
+        try:
+            for chunk in resp.iter_content(chunk_bytes):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise RecordingError(f"recording exceeds {max_bytes} bytes")
+                spool.write(chunk)
+        except BaseException:
+            spool.close()
+            raise
+        spool.seek(0)
+        return spool
+    finally:
+        resp.close()
+
+
+class RecordingIngestor:
+    """Downloads and transcribes Twilio recordings off the request path.
+
+    Status callbacks only enqueue; a small pool streams each recording to a spool, decodes it
+    from there and runs it through the agent's recognizer. Jobs in flight are tracked by this
+    process; finished ones go to the shared TranscriptStore, so any worker can answer for them.
+    """
+
+    def __init__(self, agent, auth=None, workers: int = RECORDING_WORKERS, max_pending: int = RECORDING_MAX_PENDING,
+                 store: TranscriptStore | None = None):
+        self.agent = agent
+        self.auth = auth
+        self.max_pending = max_pending
+        self.store = store or TranscriptStore()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='recording')
+        self._jobs = {}
+        self._by_call = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, call_sid: str, recording_sid: str, url: str) -> RecordingJob:
+        with self._lock:
+            self._evict_expired()
+            job = self._jobs.get(recording_sid) or self._stored(recording_sid)
+            if job is not None and job.status != FAILED:
+                return job  # Twilio retries callbacks; don't transcribe twice
+            if self._pending >= self.max_pending:
+                raise IngestBusy(f"{self._pending} recordings already waiting")
+            job = RecordingJob(call_sid, recording_sid, url)
+            self._jobs[recording_sid] = job
+            calls = self._by_call.setdefault(call_sid, [])
+            calls[:] = [j for j in calls if j.recording_sid != recording_sid] + [job]
+            self._pending += 1
+        self._pool.submit(self._run, job)
+        return job
+
+    def for_call(self, call_sid: str) -> list[RecordingJob]:
+        with self._lock:
+            local = list(self._by_call.get(call_sid, ()))
+        try:
+            stored = self.store.for_call(call_sid)
+        except sqlite3.Error as e:
+            log.warning(f"[Recording] Could not read stored transcripts for call {call_sid}: {e}")
+            stored = []
+        # This process's copy wins: it may be newer than the stored one (a retry in flight)
+        sids = {j.recording_sid for j in local}
+        return sorted(local + [j for j in stored if j.recording_sid not in sids], key=lambda j: j.created)
+
+    def _stored(self, recording_sid: str) -> RecordingJob | None:
+        try:
+            return self.store.get(recording_sid)
+        except sqlite3.Error as e:
+            log.warning(f"[Recording] Could not read stored recording {recording_sid}: {e}")
+            return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            statuses = [j.status for j in self._jobs.values()]
+        return {'pending': self._pending, **{s: statuses.count(s) for s in (QUEUED, DOWNLOADING, TRANSCRIBING, DONE, FAILED)}}
+
+    def fetch(self, url: str) -> tuple[np.ndarray, int]:
+        """Decoded 16 kHz PCM of a recording, and the number of bytes downloaded"""
+        with download(url, self.auth) as spool:
+            size = spool.seek(0, os.SEEK_END)
+            spool.seek(0)
+            return audio_decode.decode_stream(spool, 'audio/wav'), size
+
+    def transcribe_url(self, url: str) -> str:
+        """Synchronous download + transcription, for callers that need the text right away"""
+        pcm, _ = self.fetch(url)
+        return self.agent.transcribe_audio(pcm)
+
+    def _evict_expired(self):
+        cutoff = time.time() - RECORDING_TTL
+        expired = [sid for sid, j in self._jobs.items() if j.done and j.updated < cutoff]
+        for sid in expired:
+            job = self._jobs.pop(sid)
+            calls = [j for j in self._by_call.get(job.call_sid, ()) if j is not job]
+            if calls:
+                self._by_call[job.call_sid] = calls
+            else:
+                self._by_call.pop(job.call_sid, None)
+
+    def _update(self, job: RecordingJob, status: str):
+        with self._lock:
+            job.status = status
+            job.updated = time.time()
+            if job.done:
+                self._pending -= 1
+
+    def _run(self, job: RecordingJob):
+        try:
+            self._update(job, DOWNLOADING)
+            with telemetry.span('recording_download'):
+                pcm, job.bytes = self.fetch(job.url)
+            self._update(job, TRANSCRIBING)
+            job.seconds = len(pcm) / audio_decode.SAMPLE_RATE
+            job.transcript = self.agent.transcribe_audio(pcm)
+            status = DONE
+            log.info(f"[Recording] {job.recording_sid} ({job.seconds:.0f}s) for call {job.call_sid} transcribed")
+        except Exception as e:
+            log.warning(f"[Recording] {job.recording_sid} for call {job.call_sid} failed: {e}")
+            job.error = str(e)
+            status = FAILED
+        try:
+            # Stored before it shows as done here, so other workers never see less than this one
+            self.store.save(job, status)
+        except sqlite3.Error as e:
+            log.warning(f"[Recording] Could not store {job.recording_sid}: {e}")
+        self._update(job, status)
@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from collections import OrderedDict
+
+SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'memory').lower()
+SESSION_TTL = float(os.getenv('SESSION_TTL', '1800'))
+SESSION_MAX = int(os.getenv('SESSION_MAX', '10000'))
+SESSION_DB = os.getenv('SESSION_DB') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sessions.db')
+
+
+class SessionError(Exception):
+    status_code = 400
+
+
+class SessionNotFound(SessionError):
+    status_code = 404
+
+
+class SessionConflict(SessionError):
+    """The turn was built on a stale version: a concurrent or replayed request"""
+    status_code = 409
+
+    def __init__(self, message: str, version: int):
+        super().__init__(message)
+        self.version = version
+
+
+class SessionStore:
+    """Conversation state kept server-side between /conversation turns.
+
+    A turn first claims the version the client last saw, which bumps it; a second request
+    carrying the same version is rejected before any audio is decoded. The new state is then
+    saved under the claimed version.
+    """
+    name = 'base'
+
+    def create(self, state: dict) -> tuple[str, int]:
+        raise NotImplementedError
+
+    def claim(self, session_id: str, version: int) -> tuple[dict, int]:
+        """Return (state, new version) or raise SessionNotFound / SessionConflict"""
+        raise NotImplementedError
+
+    def save(self, session_id: str, version: int, state: dict):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+
+class MemorySessionStore(SessionStore):
+    name = 'memory'
+
+    def __init__(self, ttl: float = SESSION_TTL, max_entries: int = SESSION_MAX):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # id -> [version, expires, state]
+        self._lock = threading.Lock()
+
+    def _touch(self, session_id: str, entry: list, now: float):
+        entry[1] = now + self.ttl
+        self._entries.move_to_end(session_id)
+        while self._entries:
+            oldest, (_, expires, _) = next(iter(self._entries.items()))
+            if expires > now and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[oldest]
+
+    def _live(self, session_id: str, now: float) -> list:
+        entry = self._entries.get(session_id)
+        if entry is None or entry[1] <= now:
+            self._entries.pop(session_id, None)
+            raise SessionNotFound('Unknown or expired session')
+        return entry
+
+    def create(self, state: dict) -> tuple[str, int]:
+        session_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            entry = self._entries[session_id] = [1, 0.0, dict(state)]
+            self._touch(session_id, entry, now)
+        return session_id, 1
+
+    def claim(self, session_id: str, version: int) -> tuple[dict, int]:
+        now = time.time()
+        with self._lock:
+            entry = self._live(session_id, now)
+            if entry[0] != version:
+                raise SessionConflict('Session has moved on', entry[0])
+            entry[0] += 1
+            self._touch(session_id, entry, now)
+            return dict(entry[2]), entry[0]
+
+    def save(self, session_id: str, version: int, state: dict):
+        now = time.time()
+        with self._lock:
+            entry = self._live(session_id, now)
+            if entry[0] != version:
+                raise SessionConflict('Session has moved on', entry[0])
+            entry[2] = dict(state)
+            self._touch(session_id, entry, now)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class SqliteSessionStore(SessionStore):
+    """Shared between workers on one host through a WAL database"""
+    name = 'sqlite'
+    PURGE_SECONDS = 60
+
+    def __init__(self, path: str = SESSION_DB, ttl: float = SESSION_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._purged = 0.0
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS sessions ('
+            'id TEXT PRIMARY KEY, version INTEGER NOT NULL, data TEXT NOT NULL, expires REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires)')
+        # Not kept for this thread: under gunicorn's preload_app that is the master, and an
+        # SQLite connection must not be carried across fork into the workers
+        conn.close()
+        del self._local.conn
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self, fn):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = fn(conn, time.time())
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return result
+
+    def _row(self, conn, session_id: str, now: float):
+        row = conn.execute(
+            'SELECT version, data FROM sessions WHERE id = ? AND expires > ?', (session_id, now)
+        ).fetchone()
+        if row is None:
+            raise SessionNotFound('Unknown or expired session')
+        return row
+
+    def create(self, state: dict) -> tuple[str, int]:
+        session_id = uuid.uuid4().hex
+
+        def insert(conn, now):
+            conn.execute('INSERT INTO sessions (id, version, data, expires) VALUES (?, 1, ?, ?)',
+                         (session_id, json.dumps(state), now + self.ttl))
+            if now - self._purged >= self.PURGE_SECONDS:
+                self._purged = now
+                conn.execute('DELETE FROM sessions WHERE expires <= ?', (now,))
+        self._transaction(insert)
+        return session_id, 1
+
+    def claim(self, session_id: str, version: int) -> tuple[dict, int]:
+        def bump(conn, now):
+            current, data = self._row(conn, session_id, now)
+            if current != version:
+                raise SessionConflict('Session has moved on', current)
+            conn.execute('UPDATE sessions SET version = ?, expires = ? WHERE id = ?',
+                         (current + 1, now + self.ttl, session_id))
+            return json.loads(data), current + 1
+        return self._transaction(bump)
+
+    def save(self, session_id: str, version: int, state: dict):
+        def write(conn, now):
+            current, _ = self._row(conn, session_id, now)
+            if current != version:
+                raise SessionConflict('Session has moved on', current)
+            conn.execute('UPDATE sessions SET data = ?, expires = ? WHERE id = ?',
+                         (json.dumps(state), now + self.ttl, session_id))
+        self._transaction(write)
+
+    def __len__(self):
+        row = self._conn().execute('SELECT COUNT(*) FROM sessions WHERE expires > ?', (time.time(),)).fetchone()
+        return row[0]
+
+
+STORES = {
+    'memory': MemorySessionStore,
+    'sqlite': SqliteSessionStore,
+}
+
+
+def create_store(backend: str = SESSION_BACKEND) -> SessionStore:
+    return STORES[backend]()
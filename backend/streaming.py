@@ -0,0 +1,68 @@
+import threading
+import time
+import uuid
+
+import numpy as np
+
+import audio_decode
+
+STREAM_TTL = 120
+
+
+class StreamSession:
+    """One utterance being transcribed while the user is still speaking"""
+
+    def __init__(self, recognizer, params: dict):
+        self.id = uuid.uuid4().hex
+        self.recognizer = recognizer
+        self.params = params
+        self.partial = ''
+        self.samples = 0
+        self.touched = time.monotonic()
+        self.lock = threading.Lock()
+
+    def feed(self, data: bytes, sample_rate: int = audio_decode.SAMPLE_RATE) -> str:
+        """Raw little-endian int16 mono frames -> partial transcript"""
+        pcm = np.frombuffer(data[:len(data) // 2 * 2], dtype='<i2')
+        if sample_rate != audio_decode.SAMPLE_RATE:
+            pcm = audio_decode.to_pcm16(audio_decode.resample(pcm.astype(np.float32), sample_rate))
+        with self.lock:
+            self.touched = time.monotonic()
+            if len(pcm):
+                self.samples += len(pcm)
+                self.partial = self.recognizer.accept(pcm)
+            return self.partial
+
+    def finish(self, vad=None) -> str:
+        """Final transcript; with a VAD the utterance is trimmed to speech as uploads are"""
+        with self.lock:
+            return self.recognizer.finish(vad)
+
+
+class StreamRegistry:
+    def __init__(self, get_engine, ttl: float = STREAM_TTL):
+        self.get_engine = get_engine  # called per stream so the model can load after import
+        self.ttl = ttl
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def open(self, params: dict) -> StreamSession:
+        session = StreamSession(self.get_engine().open_stream(), params)
+        with self._lock:
+            self._evict_expired()
+            self._streams[session.id] = session
+        return session
+
+    def get(self, stream_id: str) -> StreamSession | None:
+        with self._lock:
+            return self._streams.get(stream_id)
+
+    def close(self, stream_id: str) -> StreamSession | None:
+        with self._lock:
+            return self._streams.pop(stream_id, None)
+
+    def _evict_expired(self):
+        # Streams abandoned mid-utterance (tab closed, network drop) are dropped here
+        cutoff = time.monotonic() - self.ttl
+        for sid in [sid for sid, s in self._streams.items() if s.touched < cutoff]:
+            del self._streams[sid]
@@ -0,0 +1,215 @@
+import os
+import re
+import csv
+import time
+import threading
+from datetime import datetime
+
+import telemetry
+
+log = telemetry.get_logger('technicians')
+
+TECHNICIANS_CSV = os.getenv('TECHNICIANS_CSV') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'technicians.csv')
+TECHNICIAN_TZ = os.getenv('TECHNICIAN_TZ', '')
+TECHNICIANS_RELOAD_SECONDS = float(os.getenv('TECHNICIANS_RELOAD_SECONDS', '2'))
+
+_TIME = r'(\d{1,2})(?::(\d{2}))?\s*(am|pm)?'
+_WINDOW = re.compile(rf'^\s*{_TIME}\s*(?:-|–|to)\s*{_TIME}\s*$', re.IGNORECASE)
+_ALWAYS = {'24x7', '24/7', '24 x 7', 'always'}
+
+
+def _minutes(hour: str, minute: str | None, meridiem: str | None) -> int:
+    h, m = int(hour), int(minute or 0)
+    if meridiem:
+        meridiem = meridiem.lower()
+        if h == 12:
+            h = 0
+        if meridiem == 'pm':
+            h += 12
+    if m > 59 or h * 60 + m > 1440:  # 24:00 ends a day; nothing goes past it
+        raise ValueError(f"bad time {hour}:{minute}")
+    return h * 60 + m
+
+
+class Availability:
+    """Daily window in minutes since midnight; end < start means the shift runs past midnight"""
+    __slots__ = ('raw', 'always', 'start', 'end')
+
+    def __init__(self, raw: str, always: bool = False, start: int = 0, end: int = 0):
+        self.raw = raw
+        self.always = always
+        self.start = start
+        self.end = end
+
+    @classmethod
+    def parse(cls, text: str) -> 'Availability | None':
+        raw = (text or '').strip()
+        if raw.lower() in _ALWAYS:
+            return cls(raw, always=True)
+        m = _WINDOW.match(raw)
+        if not m:
+            return None
+        h1, m1, ap1, h2, m2, ap2 = m.groups()
+        # "1 - 5 PM" style: the missing meridiem follows the one given, unless that would put
+        # the start after the end ("9 - 6 PM" is 9 AM to 6 PM, "10 - 2 AM" is 10 PM to 2 AM)
+        ap2 = ap2 or ap1
+        try:
+            end = _minutes(h2, m2, ap2)
+            start = _minutes(h1, m1, ap1 or ap2)
+            if not ap1 and ap2 and start > end:
+                start = _minutes(h1, m1, 'am' if ap2.lower() == 'pm' else 'pm')
+            return cls(raw, start=start, end=end)
+        except ValueError:
+            return None
+
+    def spans(self) -> list[tuple[int, int]]:
+        if self.always:
+            return [(0, 1440)]
+        if self.start <= self.end:
+            return [(self.start, self.end)]
+        return [(self.start, 1440), (0, self.end)]
+
+    def covers(self, minute_of_day: int) -> bool:
+        if self.always:
+            return True
+        if self.start <= self.end:
+            return self.start <= minute_of_day < self.end
+        return minute_of_day >= self.start or minute_of_day < self.end
+
+
+class Technician:
+    __slots__ = ('problem_type', 'name', 'skillset', 'contact', 'availability')
+
+    def __init__(self, problem_type: str, name: str, skillset: str, contact: str, availability: Availability | None):
+        self.problem_type = problem_type
+        self.name = name
+        self.skillset = skillset
+        self.contact = contact
+        self.availability = availability
+
+    @classmethod
+    def from_row(cls, row: dict) -> 'Technician':
+        return cls(
+            (row.get('Problem Type') or '').strip(),
+            (row.get('Name') or '').strip(),
+            (row.get('Skillset') or '').strip(),
+            (row.get('Contact') or '').strip(),
+            Availability.parse(row.get('Availability') or ''),
+        )
+
+    def available_at(self, minute_of_day: int) -> bool:
+        return self.availability is not None and self.availability.covers(minute_of_day)
+
+    def __repr__(self):
+        return f"Technician({self.name!r}, {self.problem_type!r})"
+
+
+class _Index:
+    __slots__ = ('all', 'by_type', 'by_hour')
+
+    def __init__(self, techs: list[Technician]):
+        self.all = tuple(techs)
+        by_type = {}
+        by_hour = [[] for _ in range(24)]
+        for t in techs:
+            by_type.setdefault(t.problem_type, []).append(t)
+            if t.availability is None:
+                continue
+            for start, end in t.availability.spans():
+                for hour in range(start // 60, min(24, (end + 59) // 60)):
+                    by_hour[hour].append(t)
+        self.by_type = {k: tuple(v) for k, v in by_type.items()}
+        # Technicians whose shift touches each hour; an exact covers() check narrows it to the minute
+        self.by_hour = [tuple(dict.fromkeys(h)) for h in by_hour]
+
+    def on_shift(self, minute_of_day: int) -> list[Technician]:
+        return [t for t in self.by_hour[minute_of_day // 60] if t.available_at(minute_of_day)]
+
+
+class TechnicianRegistry:
+    """technicians.csv indexed by problem type, loaded on first use and reloaded when the file changes"""
+
+    def __init__(self, path: str = TECHNICIANS_CSV, reload_seconds: float = TECHNICIANS_RELOAD_SECONDS,
+                 tz: str = TECHNICIAN_TZ):
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self.tz = None
+        if tz:
+            from zoneinfo import ZoneInfo
+            self.tz = ZoneInfo(tz)
+        self._lock = threading.Lock()
+        self._index = _Index([])
+        self._mtime = None
+        self._checked = float('-inf')
+
+    def reload(self) -> bool:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            with open(self.path, 'r', encoding='utf-8') as f:
+                techs = [Technician.from_row(row) for row in csv.DictReader(f)]
+            index = _Index(techs)
+        except Exception as e:
+            log.warning(f"[Technicians] Error loading {self.path}: {e}")
+            return False
+        for t in techs:
+            if t.availability is None:
+                log.warning(f"[Technicians] Unrecognised availability for {t.name}; treated as unavailable")
+        self._index = index
+        self._mtime = mtime
+        if not techs:
+            log.warning(f"[Technicians] {self.path} lists no technicians; every dispatch will escalate")
+        else:
+            log.info(f"[Technicians] Loaded {len(techs)} technicians")
+        return True
+
+    def _current(self) -> _Index:
+        now = time.monotonic()
+        if now - self._checked >= self.reload_seconds:
+            with self._lock:
+                if now - self._checked >= self.reload_seconds:
+                    first = self._checked == float('-inf')
+                    self._checked = now
+                    try:
+                        changed = os.stat(self.path).st_mtime_ns != self._mtime
+                    except OSError:
+                        changed = first  # so a missing directory is logged once rather than never
+                    if changed:
+                        self.reload()
+        return self._index
+
+    def _minute_of_day(self, now: datetime | None) -> int:
+        now = now or datetime.now(self.tz)
+        return now.hour * 60 + now.minute
+
+    def __len__(self):
+        return len(self._current().all)
+
+    def __iter__(self):
+        return iter(self._current().all)
+
+    def for_problem(self, problem_type: str) -> tuple[Technician, ...]:
+        return self._current().by_type.get(problem_type, ())
+
+    def available_now(self, problem_type: str | None = None, now: datetime | None = None) -> list[Technician]:
+        idx = self._current()
+        minute = self._minute_of_day(now)
+        if problem_type is None:
+            return idx.on_shift(minute)
+        return [t for t in idx.by_type.get(problem_type, ()) if t.available_at(minute)]
+
+    def candidates(self, problem_type: str, now: datetime | None = None) -> list[Technician]:
+        """Everyone worth trying, best first: on-shift specialists, off-shift specialists, anyone on shift"""
+        idx = self._current()
+        minute = self._minute_of_day(now)
+        specialists = idx.by_type.get(problem_type, ())
+        ranked = [t for t in specialists if t.available_at(minute)]
+        ranked += [t for t in specialists if not t.available_at(minute)]
+        ranked += [t for t in idx.on_shift(minute) if t.problem_type != problem_type]
+        return ranked
+
+    def select(self, problem_type: str, now: datetime | None = None) -> Technician | None:
+        ranked = self.candidates(problem_type, now)
+        if ranked:
+            return ranked[0]
+        idx = self._current()
+        return idx.all[0] if idx.all else None
@@ -0,0 +1,221 @@
+"""Per-stage latency histograms, request traces and a non-blocking logger.
+
+    with telemetry.span('asr'):          # timed into the 'asr' histogram
+        ...
+    @telemetry.traced('select_technician')
+    def select_technician(...): ...
+
+Spans opened while a request trace is active (see start_trace) are also collected on that
+trace, which is logged as one structured line when the request ends.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import atexit
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_TRACES = os.getenv('LOG_TRACES', '1') != '0'
+METRICS_WINDOW = int(os.getenv('METRICS_WINDOW', '2048'))
+
+_trace = contextvars.ContextVar('trace', default=None)
+
+
+class Histogram:
+    """Count and total over all time; percentiles over the last `window` observations"""
+
+    def __init__(self, window: int = METRICS_WINDOW):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, ok: bool = True):
+        with self._lock:
+            self.count += 1
+            self.errors += not ok
+            self.total += seconds
+            self._samples.append(seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = sorted(self._samples)
+            count, errors, total = self.count, self.errors, self.total
+
+        def pct(p):
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 2) if samples else None
+        return {'count': count, 'errors': errors, 'meanMs': round(total / count * 1000, 2) if count else None,
+                'p50': pct(0.50), 'p95': pct(0.95), 'p99': pct(0.99), 'maxMs': pct(1.0)}
+
+
+class Registry:
+    def __init__(self):
+        self.histograms = {}
+        self.inflight = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str) -> Histogram:
+        h = self.histograms.get(name)
+        if h is None:
+            with self._lock:
+                h = self.histograms.setdefault(name, Histogram())
+        return h
+
+    def enter(self, name: str):
+        with self._lock:
+            self.inflight[name] = self.inflight.get(name, 0) + 1
+
+    def exit(self, name: str):
+        with self._lock:
+            self.inflight[name] -= 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            histograms = dict(self.histograms)
+            inflight = {k: v for k, v in self.inflight.items() if v}
+        return {'stages': {k: h.snapshot() for k, h in sorted(histograms.items())}, 'inflight': inflight}
+
+
+registry = Registry()
+
+
+class Trace:
+    __slots__ = ('id', 'name', 'start', 'spans', 'fields', 'ended')
+
+    def __init__(self, name: str, fields: dict):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.start = time.perf_counter()
+        self.spans = []
+        self.fields = fields
+        self.ended = False
+
+
+@contextmanager
+def span(name: str):
+    """Time a block into the `name` histogram and onto the current request trace"""
+    trace = _trace.get()
+    registry.enter(name)
+    start = time.perf_counter()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        elapsed = time.perf_counter() - start
+        registry.exit(name)
+        registry.histogram(name).observe(elapsed, ok)
+        if trace is not None:
+            trace.spans.append((name, round(elapsed * 1000, 2)))
+
+
+def traced(name: str):
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def start_trace(name: str, **fields) -> Trace:
+    """Begin a request trace in the current context; pass the result to end_trace()"""
+    trace = Trace(name, fields)
+    registry.enter(f"request {name}")
+    _trace.set(trace)
+    return trace
+
+
+def end_trace(trace: Trace, status: int = 200):
+    """Record and log a finished request; later calls for the same trace are ignored"""
+    if trace.ended:
+        return
+    trace.ended = True
+    # Not a token reset: streamed responses end in a different context than they started in,
+    # and pooled server threads must not carry the trace into their next request
+    _trace.set(None)
+    elapsed = time.perf_counter() - trace.start
+    registry.exit(f"request {trace.name}")
+    registry.histogram(f"request {trace.name}").observe(elapsed, status < 500)
+    if LOG_TRACES:
+        _log.info(f"[Trace] {trace.name} {status} {elapsed * 1000:.1f}ms",
+                  extra={'data': {'trace': trace.id, 'route': trace.name, 'status': status,
+                                  'ms': round(elapsed * 1000, 2), 'spans': trace.spans, **trace.fields}})
+
+
+def current_trace_id() -> str:
+    trace = _trace.get()
+    return trace.id if trace else ''
+
+
+def snapshot() -> dict:
+    return registry.snapshot()
+
+
+class _Formatter(logging.Formatter):
+    """text: the message followed by key=value fields; json: one object per line"""
+
+    def __init__(self, style: str):
+        super().__init__()
+        self.json = style == 'json'
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = getattr(record, 'data', None) or {}
+        if self.json:
+            return json.dumps({'ts': round(record.created, 3), 'level': record.levelname, 'logger': record.name,
+                               'msg': record.getMessage(), **data}, default=str)
+        if not data:
+            return record.getMessage()
+        return record.getMessage() + ' ' + ' '.join(f"{k}={json.dumps(v, default=str)}" for k, v in data.items()
+                                                     if k not in ('route', 'status', 'ms'))
+
+
+_root = logging.getLogger('support')
+_listener = None
+
+
+def _start_listener():
+    """Loggers hand records to a queue; one listener thread does the (blocking) writes to stdout"""
+    global _listener
+    records = queue.SimpleQueue()
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(_Formatter(LOG_FORMAT))
+    for old in list(_root.handlers):
+        _root.removeHandler(old)
+    _root.addHandler(QueueHandler(records))
+    _listener = QueueListener(records, handler, respect_handler_level=True)
+    _listener.start()
+
+
+def _stop_listener():
+    _listener.stop()
+
+
+def _setup():
+    _root.setLevel(LOG_LEVEL)
+    _root.propagate = False
+    _start_listener()
+    atexit.register(_stop_listener)
+    # A forked gunicorn worker (preload_app) inherits the queue but not the listener thread
+    os.register_at_fork(after_in_child=_start_listener)
+
+
+def get_logger(name: str) -> logging.Logger:
+    if _listener is None:
+        _setup()
+    return _root.getChild(name)
+
+
+_log = get_logger('trace')
@@ -0,0 +1,37 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'benchmarks'))  # fakes.py: stub Twilio and friends
+
+# Module-level settings are read at import: keep the suite off the real stores and upstreams
+STATE_DIR = tempfile.mkdtemp(prefix='backend-tests-')
+for key, value in {
+    'TICKET_DB': os.path.join(STATE_DIR, 'tickets.db'),
+    'RECORDING_DB': os.path.join(STATE_DIR, 'recordings.db'),
+    'TTS_CACHE_DIR': os.path.join(STATE_DIR, 'tts_cache'),
+    'SESSION_BACKEND': 'memory', 'CALL_CONTEXT_BACKEND': 'memory',
+    'TWILIO_API_BASE': 'http://127.0.0.1:9', 'PUBLIC_BASE_URL': 'http://127.0.0.1:9',
+    'TTS_PREWARM': '0', 'LOG_TRACES': '0', 'LOG_LEVEL': 'WARNING',
+}.items():
+    os.environ[key] = value
+
+from fakes import FakeService, TwilioHandler
+
+
+@pytest.fixture
+def twilio():
+    service = FakeService(TwilioHandler).start()
+    yield service
+    service.stop()
+
+
+@pytest.fixture(scope='session')
+def backend():
+    """The Flask app module, imported once for the whole run"""
+    import app
+    return app
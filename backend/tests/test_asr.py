@@ -0,0 +1,43 @@
+import pytest
+
+import asr
+
+
+class StubEngine(asr.TranscriptionEngine):
+    name = 'stub'
+
+    def transcribe(self, pcm, sample_rate: int = asr.SAMPLE_RATE) -> str:
+        return 'stub'
+
+
+def missing_package():
+    raise ImportError('No module named vosk')
+
+
+@pytest.fixture
+def engines(monkeypatch):
+    monkeypatch.setitem(asr.ENGINES, 'stub', StubEngine)
+    monkeypatch.setitem(asr.ENGINES, 'broken', missing_package)
+
+
+@pytest.mark.parametrize('fallback', ['nonexistent', 'broken'])
+def test_unloadable_fallback_leaves_the_primary_alone(engines, fallback):
+    engine = asr.create_engine('stub', fallback)
+    assert isinstance(engine, StubEngine)
+
+
+def test_fallback_wraps_a_loaded_primary(engines, monkeypatch):
+    monkeypatch.setitem(asr.ENGINES, 'other', StubEngine)
+    engine = asr.create_engine('stub', 'other')
+    assert isinstance(engine, asr.FallbackEngine)
+
+
+def test_fallback_replaces_an_unloadable_primary(engines):
+    assert isinstance(asr.create_engine('broken', 'stub'), StubEngine)
+
+
+def test_nothing_loadable_fails_startup(engines):
+    with pytest.raises(RuntimeError):
+        asr.create_engine('broken', 'nonexistent')
+    with pytest.raises(RuntimeError):
+        asr.create_engine('broken', 'none')
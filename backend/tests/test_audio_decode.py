@@ -0,0 +1,87 @@
+import io
+import shutil
+import subprocess
+import wave
+
+import numpy as np
+import pytest
+
+import audio_decode
+from audio_decode import SAMPLE_RATE, DecodeError, FFmpegDecoder
+
+
+def tone(seconds: float, rate: int, channels: int = 1) -> np.ndarray:
+    t = np.arange(int(seconds * rate)) / rate
+    samples = (8000 * np.sin(2 * np.pi * 440 * t)).astype(np.int16)
+    return np.repeat(samples[:, None], channels, axis=1)
+
+
+def wav_bytes(seconds: float, rate: int, channels: int = 1) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(tone(seconds, rate, channels).tobytes())
+    return buf.getvalue()
+
+
+def webm_bytes(seconds: float) -> bytes:
+    """Opus in WebM, what browsers' MediaRecorder uploads"""
+    av = pytest.importorskip('av')
+    buf = io.BytesIO()
+    with av.open(buf, 'w', format='webm') as container:
+        stream = container.add_stream('libopus', rate=48000)
+        stream.layout = 'mono'
+        pcm = tone(seconds, 48000).reshape(1, -1)
+        for i in range(0, pcm.shape[1], 960):
+            frame = av.AudioFrame.from_ndarray(pcm[:, i:i + 960], format='s16', layout='mono')
+            frame.sample_rate = 48000
+            for packet in stream.encode(frame):
+                container.mux(packet)
+        for packet in stream.encode(None):
+            container.mux(packet)
+    return buf.getvalue()
+
+
+@pytest.fixture
+def no_decoders(monkeypatch):
+    """Only the WAV reader and whatever the test installs"""
+    monkeypatch.setattr(audio_decode, 'soundfile', None)
+    monkeypatch.setattr(audio_decode, 'AV_AVAILABLE', False)
+    monkeypatch.setattr(audio_decode, 'ffmpeg_decoder', FFmpegDecoder(binary=''))
+
+
+@pytest.mark.parametrize('rate,channels', [(16000, 1), (48000, 2), (22050, 1)])
+def test_wav_is_decoded_in_memory_to_16k_mono(rate, channels, no_decoders):
+    pcm = audio_decode.decode_audio(wav_bytes(1.0, rate, channels), 'audio/wav')
+    assert pcm.dtype == np.int16 and pcm.ndim == 1
+    assert abs(len(pcm) - SAMPLE_RATE) <= 1
+    assert np.abs(pcm).max() > 7000
+
+
+def test_webm_is_decoded_in_memory_with_pyav(monkeypatch):
+    data = webm_bytes(1.0)
+    monkeypatch.setattr(audio_decode, 'ffmpeg_decoder', FFmpegDecoder(binary=''))
+    pcm = audio_decode.decode_audio(data, 'audio/webm;codecs=opus')
+    assert pcm.dtype == np.int16
+    assert abs(len(pcm) - SAMPLE_RATE) < SAMPLE_RATE // 20
+    assert np.abs(pcm).max() > 4000
+
+
+def test_compressed_audio_falls_back_to_ffmpeg(no_decoders, monkeypatch):
+    binary = shutil.which('ffmpeg')
+    if not binary:
+        pytest.skip('ffmpeg is not installed')
+    flac = subprocess.run([binary, '-hide_banner', '-loglevel', 'error', '-f', 'wav', '-i', 'pipe:0',
+                           '-f', 'flac', 'pipe:1'], input=wav_bytes(1.0, 44100), capture_output=True,
+                          check=True).stdout
+    monkeypatch.setattr(audio_decode, 'ffmpeg_decoder', FFmpegDecoder(binary=binary))
+    pcm = audio_decode.decode_audio(flac, 'audio/flac')
+    assert abs(len(pcm) - SAMPLE_RATE) <= 1
+
+
+def test_undecodable_audio_names_what_was_tried(no_decoders):
+    with pytest.raises(DecodeError, match='no decoders installed'):
+        audio_decode.decode_audio(b'\x1a\x45\xdf\xa3' + b'\0' * 64, 'audio/webm')
+    assert len(audio_decode.decode_audio(b'')) == 0
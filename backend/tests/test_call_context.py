@@ -0,0 +1,62 @@
+import pytest
+
+import call_context
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(call_context.time, 'time', clock)
+    return clock
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, clock, tmp_path):
+    if request.param == 'sqlite':
+        return call_context.SqliteCallContextStore(str(tmp_path / 'call_contexts.db'), ttl=60)
+    return call_context.MemoryCallContextStore(ttl=60)
+
+
+def test_a_context_expires_after_its_ttl(store, clock):
+    store.setdefault('CA1', {'step': 'greet'})
+    clock.now += 59
+    assert store.update('CA1', step='confirm') == {'step': 'confirm'}
+    clock.now += 59  # each write refreshes the TTL
+    assert store.setdefault('CA1', {'step': 'greet'}) == {'step': 'confirm'}
+    clock.now += 61
+    assert len(store) == 0
+    assert store.setdefault('CA1', {'step': 'greet'}) == {'step': 'greet'}
+
+
+def test_an_update_after_expiry_starts_from_nothing(store, clock):
+    store.update('CA1', step='confirm', ticketId='T1')
+    clock.now += 61
+    assert store.update('CA1', step='done') == {'step': 'done'}
+
+
+def test_an_expired_context_is_not_popped(store, clock):
+    store.setdefault('CA1', {'step': 'greet'})
+    store.setdefault('CA2', {'step': 'greet'})
+    assert store.pop('CA1') == {'step': 'greet'}
+    clock.now += 61
+    assert store.pop('CA2') is None
+    assert store.pop('CA1') is None
+
+
+def test_memory_store_drops_the_least_recently_written_beyond_its_limit(clock):
+    store = call_context.MemoryCallContextStore(ttl=60, max_entries=2)
+    for sid in ('CA1', 'CA2'):
+        store.setdefault(sid, {'sid': sid})
+    store.update('CA1', step='confirm')
+    store.setdefault('CA3', {'sid': 'CA3'})
+    assert len(store) == 2
+    assert store.pop('CA2') is None
+    assert store.pop('CA1') == {'sid': 'CA1', 'step': 'confirm'}
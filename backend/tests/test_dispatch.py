@@ -0,0 +1,171 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from werkzeug.serving import make_server, WSGIRequestHandler
+
+import ai_agent
+import http_clients
+import tickets
+from dispatch import Dispatcher, RINGING, CONFIRMED, FAILED, LEG_CANCELED
+from technicians import TechnicianRegistry
+from fakes import CallSimulator
+
+ROSTER = """Problem Type,Name,Skillset,Contact,Availability
+VPN Problem,Asha,Network Security,+15550000001,24x7
+VPN Problem,Bilal,Network Security,+15550000002,24x7
+VPN Problem,Chen,Network Security,+15550000003,24x7
+VPN Problem,Dana,Network Security,+15550000004,on call
+Software Bug,Emeka,App Debugging,+15550000005,24x7
+"""
+ON_SHIFT = {'+15550000001', '+15550000002', '+15550000003'}
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args):
+        pass
+
+
+def wait_for(condition, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def live(backend, twilio, monkeypatch):
+    """The app on a real port, placing its calls through the stub Twilio"""
+    server = make_server('127.0.0.1', 0, backend.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(ai_agent, 'TWILIO_API_BASE', twilio.url)
+    monkeypatch.setattr(ai_agent, 'PUBLIC_BASE_URL', f"http://127.0.0.1:{server.server_port}")
+    http_clients.client('twilio').breaker.success()  # earlier tests dialed an unreachable Twilio
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def agent(backend, live, tmp_path):
+    """The real agent's telephony and tickets, with a fixed roster"""
+    path = tmp_path / 'technicians.csv'
+    path.write_text(ROSTER)
+    roster = TechnicianRegistry(str(path))
+    return SimpleNamespace(technicians=roster, tickets=backend.agent.tickets, select_technician=roster.select,
+                           call_technician=backend.agent.call_technician, cancel_call=backend.agent.cancel_call)
+
+
+def dispatcher(backend, agent, monkeypatch, **kwargs) -> Dispatcher:
+    d = Dispatcher(agent, workers=2, retries=0, backoff=0, parallel_calls=3, **kwargs)
+    monkeypatch.setattr(backend.agent, 'dispatcher', d)  # the IVR webhook confirms through it
+    return d
+
+
+def ringing(d: Dispatcher, agent) -> tuple:
+    ticket_id = agent.tickets.create('VPN Problem', 'VPN down', [], ['VPN down'], urgent=True,
+                                     status=tickets.DISPATCHING)
+    job = d.submit('VPN Problem', 'VPN down', [], ticket_id)
+    wait_for(lambda: job.status == RINGING or job.done)
+    return job, ticket_id
+
+
+def hung_up(twilio) -> set:
+    return {r['path'].rsplit('/', 1)[1][:-len('.json')] for r in twilio.requests
+            if r['method'] == 'POST' and r['form'].get('Status') == 'completed'}
+
+
+def ticket(agent, ticket_id: str) -> dict:
+    agent.tickets.flush(5.0)
+    return agent.tickets.get(ticket_id)
+
+
+def test_only_on_shift_specialists_are_rung_together(backend, agent, twilio, monkeypatch):
+    d = dispatcher(backend, agent, monkeypatch, confirm_timeout=0.2)
+    job, _ = ringing(d, agent)
+    assert job.status == RINGING
+    dialed = {r['form']['To'] for r in twilio.requests if r['path'].endswith('/Calls.json')}
+    assert dialed == ON_SHIFT
+    wait_for(lambda: job.done)
+
+
+def test_first_confirmation_takes_the_ticket_and_hangs_up_the_rest(backend, agent, twilio, monkeypatch):
+    d = dispatcher(backend, agent, monkeypatch)
+    job, ticket_id = ringing(d, agent)
+    first, second, third = job.calls
+    assert d.confirm(second, '10 AM') is True
+    assert d.confirm(first, 'noon') is False
+    assert job.status == CONFIRMED and job.call_sid == second and job.appointment_time == '10 AM'
+    assert job.calls[first][1] == job.calls[third][1] == LEG_CANCELED
+    wait_for(lambda: hung_up(twilio) == {first, third})
+    saved = ticket(agent, ticket_id)
+    assert saved['status'] == tickets.SCHEDULED
+    assert saved['dispatch']['technician'] == job.technician == job.calls[second][0]
+
+
+def test_unconfirmed_calls_are_hung_up_at_the_timeout(backend, agent, twilio, monkeypatch):
+    d = dispatcher(backend, agent, monkeypatch, confirm_timeout=0.3)
+    job, ticket_id = ringing(d, agent)
+    wait_for(lambda: job.done)
+    assert job.status == FAILED
+    wait_for(lambda: hung_up(twilio) == set(job.calls))
+    assert ticket(agent, ticket_id)['status'] == tickets.ESCALATED
+    assert d.confirm(next(iter(job.calls)), '3 PM') is False  # answered just too late
+
+
+def test_confirmation_reaching_another_worker_claims_the_ticket(backend, agent, twilio, monkeypatch):
+    owner = dispatcher(backend, agent, monkeypatch)
+    job, ticket_id = ringing(owner, agent)
+    first, second, third = job.calls
+    other = Dispatcher(agent)  # a worker that placed none of these calls
+    assert other.confirm(second, '3 PM') is False  # nothing to claim: refused
+    assert other.confirm(second, '3 PM', ticket_id) is True
+    assert other.confirm(third, 'noon', ticket_id) is False
+    # The owner learns of it from the ticket, here on a local confirmation arriving late
+    assert owner.confirm(first, '10 AM') is False
+    assert job.status == CONFIRMED and job.call_sid == second and job.appointment_time == '3 PM'
+    wait_for(lambda: hung_up(twilio) == {third})
+    assert ticket(agent, ticket_id)['dispatch']['technician'] == job.calls[second][0]
+
+
+def test_technicians_walking_the_ivr_only_one_takes_it(backend, agent, twilio, monkeypatch):
+    twilio.calls = CallSimulator(answer_rate=1.0, confirm_rate=1.0, ring=(0.05, 0.3), think=0.05, seed=3)
+    d = dispatcher(backend, agent, monkeypatch)
+    job, ticket_id = ringing(d, agent)
+    wait_for(lambda: job.done and len(twilio.calls.outcomes) == len(job.calls))
+    assert job.status == CONFIRMED
+    outcomes = sorted(twilio.calls.outcomes.values())
+    assert outcomes.count('confirmed') == 1
+    assert set(outcomes) <= {'confirmed', 'taken', 'hung-up'}
+    assert ticket(agent, ticket_id)['status'] == tickets.SCHEDULED
+
+
+def test_sequential_confirmation_claims_the_ticket_too(backend, agent, twilio, monkeypatch):
+    d = Dispatcher(agent, workers=1, retries=0, backoff=0, parallel_calls=1)
+    monkeypatch.setattr(backend.agent, 'dispatcher', d)
+    ticket_id = agent.tickets.create('VPN Problem', 'VPN down', [], ['VPN down'], urgent=True,
+                                     status=tickets.DISPATCHING)
+    job = d.submit('VPN Problem', 'VPN down', [], ticket_id)
+    wait_for(lambda: job.done)
+    other = Dispatcher(agent)
+    assert other.confirm(job.call_sid, 'noon', ticket_id) is True  # the webhook reached another worker
+    assert d.confirm(job.call_sid, '10 AM') is False  # a retried webhook can't schedule it twice
+    assert job.status != CONFIRMED
+    assert ticket(agent, ticket_id)['dispatch']['appointmentTime'] == 'noon'
+
+
+def test_claim_runs_outside_the_dispatcher_lock(backend, agent, twilio, monkeypatch):
+    d = dispatcher(backend, agent, monkeypatch)
+    job, _ = ringing(d, agent)
+    first, second, _ = job.calls
+    claim = agent.tickets.claim
+    monkeypatch.setattr(agent.tickets, 'claim', lambda *args: time.sleep(0.5) or claim(*args))
+    confirming = threading.Thread(target=d.confirm, args=(first, '10 AM'))
+    confirming.start()
+    time.sleep(0.1)
+    started = time.monotonic()
+    d.call_status(second, 'no-answer')
+    assert d.get(job.id) is job
+    assert time.monotonic() - started < 0.2
+    confirming.join()
+    assert job.status == CONFIRMED and job.call_sid == first
@@ -0,0 +1,103 @@
+import time
+import asyncio
+
+import pytest
+import requests
+
+from http_clients import OutboundClient, CircuitOpenError, CLOSED, OPEN, HALF_OPEN
+
+
+def calls_url(service) -> str:
+    return f"{service.url}/2010-04-01/Accounts/AC1/Calls.json"
+
+
+def test_breaker_opens_after_threshold_and_fails_fast(twilio):
+    client = OutboundClient('stub', threshold=3, reset_seconds=60)
+    twilio.fail_rate = 1.0
+    for _ in range(3):
+        assert client.post(calls_url(twilio), data={'To': '+1'}).status_code == 503
+    assert client.breaker.state == OPEN
+    sent = len(twilio.requests)
+    with pytest.raises(CircuitOpenError):
+        client.post(calls_url(twilio), data={'To': '+1'})
+    assert len(twilio.requests) == sent  # rejected without touching the upstream
+    assert client.stats()['rejected'] == 1
+
+
+def test_half_open_lets_one_trial_through_and_closes_on_success(twilio):
+    client = OutboundClient('stub', threshold=1, reset_seconds=0.2)
+    twilio.fail_rate = 1.0
+    client.post(calls_url(twilio))
+    assert client.breaker.state == OPEN
+    time.sleep(0.25)
+    twilio.fail_rate = 0.0
+    assert client.breaker.allow()  # the trial call
+    assert client.breaker.state == HALF_OPEN
+    assert not client.breaker.allow()  # only one at a time
+    client.breaker.success()
+    assert client.breaker.state == CLOSED
+    assert client.post(calls_url(twilio)).status_code == 201
+    assert client.breaker.failures == 0
+
+
+def test_failed_trial_reopens(twilio):
+    client = OutboundClient('stub', threshold=1, reset_seconds=0.2)
+    twilio.fail_rate = 1.0
+    client.post(calls_url(twilio))
+    time.sleep(0.25)
+    assert client.post(calls_url(twilio)).status_code == 503  # the trial fails
+    assert client.breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        client.post(calls_url(twilio))
+
+
+def test_read_timeout_counts_as_a_failure(twilio):
+    client = OutboundClient('stub', read_timeout=0.1, threshold=2, reset_seconds=60)
+    twilio.latency = 0.5
+    for _ in range(2):
+        with pytest.raises(requests.Timeout):
+            client.post(calls_url(twilio))
+    stats = client.stats()
+    assert stats['circuit'] == OPEN
+    assert stats['errors'] == 2
+    with pytest.raises(CircuitOpenError):
+        client.post(calls_url(twilio))
+
+
+def test_client_errors_do_not_trip_the_breaker(twilio):
+    client = OutboundClient('stub', threshold=1, reset_seconds=60)
+    for _ in range(3):
+        assert client.get(f"{twilio.url}/nothing-here").status_code == 404
+    assert client.breaker.state == CLOSED
+    assert client.stats()['errors'] == 0
+
+
+def test_cancelled_trial_frees_the_half_open_breaker(twilio):
+    client = OutboundClient('stub', threshold=1, reset_seconds=0.2)
+    twilio.fail_rate = 1.0
+    client.post(calls_url(twilio))
+    time.sleep(0.25)
+    twilio.fail_rate, twilio.latency = 0.0, 1.0
+
+    async def abandoned_trial():
+        trial = asyncio.ensure_future(client.arequest('POST', calls_url(twilio)))
+        await asyncio.sleep(0.2)
+        assert client.breaker.state == HALF_OPEN
+        trial.cancel()  # the caller disconnected mid-trial
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+        await client.aclose()
+    asyncio.run(abandoned_trial())
+    assert client.breaker.state == HALF_OPEN
+    assert client.breaker.allow()  # a new trial may go through
+
+
+def test_unreported_trial_expires(twilio):
+    client = OutboundClient('stub', threshold=1, reset_seconds=0.2)
+    twilio.fail_rate = 1.0
+    client.post(calls_url(twilio))
+    time.sleep(0.25)
+    assert client.breaker.allow()  # a trial whose caller never reports back
+    assert not client.breaker.allow()
+    time.sleep(0.25)
+    assert client.breaker.allow()
@@ -0,0 +1,107 @@
+import time
+
+import numpy as np
+import pytest
+
+import audio_decode
+import recordings
+from recordings import RecordingIngestor, TranscriptStore, RecordingError, download, DONE, FAILED
+
+
+class StubAgent:
+    """Stands in for the recognizer: the transcript says how much audio it was given"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def transcribe_audio(self, pcm) -> str:
+        self.calls += 1
+        return f"{len(pcm)} samples"
+
+
+@pytest.fixture
+def recording_url(twilio):
+    twilio.server.RequestHandlerClass.RECORDING_SECONDS = 3.0  # 8 kHz 16-bit: 48 kB
+    return f"{twilio.url}/2010-04-01/Accounts/AC1/Recordings/RE1.wav"
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TranscriptStore(str(tmp_path / 'recordings.db'))
+
+
+def wait_done(ingestor, call_sid: str, timeout: float = 10.0) -> list:
+    deadline = time.monotonic() + timeout
+    while True:
+        jobs = ingestor.for_call(call_sid)
+        if jobs and all(j.done for j in jobs):
+            return jobs
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.02)
+
+
+def test_callback_downloads_and_transcribes_off_the_caller(recording_url, store):
+    agent = StubAgent()
+    ingestor = RecordingIngestor(agent, store=store)
+    job = ingestor.submit('CA1', 'RE1', recording_url)
+    assert not job.done
+    [job] = wait_done(ingestor, 'CA1')
+    assert job.status == DONE
+    assert job.transcript == '48000 samples'  # 3 s resampled to 16 kHz
+    assert job.bytes == 44 + 3 * 8000 * 2
+    assert job.seconds == pytest.approx(3.0)
+
+
+@pytest.mark.parametrize('spool_bytes', [4096, 1 << 20], ids=['spilled-to-disk', 'in-memory'])
+def test_download_keeps_the_whole_recording_whatever_the_spool_size(recording_url, spool_bytes):
+    with download(recording_url, spool_bytes=spool_bytes, chunk_bytes=1024) as spool:
+        data = spool.read()
+        assert len(data) == 44 + 3 * 8000 * 2 and data[:4] == b'RIFF'
+        spool.seek(0)
+        assert len(audio_decode.decode_stream(spool, 'audio/wav')) == 3 * audio_decode.SAMPLE_RATE
+
+
+def test_download_rejects_oversized_recordings(recording_url):
+    with pytest.raises(RecordingError):
+        download(recording_url, max_bytes=10_000)
+
+
+def test_duplicate_callbacks_transcribe_once(recording_url, store):
+    agent = StubAgent()
+    ingestor = RecordingIngestor(agent, store=store)
+    first = ingestor.submit('CA1', 'RE1', recording_url)
+    assert ingestor.submit('CA1', 'RE1', recording_url) is first
+    wait_done(ingestor, 'CA1')
+    # A retry reaching another worker finds the finished transcript in the shared store
+    other = RecordingIngestor(agent, store=TranscriptStore(store.path))
+    assert other.submit('CA1', 'RE1', recording_url).status == DONE
+    assert agent.calls == 1
+
+
+def test_transcripts_are_visible_to_other_workers(recording_url, store):
+    ingestor = RecordingIngestor(StubAgent(), store=store)
+    ingestor.submit('CA1', 'RE1', recording_url)
+    wait_done(ingestor, 'CA1')
+    [job] = RecordingIngestor(StubAgent(), store=TranscriptStore(store.path)).for_call('CA1')
+    assert (job.recording_sid, job.status, job.transcript) == ('RE1', DONE, '48000 samples')
+
+
+def test_failed_download_is_recorded_and_can_be_retried(twilio, recording_url, store):
+    ingestor = RecordingIngestor(StubAgent(), store=store)
+    twilio.fail_rate = 1.0
+    ingestor.submit('CA1', 'RE1', recording_url)
+    [job] = wait_done(ingestor, 'CA1')
+    assert job.status == FAILED and '503' in job.error
+    twilio.fail_rate = 0.0
+    retry = ingestor.submit('CA1', 'RE1', recording_url)
+    assert retry is not job
+    [job] = wait_done(ingestor, 'CA1')
+    assert job.status == DONE
+
+
+def test_ingest_is_bounded(recording_url, store, monkeypatch):
+    ingestor = RecordingIngestor(StubAgent(), workers=1, max_pending=1, store=store)
+    monkeypatch.setattr(ingestor, 'fetch', lambda url: time.sleep(0.3) or (np.zeros(0), 0))
+    ingestor.submit('CA1', 'RE1', recording_url)
+    with pytest.raises(recordings.IngestBusy):
+        ingestor.submit('CA1', 'RE2', recording_url)
@@ -0,0 +1,128 @@
+import time
+
+import numpy as np
+import pytest
+
+import asr
+from vad import EnergyVAD
+
+
+@pytest.fixture
+def client(backend, monkeypatch):
+    # Skip decoding and recognition: each turn "hears" whatever the test queued
+    heard = []
+    monkeypatch.setattr(backend.audio_decode, 'decode_audio', lambda audio, mime: audio)
+    monkeypatch.setattr(backend.agent, 'transcribe_audio', lambda pcm: heard.pop(0))
+    client = backend.app.test_client()
+    client.heard = heard
+    return client
+
+
+def say(client, session: dict, text: str) -> dict:
+    client.heard.append(text)
+    resp = client.post(f"/conversation?sessionId={session['sessionId']}&version={session['version']}",
+                       data=b'audio', content_type='audio/webm')
+    assert resp.status_code == 200
+    return resp.get_json()
+
+
+def test_describe_then_calling_with_the_returned_version(client):
+    session = client.post('/conversation', json={'step': 'greet'}).get_json()
+    described = say(client, session, 'The server is down, this is urgent, please send someone')
+    assert described['nextStep'] == 'calling'
+    assert described['version'] == session['version'] + 1
+
+    # What the web client sends next: the calling step with the version the describe turn returned
+    calling = client.post('/conversation', json={'sessionId': described['sessionId'], 'version': described['version'],
+                                                 'step': 'calling', 'audioBase64': ''})
+    assert calling.status_code == 200
+    body = calling.get_json()
+    assert body['dispatchJob'] and body['ticketId']
+    assert body['nextStep'] == 'complete'
+    # Let the background dispatch (to an unreachable Twilio) finish inside the test
+    wait_for(lambda: client.get(f"/dispatch/{body['dispatchJob']}").get_json()['done'])
+
+
+def wait_for(condition, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.05)
+
+
+def test_calling_with_a_stale_version_is_rejected(client):
+    session = client.post('/conversation', json={'step': 'greet'}).get_json()
+    described = say(client, session, 'The server is down, this is urgent, please send someone')
+    stale = client.post('/conversation', json={'sessionId': session['sessionId'], 'version': session['version'],
+                                               'step': 'calling', 'audioBase64': ''})
+    assert stale.status_code == 409
+    assert stale.get_json()['version'] == described['version']
+
+
+class HeardEngine(asr.TranscriptionEngine):
+    """Buffers streamed audio like the hosted engines; "hears" what the test queued"""
+    name = 'heard'
+
+    def __init__(self, heard: list):
+        self.heard = heard
+        self.lengths = []
+
+    def transcribe(self, pcm, sample_rate: int = asr.SAMPLE_RATE) -> str:
+        self.lengths.append(len(pcm))
+        return self.heard.pop(0)
+
+
+@pytest.fixture
+def engine(backend, client, monkeypatch):
+    engine = HeardEngine(client.heard)
+    monkeypatch.setattr(backend.streams, 'get_engine', lambda: engine)
+    monkeypatch.setattr(backend.agent, 'vad', EnergyVAD())
+    return engine
+
+
+def speech(seconds: float = 0.5) -> bytes:
+    """A loud tone between two stretches of silence, as int16 PCM"""
+    t = np.arange(int(seconds * asr.SAMPLE_RATE)) / asr.SAMPLE_RATE
+    tone = (8000 * np.sin(2 * np.pi * 300 * t)).astype(np.int16)
+    silence = np.zeros(asr.SAMPLE_RATE, dtype=np.int16)
+    return np.concatenate([silence, tone, silence]).tobytes()
+
+
+def stream(client, session: dict, audio: bytes):
+    opened = client.post('/conversation/stream', json={'sessionId': session['sessionId'],
+                                                        'version': session['version']})
+    assert opened.status_code == 200
+    stream_id = opened.get_json()['streamId']
+    assert client.post(f"/conversation/stream/{stream_id}/audio", data=audio,
+                       content_type='application/octet-stream').status_code == 200
+    return stream_id
+
+
+def test_an_abandoned_stream_does_not_use_up_the_turn(client, engine):
+    session = client.post('/conversation', json={'step': 'greet'}).get_json()
+    stream(client, session, speech())  # the tab closed before the stream was ended
+    described = say(client, session, 'The server is down, this is urgent, please send someone')
+    assert described['version'] == session['version'] + 1
+
+
+def test_a_stream_with_a_stale_version_is_rejected_when_it_ends(client, engine):
+    session = client.post('/conversation', json={'step': 'greet'}).get_json()
+    stream_id = stream(client, session, speech())
+    described = say(client, session, 'The server is down, this is urgent, please send someone')
+    ended = client.post(f"/conversation/stream/{stream_id}/end")
+    assert ended.status_code == 409
+    assert ended.get_json()['version'] == described['version']
+    assert engine.lengths == []  # rejected before any recognition
+
+
+def test_streams_are_trimmed_to_speech_like_uploads(client, engine):
+    session = client.post('/conversation', json={'step': 'greet'}).get_json()
+    client.heard.append('The server is down, this is urgent, please send someone')
+    ended = client.post(f"/conversation/stream/{stream(client, session, speech())}/end")
+    assert ended.status_code == 200
+    assert ended.get_json()['version'] == session['version'] + 1
+    assert engine.lengths and engine.lengths[0] < 1.5 * asr.SAMPLE_RATE
+
+    silent = stream(client, ended.get_json(), np.zeros(asr.SAMPLE_RATE, dtype=np.int16).tobytes())
+    assert client.post(f"/conversation/stream/{silent}/end").status_code == 200
+    assert len(engine.lengths) == 1  # nothing said: never reached the recognizer
@@ -0,0 +1,85 @@
+import os
+from datetime import datetime
+
+import pytest
+
+from technicians import Availability, TechnicianRegistry
+
+HEADER = 'Problem Type,Name,Skillset,Contact,Availability\n'
+
+
+@pytest.mark.parametrize('text, spans', [
+    ('24x7', [(0, 1440)]),
+    ('Always', [(0, 1440)]),
+    ('9 AM - 6 PM', [(540, 1080)]),
+    ('9 - 6 PM', [(540, 1080)]),
+    ('1 - 5 PM', [(780, 1020)]),
+    ('10 - 2 AM', [(1320, 1440), (0, 120)]),
+    ('12 AM to 12 PM', [(0, 720)]),
+    ('09:30-17:45', [(570, 1065)]),
+    ('22:00-24:00', [(1320, 1440)]),
+    ('10 PM - 6 AM', [(1320, 1440), (0, 360)]),
+])
+def test_availability_parses_windows(text, spans):
+    assert Availability.parse(text).spans() == spans
+
+
+@pytest.mark.parametrize('text', ['', 'on call', '22:00-24:30', '25:00-26:00', '9:75 - 10', '9 AM'])
+def test_availability_rejects_bad_windows(text):
+    assert Availability.parse(text) is None
+
+
+def test_overnight_shift_covers_both_sides_of_midnight():
+    shift = Availability.parse('10 PM - 6 AM')
+    assert shift.covers(23 * 60) and shift.covers(0) and shift.covers(359)
+    assert not shift.covers(360) and not shift.covers(12 * 60)
+
+
+def write(path, rows: str):
+    path.write_text(HEADER + rows)
+    # mtime granularity can hide a rewrite within the same tick
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+@pytest.fixture
+def roster(tmp_path):
+    path = tmp_path / 'technicians.csv'
+    write(path, 'VPN Problem,Asha,Network,+15550000001,9 AM - 6 PM\n'
+                'VPN Problem,Bilal,Network,+15550000002,10 PM - 6 AM\n'
+                'Software Bug,Chen,Apps,+15550000003,24x7\n')
+    return path, TechnicianRegistry(str(path), reload_seconds=0)
+
+
+def test_ranking_prefers_on_shift_specialists(roster):
+    _, registry = roster
+    noon, midnight = datetime(2026, 1, 5, 12, 0), datetime(2026, 1, 5, 0, 30)
+    assert [t.name for t in registry.available_now('VPN Problem', noon)] == ['Asha']
+    assert [t.name for t in registry.candidates('VPN Problem', noon)] == ['Asha', 'Bilal', 'Chen']
+    assert [t.name for t in registry.candidates('VPN Problem', midnight)] == ['Bilal', 'Asha', 'Chen']
+    assert [t.name for t in registry.available_now(now=midnight)] == ['Bilal', 'Chen']
+
+
+def test_hot_reload_picks_up_changes(roster):
+    path, registry = roster
+    assert len(registry) == 3
+    write(path, 'VPN Problem,Dana,Network,+15550000004,24x7\n')
+    assert [t.name for t in registry] == ['Dana']
+
+
+def test_bad_row_is_unavailable_not_fatal(roster):
+    path, registry = roster
+    write(path, 'VPN Problem,Dana,Network,+15550000004,22:00-24:30\n'
+                'VPN Problem,Emeka,Network,+15550000005,24x7\n')
+    assert [t.name for t in registry.candidates('VPN Problem', datetime(2026, 1, 5, 23, 0))] == ['Emeka', 'Dana']
+    assert registry.select('VPN Problem').name == 'Emeka'
+
+
+def test_unreadable_reload_keeps_the_last_roster(roster):
+    path, registry = roster
+    assert len(registry) == 3
+    path.write_bytes(HEADER.encode() + b'VPN Problem,\xff\xfe,Network,+1555,24x7\n')
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2_000_000_000))
+    assert len(registry) == 3
+    assert registry.select('Software Bug').name == 'Chen'
@@ -0,0 +1,106 @@
+import time
+
+import pytest
+
+import tickets
+from tickets import TicketStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TicketStore(str(tmp_path / 'tickets.db'), retry_backoff_ms=1)
+
+
+def new(store, problem_type: str = 'VPN Problem', status: str = tickets.OPEN) -> str:
+    return store.create(problem_type, 'VPN down', ['since 9'], ['VPN down', '', 'since 9'], urgent=False, status=status)
+
+
+def test_created_ticket_is_readable_after_flush(store):
+    ticket_id = new(store)
+    assert store.flush(5.0)
+    ticket = store.get(ticket_id)
+    assert ticket['ticketId'] == ticket_id and ticket['status'] == tickets.OPEN
+    assert ticket['problemType'] == 'VPN Problem' and ticket['urgent'] is False
+    assert ticket['diagAnswers'] == ['since 9'] and ticket['transcript'] == ['VPN down', 'since 9']
+    assert store.get('missing') is None
+
+
+def test_claim_wins_once_and_outlasts_unclaimed_updates(store):
+    ticket_id = new(store, status=tickets.DISPATCHING)
+    assert store.claim(ticket_id, tickets.SCHEDULED, {'technician': 'Asha'})
+    assert not store.claim(ticket_id, tickets.SCHEDULED, {'technician': 'Bilal'})
+    store.update(ticket_id, tickets.ESCALATED, {'status': 'failed'}, unclaimed=True)
+    store.flush(5.0)
+    ticket = store.get(ticket_id)
+    assert ticket['status'] == tickets.SCHEDULED and ticket['dispatch'] == {'technician': 'Asha'}
+    store.update(ticket_id, dispatch={'technician': 'Asha', 'appointmentTime': '3 PM'})
+    store.flush(5.0)
+    assert store.get(ticket_id)['dispatch']['appointmentTime'] == '3 PM'
+
+
+def test_unclaimed_update_applies_while_dispatching(store):
+    ticket_id = new(store, status=tickets.DISPATCHING)
+    store.update(ticket_id, tickets.ESCALATED, {'status': 'failed'}, unclaimed=True)
+    store.flush(5.0)
+    assert store.get(ticket_id)['status'] == tickets.ESCALATED
+    assert not store.claim(ticket_id, tickets.SCHEDULED, {})
+
+
+def test_query_pages_newest_first(store):
+    ids = []
+    for i in range(5):
+        ids.append(new(store, 'Software Bug' if i % 2 else 'VPN Problem'))
+        time.sleep(0.002)  # distinct created times
+    store.flush(5.0)
+    first = store.query(limit=2)
+    assert [t['ticketId'] for t in first] == ids[:2:-1]
+    rest = store.query(limit=10, before=first[-1]['created'])
+    assert [t['ticketId'] for t in rest] == ids[2::-1]
+    assert [t['ticketId'] for t in store.query('Software Bug')] == [ids[3], ids[1]]
+    assert store.query(status=tickets.SCHEDULED) == []
+
+
+def test_counts_by_type_and_status(store):
+    for problem_type, status in [('VPN Problem', tickets.OPEN), ('VPN Problem', tickets.OPEN),
+                                 ('VPN Problem', tickets.DISPATCHING), ('Software Bug', tickets.OPEN)]:
+        new(store, problem_type, status)
+    store.flush(5.0)
+    assert store.counts() == {'VPN Problem': {tickets.OPEN: 2, tickets.DISPATCHING: 1},
+                              'Software Bug': {tickets.OPEN: 1}}
+
+
+def test_a_bad_row_only_drops_itself(tmp_path):
+    store = TicketStore(str(tmp_path / 'tickets.db'), commit_wait_ms=200, retries=1, retry_backoff_ms=1)
+    good = new(store)
+    store._submit(('insert', (good, 0, 0, tickets.OPEN, 0, '', '', '[]', '[]', None)))  # duplicate id
+    other = new(store)
+    assert store.flush(5.0)
+    assert store.get(good) and store.get(other)
+    assert (store.written, store.failed) == (2, 1)
+
+
+def test_writer_survives_an_unexpected_error(store, monkeypatch):
+    commit = store._commit
+    calls = []
+
+    def flaky(conn, writes):
+        calls.append(len(writes))
+        if len(calls) == 1:
+            raise RuntimeError('boom')
+        commit(conn, writes)
+    monkeypatch.setattr(store, '_commit', flaky)
+    lost = new(store)
+    started = time.monotonic()
+    assert store.flush(5.0) and time.monotonic() - started < 1.0
+    kept = new(store)
+    assert store.flush(5.0)
+    assert store.get(lost) is None and store.get(kept)
+    assert store.failed == 1
+
+
+def test_database_is_created_on_first_use(tmp_path):
+    path = tmp_path / 'tickets.db'
+    store = TicketStore(str(path))
+    assert not path.exists()  # importing the app doesn't touch the disk
+    assert store.counts() == {}
+    assert path.exists()
@@ -0,0 +1,68 @@
+import os
+import time
+
+import pytest
+
+import tts_cache
+from tts_cache import TTSCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return TTSCache(str(tmp_path), disk_bytes=300, memory_bytes=800)
+
+
+def test_put_publishes_to_disk_and_memory(cache, tmp_path):
+    cache.put('a', b'x' * 100)
+    assert (tmp_path / 'a.mp3').read_bytes() == b'x' * 100
+    assert cache.get('a') == (b'x' * 100, None)
+    # A fresh cache over the same directory finds it on disk
+    data, path = TTSCache(str(tmp_path)).get('a')
+    assert data is None and path == str(tmp_path / 'a.mp3')
+    assert not list(tmp_path.glob('*.part'))
+
+
+def test_disk_is_an_lru_bounded_by_size(cache, tmp_path):
+    for key in 'abc':
+        cache.put(key, b'x' * 100)
+    cache.get('a')  # now the most recent
+    cache.put('d', b'x' * 100)
+    assert sorted(p.stem for p in tmp_path.glob('*.mp3')) == ['a', 'c', 'd']
+    assert not cache.contains('b') and cache.get('b') == (None, None)
+    assert cache.stats()['diskBytes'] == 300
+
+
+def test_memory_is_an_lru_bounded_by_size(tmp_path):
+    cache = TTSCache(str(tmp_path), memory_bytes=250)
+    for key in 'abc':
+        cache.put(key, b'x' * 100)
+    stats = cache.stats()
+    assert stats['memoryEntries'] == 2 and stats['memoryBytes'] == 200
+    data, path = cache.get('a')  # dropped from memory, still on disk
+    assert data is None and path
+
+
+def test_tee_publishes_only_a_complete_stream(cache, tmp_path):
+    assert b''.join(cache.tee('full', iter([b'ab', b'cd']))) == b'abcd'
+    assert (tmp_path / 'full.mp3').read_bytes() == b'abcd'
+
+    def broken():
+        yield b'ab'
+        raise ConnectionError('upstream dropped')
+    with pytest.raises(ConnectionError):
+        list(cache.tee('broken', broken()))
+    stream = cache.tee('abandoned', iter([b'ab', b'cd']))
+    next(stream)
+    stream.close()  # the client went away
+    assert not cache.contains('broken') and not cache.contains('abandoned')
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['full.mp3']
+
+
+def test_scan_removes_stale_part_files(tmp_path):
+    stale, fresh = tmp_path / 'dead.part', tmp_path / 'live.part'
+    stale.write_bytes(b'ab')
+    fresh.write_bytes(b'ab')
+    old = time.time() - tts_cache.PART_MAX_AGE_SECONDS - 60
+    os.utime(stale, (old, old))
+    TTSCache(str(tmp_path))
+    assert not stale.exists() and fresh.exists()
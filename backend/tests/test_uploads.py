@@ -0,0 +1,77 @@
+import base64
+import io
+import json
+
+import pytest
+
+AUDIO = b'\x1a\x45\xdf\xa3' + bytes(range(256)) * 4
+
+
+@pytest.fixture
+def client(backend, monkeypatch):
+    # Record what reached the decoder instead of decoding it
+    received = []
+    monkeypatch.setattr(backend.audio_decode, 'decode_audio', lambda audio, mime: received.append((audio, mime)) or audio)
+    monkeypatch.setattr(backend.agent, 'transcribe_audio', lambda pcm: 'The server is down, please send someone')
+    client = backend.app.test_client()
+    client.received = received
+    return client
+
+
+def greet(client) -> dict:
+    return client.post('/conversation', json={'step': 'greet'}).get_json()
+
+
+def test_multipart_upload_carries_audio_and_metadata(client):
+    session = greet(client)
+    metadata = {'sessionId': session['sessionId'], 'version': session['version']}
+    resp = client.post('/conversation', content_type='multipart/form-data', data={
+        'metadata': json.dumps(metadata),
+        'audio': (io.BytesIO(AUDIO), 'turn.webm', 'audio/webm;codecs=opus'),
+    })
+    assert resp.status_code == 200
+    assert resp.get_json()['version'] == session['version'] + 1
+    assert client.received == [(AUDIO, 'audio/webm')]
+
+
+@pytest.mark.parametrize('via', ['query', 'headers'])
+def test_raw_upload_takes_the_session_from_query_or_headers(client, via):
+    session = greet(client)
+    if via == 'query':
+        url, headers = f"/conversation?sessionId={session['sessionId']}&version={session['version']}", {}
+    else:
+        url, headers = '/conversation', {'X-Session-Id': session['sessionId'],
+                                         'X-Session-Version': str(session['version'])}
+    resp = client.post(url, data=AUDIO, content_type='audio/ogg', headers=headers)
+    assert resp.status_code == 200
+    assert resp.get_json()['version'] == session['version'] + 1
+    assert client.received == [(AUDIO, 'audio/ogg')]
+
+
+def test_octet_stream_upload_leaves_the_format_to_the_decoder(client):
+    session = greet(client)
+    url = f"/conversation?sessionId={session['sessionId']}&version={session['version']}"
+    assert client.post(url, data=AUDIO, content_type='application/octet-stream').status_code == 200
+    assert client.received == [(AUDIO, '')]
+
+
+def test_json_data_url_upload_still_works(client):
+    session = greet(client)
+    data_url = 'data:audio/webm;base64,' + base64.b64encode(AUDIO).decode()
+    resp = client.post('/conversation', json={'sessionId': session['sessionId'], 'version': session['version'],
+                                              'audioBase64': data_url})
+    assert resp.status_code == 200
+    assert client.received == [(AUDIO, 'audio/webm')]
+
+
+@pytest.mark.parametrize('content_type', ['audio/webm', 'multipart/form-data'])
+def test_uploads_over_the_limit_are_refused(backend, client, monkeypatch, content_type):
+    monkeypatch.setitem(backend.app.config, 'MAX_CONTENT_LENGTH', len(AUDIO) // 2)
+    if content_type == 'multipart/form-data':
+        body = {'metadata': '{}', 'audio': (io.BytesIO(AUDIO), 'turn.webm', 'audio/webm')}
+    else:
+        body = AUDIO
+    resp = client.post('/conversation', data=body, content_type=content_type)
+    assert resp.status_code == 413
+    assert 'Upload exceeds' in resp.get_json()['error']
+    assert client.received == []
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from vad import SAMPLE_RATE, EnergyVAD, NullVAD
+
+
+def noise(seconds: float, dbfs: float, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.normal(0, 32768 * 10 ** (dbfs / 20), int(seconds * SAMPLE_RATE))
+
+
+def pcm(samples: np.ndarray) -> np.ndarray:
+    return np.clip(samples, -32768, 32767).astype(np.int16)
+
+
+def tone_in_noise() -> np.ndarray:
+    """2 s of -45 dBFS noise with a -12 dBFS tone from 0.8 s to 1.4 s"""
+    samples = noise(2.0, -45)
+    t = np.arange(int(0.6 * SAMPLE_RATE)) / SAMPLE_RATE
+    start = int(0.8 * SAMPLE_RATE)
+    samples[start:start + len(t)] += 32768 * 0.25 * np.sin(2 * np.pi * 300 * t)
+    return pcm(samples)
+
+
+@pytest.mark.parametrize('clip', [np.zeros(2 * SAMPLE_RATE), noise(2.0, -45), noise(2.0, -35), noise(2.0, -20)],
+                         ids=['silent', 'noise-45dB', 'noise-35dB', 'noise-20dB'])
+def test_energy_rejects_clips_without_speech(clip):
+    vad = EnergyVAD()
+    assert len(vad.trim(pcm(clip))) == 0
+    assert vad.stats.snapshot()['rejectedSilent'] == 1
+
+
+def test_energy_keeps_the_tone_and_drops_the_noise_around_it():
+    clip = tone_in_noise()
+    [(start, end)] = EnergyVAD(pad_ms=0).segments(clip)
+    assert start == pytest.approx(0.8 * SAMPLE_RATE, abs=480)
+    assert end == pytest.approx(1.4 * SAMPLE_RATE, abs=480)
+    assert 0 < len(EnergyVAD().trim(clip)) < len(clip)
+
+
+@pytest.mark.parametrize('clip', [pcm(np.zeros(2 * SAMPLE_RATE)), pcm(noise(2.0, -45)), tone_in_noise()],
+                         ids=['silent', 'noise', 'tone-in-noise'])
+def test_null_vad_keeps_everything(clip):
+    vad = NullVAD()
+    assert np.array_equal(vad.trim(clip), clip)
+    assert vad.speech_frames(clip).all()
+    assert vad.stats.snapshot()['rejectedSilent'] == 0
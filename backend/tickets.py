@@ -0,0 +1,265 @@
+"""Support tickets in an embedded SQLite database (WAL), written asynchronously.
+
+create() and update() only enqueue; one writer thread per process drains the queue and
+commits everything waiting as a single transaction, so a burst of turns costs one fsync
+rather than one each. Reads go straight to the database and see a write once its batch has
+committed (normally within TICKET_COMMIT_WAIT_MS); flush() waits for that. claim() is the
+one synchronous write: it settles which technician's confirmation takes a ticket.
+"""
+import os
+import json
+import time
+import uuid
+import queue
+import atexit
+import sqlite3
+import threading
+
+import telemetry
+
+log = telemetry.get_logger('tickets')
+
+TICKET_DB = os.getenv('TICKET_DB') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tickets.db')
+TICKET_BATCH_MAX = int(os.getenv('TICKET_BATCH_MAX', '256'))
+TICKET_COMMIT_WAIT_MS = float(os.getenv('TICKET_COMMIT_WAIT_MS', '10'))
+# A failed batch is retried this many times, backing off from TICKET_RETRY_BACKOFF_MS, then
+# written one row at a time so only a row that can't be written is dropped
+TICKET_WRITE_RETRIES = int(os.getenv('TICKET_WRITE_RETRIES') or 3)
+TICKET_RETRY_BACKOFF_MS = float(os.getenv('TICKET_RETRY_BACKOFF_MS') or 100)
+
+# open: non-urgent, awaiting follow-up; dispatching: technician calls in progress;
+# dispatched: call placed; scheduled: a technician confirmed a time; escalated: dispatch failed
+OPEN, DISPATCHING, DISPATCHED, SCHEDULED, ESCALATED = 'open', 'dispatching', 'dispatched', 'scheduled', 'escalated'
+STATUSES = (OPEN, DISPATCHING, DISPATCHED, SCHEDULED, ESCALATED)
+
+COLUMNS = ('id', 'created', 'updated', 'status', 'urgent', 'problem_type', 'user_problem',
+           'diag_answers', 'transcript', 'dispatch')
+JSON_COLUMNS = ('diag_answers', 'transcript', 'dispatch')
+FIELDS = {'id': 'ticketId', 'problem_type': 'problemType', 'user_problem': 'userProblem',
+          'diag_answers': 'diagAnswers'}
+SELECT = f"SELECT {', '.join(COLUMNS)} FROM tickets"
+INSERT = f"INSERT INTO tickets ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+UPDATE = 'UPDATE tickets SET status = COALESCE(?, status), dispatch = COALESCE(?, dispatch), updated = ? WHERE id = ?'
+# Until a technician takes the ticket; after that only the confirmation's own writes apply
+UNCLAIMED = f"status IN ('{DISPATCHING}', '{DISPATCHED}')"
+UPDATE_UNCLAIMED = f"{UPDATE} AND {UNCLAIMED}"
+WRITES = {'insert': INSERT, 'update': UPDATE, 'update_unclaimed': UPDATE_UNCLAIMED}
+
+
+class TicketStore:
+    """One WAL database per host: every worker writes to and reads from the same file"""
+
+    def __init__(self, path: str = TICKET_DB, batch_max: int = TICKET_BATCH_MAX,
+                 commit_wait_ms: float = TICKET_COMMIT_WAIT_MS, retries: int = TICKET_WRITE_RETRIES,
+                 retry_backoff_ms: float = TICKET_RETRY_BACKOFF_MS):
+        self.path = path
+        self.batch_max = max(1, batch_max)
+        self.commit_wait = commit_wait_ms / 1000.0
+        self.retries = max(0, retries)
+        self.retry_backoff = retry_backoff_ms / 1000.0
+        self._local = threading.local()
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._created = False
+        self.written = 0
+        self.commits = 0
+        self.failed = 0
+        atexit.register(self.flush, 5.0)
+
+    def _create(self):
+        """Create the database on first use rather than at import, once per process"""
+        if self._created:
+            return
+        with self._lock:
+            if self._created:
+                return
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS tickets ('
+                'id TEXT PRIMARY KEY, created REAL NOT NULL, updated REAL NOT NULL, status TEXT NOT NULL, '
+                'urgent INTEGER NOT NULL, problem_type TEXT NOT NULL, user_problem TEXT NOT NULL, '
+                'diag_answers TEXT NOT NULL, transcript TEXT NOT NULL, dispatch TEXT)'
+            )
+            # Backlog queries filter on type and/or status and page newest first
+            conn.execute('CREATE INDEX IF NOT EXISTS tickets_type_status ON tickets (problem_type, status, created)')
+            conn.execute('CREATE INDEX IF NOT EXISTS tickets_status ON tickets (status, created)')
+            conn.close()
+            self._created = True
+
+    # --- writes ---
+
+    def create(self, problem_type: str, user_problem: str, diag_answers: list[str], transcript: list[str],
+               urgent: bool, status: str = OPEN) -> str:
+        """Queue a new ticket and return its id without waiting for the write"""
+        now = time.time()
+        ticket_id = uuid.uuid4().hex
+        self._submit(('insert', (ticket_id, now, now, status, int(urgent), problem_type or '', user_problem or '',
+                                 json.dumps(list(diag_answers or [])), json.dumps([t for t in transcript if t]), None)))
+        return ticket_id
+
+    def update(self, ticket_id: str, status: str | None = None, dispatch: dict | None = None,
+               unclaimed: bool = False):
+        """Queue a status/dispatch change; with unclaimed, it is dropped if a technician has
+        confirmed the ticket by the time it commits"""
+        if not ticket_id:
+            return
+        self._submit(('update_unclaimed' if unclaimed else 'update',
+                      (status, None if dispatch is None else json.dumps(dispatch), time.time(), ticket_id)))
+
+    def claim(self, ticket_id: str, status: str, dispatch: dict) -> bool:
+        """Take a ticket that no technician has confirmed yet, synchronously and across workers:
+        of several claims on the same ticket exactly one returns True"""
+        self.flush(5.0)  # the ticket itself may still be queued in this process
+        try:
+            cur = self._conn().execute(UPDATE_UNCLAIMED, (status, json.dumps(dispatch), time.time(), ticket_id))
+        except sqlite3.Error as e:
+            log.error(f"[Tickets] Could not claim {ticket_id}: {e}")
+            return False
+        return cur.rowcount == 1
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Wait until everything queued so far is committed"""
+        if self._pid != os.getpid():
+            return True  # nothing was queued in this process
+        done = threading.Event()
+        self._queue.put(('flush', done))
+        return done.wait(timeout)
+
+    def _submit(self, op: tuple):
+        if self._pid != os.getpid():
+            self._start()
+        self._queue.put(op)
+
+    def _start(self):
+        """The writer is started per process on first write, so a store created before fork works"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.SimpleQueue()
+            threading.Thread(target=self._write_loop, name='ticket-writer', daemon=True).start()
+            self._pid = os.getpid()
+
+    def _write_loop(self):
+        conn = None
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.commit_wait
+            while len(batch) < self.batch_max:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            writes = [op for op in batch if op[0] != 'flush']
+            try:
+                if conn is None:
+                    self._create()
+                    conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+                    conn.execute('PRAGMA synchronous=NORMAL')
+                if writes:
+                    self._commit(conn, writes)
+            except Exception as e:  # the writer must outlive any one batch
+                self.failed += len(writes)
+                log.error(f"[Tickets] Dropped a batch of {len(writes)} write(s) on an unexpected error: {e}")
+                if conn is not None:
+                    conn.close()
+                conn = None
+            finally:
+                for kind, done in batch:
+                    if kind == 'flush':
+                        done.set()
+
+    def _commit(self, conn: sqlite3.Connection, writes: list[tuple]):
+        """Commit the batch as one transaction, retried with backoff; failing that, row by row"""
+        for attempt in range(self.retries + 1):
+            try:
+                self._transaction(conn, writes)
+                self.written += len(writes)
+                self.commits += 1
+                return
+            except sqlite3.Error as e:
+                error = e
+                if attempt < self.retries:
+                    time.sleep(self.retry_backoff * 2 ** attempt)
+        log.warning(f"[Tickets] Batch of {len(writes)} write(s) failed {self.retries + 1} time(s) ({error}); "
+                    f"writing one at a time")
+        for kind, args in writes:
+            try:
+                self._transaction(conn, [(kind, args)])
+                self.written += 1
+                self.commits += 1
+            except sqlite3.Error as e:
+                self.failed += 1
+                log.error(f"[Tickets] Dropped {kind} of ticket {args[0] if kind == 'insert' else args[-1]}: {e}")
+
+    @staticmethod
+    def _transaction(conn: sqlite3.Connection, writes: list[tuple]):
+        try:
+            with telemetry.span('ticket_commit'):
+                conn.execute('BEGIN IMMEDIATE')
+                for kind, args in writes:
+                    conn.execute(WRITES[kind], args)
+                conn.execute('COMMIT')
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+
+    # --- reads ---
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            self._create()
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _to_dict(row: tuple) -> dict:
+        ticket = {}
+        for column, value in zip(COLUMNS, row):
+            if column in JSON_COLUMNS and value is not None:
+                value = json.loads(value)
+            elif column == 'urgent':
+                value = bool(value)
+            ticket[FIELDS.get(column, column)] = value
+        return ticket
+
+    def get(self, ticket_id: str) -> dict | None:
+        row = self._conn().execute(SELECT + ' WHERE id = ?', (ticket_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def query(self, problem_type: str | None = None, status: str | None = None,
+              limit: int = 50, before: float | None = None) -> list[dict]:
+        """Newest first; pass the last result's `created` as `before` for the next page"""
+        where, args = [], []
+        if problem_type:
+            where.append('problem_type = ?')
+            args.append(problem_type)
+        if status:
+            where.append('status = ?')
+            args.append(status)
+        if before is not None:
+            where.append('created < ?')
+            args.append(before)
+        sql = SELECT
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY created DESC LIMIT ?'
+        rows = self._conn().execute(sql, (*args, max(1, min(limit, 500)))).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def counts(self) -> dict:
+        """Ticket count per problem type and status"""
+        rows = self._conn().execute(
+            'SELECT problem_type, status, COUNT(*) FROM tickets GROUP BY problem_type, status').fetchall()
+        counts = {}
+        for problem_type, status, n in rows:
+            counts.setdefault(problem_type, {})[status] = n
+        return counts
+
+    def stats(self) -> dict:
+        return {'written': self.written, 'commits': self.commits, 'failed': self.failed,
+                'pending': self._queue.qsize() if self._pid == os.getpid() else 0}
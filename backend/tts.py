@@ -0,0 +1,175 @@
+import io
+import os
+import asyncio
+import math
+import wave
+import zlib
+
+import numpy as np
+
+import http_clients
+import tts_cache
+import telemetry
+
+log = telemetry.get_logger('tts')
+
+TTS_BACKEND = os.getenv('TTS_BACKEND', 'elevenlabs').lower()
+ELEVENLABS_API_BASE = os.getenv('ELEVENLABS_API_BASE', 'https://api.elevenlabs.io')
+ELEVENLABS_API_KEY = os.getenv('ELEVENLABS_API_KEY')
+ELEVENLABS_VOICE_ID = os.getenv('ELEVENLABS_VOICE_ID')
+ELEVENLABS_MODEL_ID = os.getenv('ELEVENLABS_MODEL_ID', 'eleven_monolingual_v1')
+ELEVENLABS_VOICE_SETTINGS = {"stability": 0.5, "similarity_boost": 0.75}
+TTS_CHUNK_BYTES = 4096
+
+
+class TTSError(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+class Synthesizer:
+    name = 'base'
+    mimetype = 'audio/mpeg'
+    ext = '.mp3'
+
+    def available(self) -> bool:
+        return True
+
+    def cache_key(self, text: str) -> str:
+        raise NotImplementedError
+
+    def stream(self, text: str):
+        """Start synthesis and return an iterator of audio chunks.
+
+        Upstream errors are raised here, before any bytes are handed to the client.
+        """
+        raise NotImplementedError
+
+    def synthesize(self, text: str) -> bytes:
+        return b''.join(self.stream(text))
+
+    async def astream(self, text: str):
+        """Async stream(); by default the blocking iterator is drained on worker threads"""
+        loop = asyncio.get_running_loop()
+        chunks = await loop.run_in_executor(None, lambda: iter(self.stream(text)))
+        return self._drain(loop, chunks)
+
+    async def _drain(self, loop, chunks):
+        while True:
+            chunk = await loop.run_in_executor(None, next, chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+
+
+class ElevenLabsSynthesizer(Synthesizer):
+    name = 'elevenlabs'
+
+    def __init__(self, api_key=ELEVENLABS_API_KEY, voice_id=ELEVENLABS_VOICE_ID,
+                 model_id=ELEVENLABS_MODEL_ID, voice_settings=None, api_base=ELEVENLABS_API_BASE):
+        self.api_key = api_key
+        self.voice_id = voice_id
+        self.model_id = model_id
+        self.voice_settings = voice_settings or ELEVENLABS_VOICE_SETTINGS
+        self.api_base = api_base.rstrip('/')
+        self.client = http_clients.client('elevenlabs')
+        self.headers = {"xi-api-key": api_key or '', "Accept": "audio/mpeg"}
+
+    def available(self) -> bool:
+        return bool(self.api_key and self.voice_id)
+
+    def cache_key(self, text: str) -> str:
+        return tts_cache.cache_key(text, self.voice_id or '', self.model_id, self.voice_settings)
+
+    def stream(self, text: str):
+        url = f"{self.api_base}/v1/text-to-speech/{self.voice_id}/stream"
+        payload = {
+            "text": text,
+            "model_id": self.model_id,
+            "voice_settings": self.voice_settings
+        }
+        with telemetry.span('tts_upstream'):
+            response = self.client.post(url, json=payload, headers=self.headers, stream=True)
+        log.info(f"[TTS] ElevenLabs status: {response.status_code}")
+        if response.status_code != 200:
+            body = response.text
+            response.close()
+            log.warning(f"[TTS] ElevenLabs error: {body}")
+            raise TTSError(response.status_code, f'ElevenLabs API error: {body}')
+        return self._iter(response)
+
+    async def astream(self, text: str):
+        url = f"{self.api_base}/v1/text-to-speech/{self.voice_id}/stream"
+        payload = {
+            "text": text,
+            "model_id": self.model_id,
+            "voice_settings": self.voice_settings
+        }
+        with telemetry.span('tts_upstream'):
+            response = await self.client.arequest('POST', url, json=payload, headers=self.headers)
+        log.info(f"[TTS] ElevenLabs status: {response.status}")
+        if response.status != 200:
+            body = await response.text()
+            response.release()
+            log.warning(f"[TTS] ElevenLabs error: {body}")
+            raise TTSError(response.status, f'ElevenLabs API error: {body}')
+        return self._aiter(response)
+
+    async def _aiter(self, response):
+        try:
+            async for chunk in response.content.iter_chunked(TTS_CHUNK_BYTES):
+                yield chunk
+        finally:
+            response.release()
+
+    def _iter(self, response):
+        try:
+            for chunk in response.iter_content(chunk_size=TTS_CHUNK_BYTES):
+                if chunk:
+                    yield chunk
+        finally:
+            response.close()
+
+
+class LocalSynthesizer(Synthesizer):
+    """Offline stand-in that renders each word as a short tone; for development and load tests"""
+    name = 'local'
+    mimetype = 'audio/wav'
+    ext = '.wav'
+    rate = 16000
+
+    def cache_key(self, text: str) -> str:
+        return tts_cache.cache_key(text, 'local', 'tones-v1', {})
+
+    def _render(self, text: str) -> np.ndarray:
+        parts = []
+        gap = np.zeros(int(self.rate * 0.04), dtype=np.int16)
+        for word in (text.split() or ['']):
+            freq = 300 + zlib.crc32(word.encode('utf-8')) % 500
+            n = int(self.rate * min(0.35, 0.06 + 0.03 * len(word)))
+            t = np.arange(n) / self.rate
+            parts.append((np.sin(2 * math.pi * freq * t) * 6000).astype(np.int16))
+            parts.append(gap)
+        return np.concatenate(parts)
+
+    def stream(self, text: str):
+        buf = io.BytesIO()
+        with wave.open(buf, 'wb') as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(self.rate)
+            w.writeframes(self._render(text).tobytes())
+        data = buf.getvalue()
+        return (data[i:i + TTS_CHUNK_BYTES] for i in range(0, len(data), TTS_CHUNK_BYTES))
+
+
+SYNTHESIZERS = {
+    'elevenlabs': ElevenLabsSynthesizer,
+    'local': LocalSynthesizer,
+}
+
+
+def create_synthesizer(backend: str = TTS_BACKEND) -> Synthesizer:
+    return SYNTHESIZERS[backend]()
@@ -0,0 +1,203 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+TTS_CACHE_DIR = os.getenv('TTS_CACHE_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tts_cache')
+TTS_CACHE_DISK_BYTES = int(os.getenv('TTS_CACHE_DISK_BYTES', str(512 * 1024 * 1024)))
+TTS_CACHE_MEMORY_BYTES = int(os.getenv('TTS_CACHE_MEMORY_BYTES', str(32 * 1024 * 1024)))
+# A .part spool untouched this long was left by a worker that died mid-stream; younger ones
+# may belong to another worker still writing
+PART_MAX_AGE_SECONDS = 600
+
+
+def cache_key(text: str, voice_id: str, model_id: str, voice_settings: dict) -> str:
+    """Content address for a synthesized clip; any change to voice or settings is a new entry"""
+    blob = json.dumps([text, voice_id, model_id, voice_settings], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+
+class _Spool:
+    """A .part file that is published as a cache entry only if closed complete"""
+
+    def __init__(self, cache: 'TTSCache', key: str):
+        self.cache = cache
+        self.key = key
+        fd, self.tmp_path = tempfile.mkstemp(dir=cache.directory, suffix='.part')
+        self.file = os.fdopen(fd, 'wb')
+        self.size = 0
+
+    def write(self, chunk: bytes):
+        self.file.write(chunk)
+        self.size += len(chunk)
+
+    def close(self, complete: bool):
+        self.file.close()
+        if complete and self.size:
+            self.cache._commit(self.key, self.tmp_path, self.size)
+        else:
+            self.cache._discard(self.tmp_path)
+
+
+class TTSCache:
+    """Small in-memory LRU of hot clips in front of a size-bounded on-disk store"""
+
+    def __init__(self, directory: str = TTS_CACHE_DIR, disk_bytes: int = TTS_CACHE_DISK_BYTES,
+                 memory_bytes: int = TTS_CACHE_MEMORY_BYTES, ext: str = '.mp3'):
+        self.directory = directory
+        self.disk_bytes = disk_bytes
+        self.memory_bytes = memory_bytes
+        self.ext = ext
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._disk = OrderedDict()
+        self._disk_size = 0
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        entries = []
+        stale = time.time() - PART_MAX_AGE_SECONDS
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(self.ext):
+                st = entry.stat()
+                entries.append((st.st_atime, entry.name[:-len(self.ext)], st.st_size))
+            elif entry.name.endswith('.part') and entry.stat().st_mtime < stale:
+                self._discard(entry.path)
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_size += size
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.ext)
+
+    def get(self, key: str):
+        """Returns (bytes, None) from memory, (None, path) from disk, or (None, None) on a miss"""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                if key in self._disk:  # or disk eviction would drop the hottest clips first
+                    self._disk.move_to_end(key)
+                self.hits_memory += 1
+                return data, None
+            if key in self._disk:
+                self._disk.move_to_end(key)
+                self.hits_disk += 1
+                path = self.path(key)
+            else:
+                self.misses += 1
+                return None, None
+        if not os.path.exists(path):
+            with self._lock:
+                self._disk_size -= self._disk.pop(key, 0)
+            return None, None
+        if os.path.getsize(path) <= self.memory_bytes // 8:
+            # Promote small clips so the next hit doesn't touch the filesystem
+            with open(path, 'rb') as f:
+                self._remember(key, f.read())
+        return None, path
+
+    def contains(self, key: str) -> bool:
+        with self._lock:
+            return key in self._memory or key in self._disk
+
+    def put(self, key: str, data: bytes):
+        if not data:
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+        except Exception:
+            self._discard(tmp_path)
+            raise
+        self._commit(key, tmp_path, len(data))
+        self._remember(key, data)
+
+    def tee(self, key: str, chunks):
+        """Pass chunks through to the caller while spooling them into the store.
+
+        The entry is only published once the upstream stream finishes; a broken or
+        abandoned stream leaves nothing behind.
+        """
+        spool = _Spool(self, key)
+        complete = False
+        try:
+            for chunk in chunks:
+                spool.write(chunk)
+                yield chunk
+            complete = True
+        finally:
+            spool.close(complete)
+
+    async def atee(self, key: str, chunks):
+        """tee() for an async iterator of chunks"""
+        spool = _Spool(self, key)
+        complete = False
+        try:
+            async for chunk in chunks:
+                spool.write(chunk)
+                yield chunk
+            complete = True
+        finally:
+            spool.close(complete)
+
+    def _commit(self, key: str, tmp_path: str, size: int):
+        os.replace(tmp_path, self.path(key))
+        with self._lock:
+            self._disk_size -= self._disk.pop(key, 0)
+            self._disk[key] = size
+            self._disk_size += size
+            evicted = self._evict_disk()
+        for path in evicted:
+            self._discard(path)
+
+    def _discard(self, path: str):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def _remember(self, key: str, data: bytes):
+        if len(data) > self.memory_bytes:
+            return
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_size -= len(old)
+            self._memory[key] = data
+            self._memory_size += len(data)
+            while self._memory_size > self.memory_bytes:
+                _, dropped = self._memory.popitem(last=False)
+                self._memory_size -= len(dropped)
+
+    def _evict_disk(self) -> list[str]:
+        evicted = []
+        while self._disk_size > self.disk_bytes and len(self._disk) > 1:
+            key, size = self._disk.popitem(last=False)
+            self._disk_size -= size
+            dropped = self._memory.pop(key, None)
+            if dropped is not None:
+                self._memory_size -= len(dropped)
+            evicted.append(self.path(key))
+        return evicted
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits_memory + self.hits_disk + self.misses
+            return {
+                'memoryEntries': len(self._memory), 'memoryBytes': self._memory_size,
+                'diskEntries': len(self._disk), 'diskBytes': self._disk_size,
+                'hitsMemory': self.hits_memory, 'hitsDisk': self.hits_disk, 'misses': self.misses,
+                'hitRate': (self.hits_memory + self.hits_disk) / lookups if lookups else 0.0,
+            }
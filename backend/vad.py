@@ -0,0 +1,192 @@
+import os
+import threading
+
+import numpy as np
+
+import telemetry
+
+log = telemetry.get_logger('vad')
+
+SAMPLE_RATE = 16000
+
+VAD_BACKEND = os.getenv('VAD_BACKEND', 'energy').lower()
+VAD_MODEL_PATH = os.getenv('VAD_MODEL_PATH', os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'frontend', 'public', 'silero_vad_v5.onnx'))
+VAD_THRESHOLD = float(os.getenv('VAD_THRESHOLD', '0.5'))
+VAD_MIN_DB = float(os.getenv('VAD_MIN_DB', '-50'))
+VAD_MARGIN_DB = float(os.getenv('VAD_MARGIN_DB', '10'))
+VAD_PAD_MS = int(os.getenv('VAD_PAD_MS', '200'))
+VAD_MIN_SPEECH_MS = int(os.getenv('VAD_MIN_SPEECH_MS', '150'))
+VAD_MERGE_GAP_MS = int(os.getenv('VAD_MERGE_GAP_MS', '400'))
+VAD_JOIN_MS = int(os.getenv('VAD_JOIN_MS', '150'))
+
+
+class VADStats:
+    def __init__(self):
+        self.utterances = 0
+        self.rejected = 0
+        self.input_samples = 0
+        self.kept_samples = 0
+        self._lock = threading.Lock()
+
+    def observe(self, input_samples: int, kept_samples: int):
+        input_samples, kept_samples = int(input_samples), int(kept_samples)
+        with self._lock:
+            self.utterances += 1
+            self.rejected += int(kept_samples == 0)
+            self.input_samples += input_samples
+            self.kept_samples += kept_samples
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            total, kept = self.input_samples, self.kept_samples
+            return {
+                'utterances': self.utterances, 'rejectedSilent': self.rejected,
+                'inputSeconds': round(total / SAMPLE_RATE, 2), 'keptSeconds': round(kept / SAMPLE_RATE, 2),
+                'discardedSeconds': round((total - kept) / SAMPLE_RATE, 2),
+                'discardRatio': (total - kept) / total if total else 0.0,
+            }
+
+
+class VoiceActivityDetector:
+    """Finds the speech in an utterance so silence never reaches the recognizer"""
+    name = 'base'
+    frame_samples = 480
+
+    def __init__(self, pad_ms: int = VAD_PAD_MS, min_speech_ms: int = VAD_MIN_SPEECH_MS,
+                 merge_gap_ms: int = VAD_MERGE_GAP_MS, join_ms: int = VAD_JOIN_MS):
+        self.pad_ms = pad_ms
+        self.min_speech_ms = min_speech_ms
+        self.merge_gap_ms = merge_gap_ms
+        self.join = np.zeros(SAMPLE_RATE * join_ms // 1000, dtype=np.int16)
+        self.stats = VADStats()
+
+    def speech_frames(self, pcm: np.ndarray) -> np.ndarray:
+        """Boolean per `frame_samples` frame of 16 kHz int16 PCM"""
+        raise NotImplementedError
+
+    def _frames(self, ms: int) -> int:
+        return -(-ms * SAMPLE_RATE // 1000 // self.frame_samples)
+
+    def segments(self, pcm: np.ndarray) -> list[tuple[int, int]]:
+        """(start, end) sample offsets of speech, padded, with short pauses bridged"""
+        if len(pcm) < self.frame_samples:
+            return []
+        speech = self.speech_frames(pcm)
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], speech.astype(np.int8), [0]))))
+        runs = []
+        for start, end in zip(edges[::2], edges[1::2]):
+            if runs and start - runs[-1][1] < self._frames(self.merge_gap_ms):
+                runs[-1][1] = end
+            else:
+                runs.append([start, end])
+        min_frames = self._frames(self.min_speech_ms)
+        pad = self._frames(self.pad_ms)
+        segments = []
+        for start, end in runs:
+            if end - start < min_frames:
+                continue
+            start = max(0, (start - pad) * self.frame_samples)
+            end = min(len(pcm), (end + pad) * self.frame_samples)
+            if segments and start <= segments[-1][1]:
+                segments[-1] = (segments[-1][0], end)
+            else:
+                segments.append((start, end))
+        return segments
+
+    def trim(self, pcm: np.ndarray) -> np.ndarray:
+        """Speech segments joined by a short gap; empty when the clip is silent"""
+        segments = self.segments(pcm)
+        if not segments:
+            speech = np.zeros(0, dtype=np.int16)
+        elif len(segments) == 1:
+            speech = pcm[segments[0][0]:segments[0][1]]
+        else:
+            parts = []
+            for start, end in segments:
+                parts += [pcm[start:end], self.join]
+            speech = np.concatenate(parts[:-1])
+        self.stats.observe(len(pcm), sum(end - start for start, end in segments))
+        return speech
+
+
+class EnergyVAD(VoiceActivityDetector):
+    """Frames above the clip's noise floor plus a margin, and above an absolute minimum.
+
+    A clip whose loudest frame is not `margin_db` above its floor (silence, or steady noise
+    at any level) has no speech. Otherwise the threshold never rises above `margin_db` under
+    the loudest frame, so a clip that is speech from end to end is kept whole.
+    """
+    name = 'energy'
+
+    def __init__(self, min_db: float = VAD_MIN_DB, margin_db: float = VAD_MARGIN_DB, **kwargs):
+        super().__init__(**kwargs)
+        self.min_db = min_db
+        self.margin_db = margin_db
+
+    def speech_frames(self, pcm: np.ndarray) -> np.ndarray:
+        n = len(pcm) // self.frame_samples
+        frames = pcm[:n * self.frame_samples].astype(np.float32).reshape(n, self.frame_samples) / 32768.0
+        db = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+        floor = np.percentile(db, 10)
+        if db.max() - floor < self.margin_db:
+            return np.zeros(n, dtype=bool)
+        threshold = min(floor + self.margin_db, db.max() - self.margin_db)
+        return db > max(self.min_db, threshold)
+
+
+class SileroVAD(VoiceActivityDetector):
+    """Silero v5 (the model the web client runs), scored on 32 ms frames with onnxruntime"""
+    name = 'silero'
+    frame_samples = 512
+
+    def __init__(self, model_path: str = VAD_MODEL_PATH, threshold: float = VAD_THRESHOLD, **kwargs):
+        super().__init__(**kwargs)
+        import onnxruntime  # only this detector needs it, and it is slow to import
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = 1
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(model_path, sess_options=options,
+                                                    providers=['CPUExecutionProvider'])
+        self.threshold = threshold
+        self._sr = np.array(SAMPLE_RATE, dtype=np.int64)
+
+    def speech_frames(self, pcm: np.ndarray) -> np.ndarray:
+        n = len(pcm) // self.frame_samples
+        frames = pcm[:n * self.frame_samples].astype(np.float32).reshape(n, 1, self.frame_samples) / 32768.0
+        state = np.zeros((2, 1, 128), dtype=np.float32)
+        probs = np.empty(n, dtype=np.float32)
+        for i in range(n):
+            out, state = self.session.run(['output', 'stateN'], {'input': frames[i], 'state': state, 'sr': self._sr})
+            probs[i] = out.reshape(-1)[0]
+        return probs >= self.threshold
+
+
+class NullVAD(VoiceActivityDetector):
+    """VAD_BACKEND=off: everything is speech"""
+    name = 'off'
+
+    def speech_frames(self, pcm: np.ndarray) -> np.ndarray:
+        return np.ones(len(pcm) // self.frame_samples, dtype=bool)
+
+    def trim(self, pcm: np.ndarray) -> np.ndarray:
+        self.stats.observe(len(pcm), len(pcm))
+        return pcm
+
+
+DETECTORS = {
+    'energy': EnergyVAD,
+    'silero': SileroVAD,
+    'off': NullVAD,
+}
+
+
+def create_vad(backend: str = VAD_BACKEND) -> VoiceActivityDetector:
+    if backend == 'silero' and not os.path.exists(VAD_MODEL_PATH):
+        log.warning(f"[VAD] Silero needs {VAD_MODEL_PATH}; using the energy detector")
+        backend = 'energy'
+    try:
+        return DETECTORS[backend]()
+    except Exception as e:
+        log.warning(f"[VAD] Could not load {backend} detector ({e}); using the energy detector")
+        return EnergyVAD()
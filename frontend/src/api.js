@@ -13,7 +13,7 @@ export const sendConversation = async (payload) => {
     });
     const body = await res.json().catch(() => null);
     if (!res.ok) {
-      const msg = (body && body.agentMessage) || `HTTP ${res.status}`;
+      const msg = (body && (body.agentMessage || body.error)) || `HTTP ${res.status}`;
       throw new Error(msg);
     }
     return body || {
@@ -32,6 +32,84 @@ export const sendConversation = async (payload) => {
   }
 };
 
+// Raw audio body with the session in the query string: no base64, no JSON wrapping
+export const sendConversationAudio = async (session, blob) => {
+  try {
+    const query = new URLSearchParams({ sessionId: session.sessionId, version: String(session.version) });
+    const res = await fetch(`${API_BASE}/conversation?${query}`, {
+      method: 'POST',
+      headers: { 'Content-Type': blob.type || 'application/octet-stream' },
+      body: blob,
+    });
+    const body = await res.json().catch(() => null);
+    if (!res.ok || !body) throw new Error((body && (body.agentMessage || body.error)) || `HTTP ${res.status}`);
+    return body;
+  } catch (err) {
+    console.error('[API] /conversation upload failed:', err);
+    return {
+      transcript: '',
+      agentMessage: String(err?.message || 'Could not contact server.'),
+      events: [],
+      nextStep: 'complete'
+    };
+  }
+};
+
+export const startStream = async (session) => {
+  const res = await fetch(`${API_BASE}/conversation/stream`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(session),
+  });
+  if (!res.ok) throw new Error(`Stream start failed: ${res.status}`);
+  return res.json();
+};
+
+export const sendStreamAudio = async (streamId, pcm16) => {
+  try {
+    const res = await fetch(`${API_BASE}/conversation/stream/${streamId}/audio`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/octet-stream' },
+      body: pcm16,
+    });
+    if (!res.ok) return '';
+    const body = await res.json();
+    return body.partial || '';
+  } catch (err) {
+    console.error('[API] stream audio failed:', err);
+    return '';
+  }
+};
+
+export const endStream = async (streamId) => {
+  try {
+    const res = await fetch(`${API_BASE}/conversation/stream/${streamId}/end`, { method: 'POST' });
+    const body = await res.json().catch(() => null);
+    if (!res.ok || !body) throw new Error((body && (body.agentMessage || body.error)) || `HTTP ${res.status}`);
+    return body;
+  } catch (err) {
+    console.error('[API] stream end failed:', err);
+    return {
+      transcript: '',
+      agentMessage: String(err?.message || 'Could not contact server.'),
+      events: [],
+      diagQns: [], diagIdx: 0, diagAnswers: [],
+      userProblem: '', problemType: '', nextStep: 'complete'
+    };
+  }
+};
+
+export const fetchDispatchStatus = async (jobId) => {
+  try {
+    const res = await fetch(`${API_BASE}/dispatch/${jobId}`);
+    if (!res.ok) throw new Error(`HTTP ${res.status}`);
+    return await res.json();
+  } catch (err) {
+    console.error('[API] dispatch status failed:', err);
+    return null;
+  }
+};
+
 export const fetchTTS = async (text) => {
   try {
     const res = await fetch(`${API_BASE}/tts`, {
@@ -46,3 +124,43 @@ export const fetchTTS = async (text) => {
     return null;
   }
 };
+
+// Returns an object URL that can start playing as soon as the first MP3 chunk arrives.
+// Falls back to a fully buffered blob where MediaSource can't take the stream.
+export const fetchTTSStreamUrl = async (text) => {
+  try {
+    const res = await fetch(`${API_BASE}/tts`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ text }),
+    });
+    if (!res.ok) throw new Error(`TTS failed: ${res.status}`);
+    const mime = (res.headers.get('Content-Type') || 'audio/mpeg').split(';')[0];
+    const canStream = res.body && window.MediaSource && MediaSource.isTypeSupported(mime);
+    if (!canStream) return URL.createObjectURL(await res.blob());
+
+    const mediaSource = new MediaSource();
+    const url = URL.createObjectURL(mediaSource);
+    mediaSource.addEventListener('sourceopen', async () => {
+      const sourceBuffer = mediaSource.addSourceBuffer(mime);
+      const reader = res.body.getReader();
+      const appended = () => new Promise(resolve => sourceBuffer.addEventListener('updateend', resolve, { once: true }));
+      try {
+        for (;;) {
+          const { done, value } = await reader.read();
+          if (done) break;
+          sourceBuffer.appendBuffer(value);
+          await appended();
+        }
+        if (mediaSource.readyState === 'open') mediaSource.endOfStream();
+      } catch (err) {
+        console.error('[TTS Stream Error]', err);
+        if (mediaSource.readyState === 'open') mediaSource.endOfStream('network');
+      }
+    }, { once: true });
+    return url;
+  } catch (err) {
+    console.error('[TTS Error]', err);
+    return null;
+  }
+};
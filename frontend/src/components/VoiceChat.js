@@ -1,5 +1,6 @@
 import React, { useState, useRef, useEffect, useCallback } from 'react';
-import { sendConversation, fetchTTS } from '../api';
+import { MicVAD } from '@ricky0123/vad-web';
+import { sendConversation, sendConversationAudio, fetchTTSStreamUrl, startStream, sendStreamAudio, endStream, fetchDispatchStatus } from '../api';
 import './VoiceChat.css';
 import StepTimeline from './StepTimeline';
 import Waveform from './Waveform';
@@ -23,6 +24,10 @@ function EscalationBanner({ events }) {
 const SILENCE_THRESHOLD = 0.02;  // Increased sensitivity
 const SILENCE_MS = 1800;  // 1.8 seconds before stopping
 const MAX_UTTERANCE_MS = 15000;  // 15 seconds max recording
+const STREAMING_ASR = process.env.REACT_APP_STREAMING_ASR === 'true';  // send PCM frames while the user talks
+const STREAM_FLUSH_MS = 200;  // batch VAD frames into ~200ms uploads
+const DISPATCH_POLL_MS = 1000;
+const DISPATCH_POLL_TIMEOUT_MS = 120000;
 
 const stepIndexMap = { greet:0, describe_problem:0, diagnostic:1, urgency:2, calling:3, complete:4 };
 
@@ -32,8 +37,10 @@ const VoiceChat = () => {
   const [isProcessing, setIsProcessing] = useState(false);
   const [isSpeaking, setIsSpeaking] = useState(false);
   const [escalationEvents, setEscalationEvents] = useState([]);
+  const [partialTranscript, setPartialTranscript] = useState('');
 
-  const sessionRef = useRef({ step:'greet', diagQns:[], diagIdx:0, diagAnswers:[], userProblem:'', problemType:'' });
+  // Conversation state lives on the server; each turn sends the session id and the version it last saw
+  const sessionRef = useRef({ step:'greet', sessionId:null, version:0 });
   const bootRef = useRef(false);
 
   const mediaRecorderRef = useRef(null);
@@ -48,6 +55,8 @@ const VoiceChat = () => {
   const maxTimerRef = useRef(null);
   const autoArmTimeoutRef = useRef(null);
   const currentAudioRef = useRef(null);
+  const vadRef = useRef(null);
+  const streamFinishRef = useRef(null);
 
   const scrollToBottom = useCallback(() => { messagesEndRef.current?.scrollIntoView({ behavior:'smooth' }); }, []);
   useEffect(scrollToBottom, [messages, scrollToBottom]);
@@ -61,12 +70,11 @@ const VoiceChat = () => {
     if (!text) return;
     try {
       setIsSpeaking(true);
-      const audioBlob = await fetchTTS(text);
-      if (!audioBlob) {
+      const audioUrl = await fetchTTSStreamUrl(text);
+      if (!audioUrl) {
         setIsSpeaking(false);
         return;
       }
-      const audioUrl = URL.createObjectURL(audioBlob);
       const audio = new Audio(audioUrl);
       currentAudioRef.current = audio;
       
@@ -103,10 +111,10 @@ const VoiceChat = () => {
 
   const initConversation = useCallback(async () => {
     try {
-      const resp = await sendConversation({ audioBase64:'', step:'greet', diagQns:[], diagIdx:0, diagAnswers:[], userProblem:'', problemType:'' });
+      const resp = await sendConversation({ audioBase64:'', step:'greet' });
       addMessage('agent', resp.agentMessage);
       await speak(resp.agentMessage);
-      sessionRef.current = { step: resp.nextStep, diagQns: resp.diagQns || [], diagIdx: resp.diagIdx ?? 0, diagAnswers: resp.diagAnswers || [], userProblem: resp.userProblem || '', problemType: resp.problemType || '' };
+      sessionRef.current = { step: resp.nextStep, sessionId: resp.sessionId, version: resp.version };
       
       // Auto-start recording after greeting
       if (resp.nextStep !== 'complete') {
@@ -139,6 +147,8 @@ const VoiceChat = () => {
       audioContextRef.current = null; analyserRef.current = null;
     }
     silenceSinceRef.current = null;
+    if (vadRef.current) { try { vadRef.current.destroy(); } catch {} vadRef.current = null; }
+    streamFinishRef.current = null;
     if (streamRef.current) streamRef.current.getTracks().forEach(t => t.stop());
   };
 
@@ -153,6 +163,7 @@ const VoiceChat = () => {
     const { step } = sessionRef.current;
     if (isRecording || isProcessing || isSpeaking) return;
     if (step === 'complete') { addMessage('agent', 'This session is complete. Please refresh to start over.'); return; }
+    if (STREAMING_ASR) { await startStreaming(); return; }
     
     try {
       if (currentAudioRef.current) currentAudioRef.current.pause();
@@ -205,68 +216,141 @@ const VoiceChat = () => {
     }
   };
 
-  const stopRecording = () => { if (mediaRecorderRef.current && isRecording) mediaRecorderRef.current.stop(); };
-
-  const processAudio = async (blob) => {
-    setIsProcessing(true);
+  const startStreaming = async () => {
     try {
-      const reader = new FileReader();
-      reader.onloadend = async () => {
-        const fullDataUrl = reader.result;
-        const payload = { ...sessionRef.current, audioBase64: fullDataUrl };
+      if (currentAudioRef.current) currentAudioRef.current.pause();
+      const { streamId } = await startStream(sessionRef.current);
+      let pending = [];
+      let pendingLen = 0;
+      let lastFlush = performance.now();
+      let chain = Promise.resolve();
+      let ended = false;
+
+      // Silero frames are 16 kHz float32; the backend takes little-endian int16
+      const flush = () => {
+        if (!pendingLen) return chain;
+        const pcm = new Int16Array(pendingLen);
+        let off = 0;
+        for (const frame of pending) {
+          for (let i = 0; i < frame.length; i++) { const v = Math.max(-1, Math.min(1, frame[i])); pcm[off++] = v < 0 ? v * 0x8000 : v * 0x7fff; }
+        }
+        pending = []; pendingLen = 0;
+        chain = chain.then(() => sendStreamAudio(streamId, pcm)).then(p => { if (p && !ended) setPartialTranscript(p); });
+        return chain;
+      };
+
+      const finish = async () => {
+        if (ended) return;
+        ended = true;
+        if (maxTimerRef.current) { clearTimeout(maxTimerRef.current); maxTimerRef.current = null; }
+        if (vadRef.current) vadRef.current.pause();
+        setIsRecording(false);
+        setIsProcessing(true);
         try {
-          const resp = await sendConversation(payload);
-
-          if (resp.nextStep === 'calling') {
-            if (resp.agentMessage) { addMessage('agent', resp.agentMessage); await speak(resp.agentMessage); }
-            if (Array.isArray(resp.events) && resp.events.length) {
-              for (const evt of resp.events) { addMessage('agent', evt); await speak(evt); await new Promise(r => setTimeout(r, 200)); }
-            }
-            const callPayload = { ...sessionRef.current, step:'calling', audioBase64:'' };
-            try {
-              const callResp = await sendConversation(callPayload);
-              if (Array.isArray(callResp.events) && callResp.events.length) {
-                setEscalationEvents(callResp.events);
-                for (const evt of callResp.events) { addMessage('agent', evt); await speak(evt); await new Promise(r => setTimeout(r, 200)); }
-              } else { setEscalationEvents([]); }
-              if (callResp.agentMessage) { addMessage('agent', callResp.agentMessage); await speak(callResp.agentMessage); }
-              sessionRef.current = { ...sessionRef.current, step: callResp.nextStep, diagQns: callResp.diagQns || [], diagIdx: callResp.diagIdx ?? 0, diagAnswers: callResp.diagAnswers || [], userProblem: callResp.userProblem || sessionRef.current.userProblem, problemType: callResp.problemType || sessionRef.current.problemType };
-              if (callResp.nextStep !== 'complete') { if (autoArmTimeoutRef.current) clearTimeout(autoArmTimeoutRef.current); autoArmTimeoutRef.current = setTimeout(() => startRecording(), 500); }
-            } catch {
-              addMessage('agent','Call escalation failed. Please try again soon.');
-            } finally { setIsProcessing(false); }
-            return;
-          }
-
-          if (resp.transcript) addMessage('user', resp.transcript);
-          if (Array.isArray(resp.events) && resp.events.length) {
-            setEscalationEvents(resp.events);
-            for (const evt of resp.events) { addMessage('agent', evt); await speak(evt); await new Promise(r => setTimeout(r, 200)); }
-          } else { setEscalationEvents([]); }
-          if (resp.agentMessage) { addMessage('agent', resp.agentMessage); await speak(resp.agentMessage); }
-
-          sessionRef.current = {
-            step: resp.nextStep,
-            diagQns: resp.diagQns || [],
-            diagIdx: resp.diagIdx ?? 0,
-            diagAnswers: resp.diagAnswers || [],
-            userProblem: resp.userProblem || sessionRef.current.userProblem,
-            problemType: resp.problemType || sessionRef.current.problemType
-          };
-
-          if (autoArmTimeoutRef.current) clearTimeout(autoArmTimeoutRef.current);
-          if (resp.nextStep !== 'complete') { autoArmTimeoutRef.current = setTimeout(() => startRecording(), 500); }
+          await flush();
+          const resp = await endStream(streamId);
+          setPartialTranscript('');
+          cleanupMedia();
+          await handleResponse(resp);
         } catch {
           addMessage('agent','Could not contact server. Please try again.');
         } finally { setIsProcessing(false); }
       };
-      reader.readAsDataURL(blob);
+
+      const vad = await MicVAD.new({
+        model: 'v5',
+        baseAssetPath: '/',
+        onFrameProcessed: (_probs, frame) => {
+          if (ended || !frame) return;
+          pending.push(frame); pendingLen += frame.length;
+          const now = performance.now();
+          if (now - lastFlush >= STREAM_FLUSH_MS) { lastFlush = now; flush(); }
+        },
+        onSpeechEnd: () => { finish(); },
+      });
+      vadRef.current = vad;
+      streamFinishRef.current = finish;
+      vad.start();
+      setIsRecording(true);
+      maxTimerRef.current = setTimeout(finish, MAX_UTTERANCE_MS);
     } catch {
-      addMessage('agent','Error processing your request. Please try again.');
-      setIsProcessing(false);
+      addMessage('agent', 'Microphone access denied. Please enable it and try again.');
+    }
+  };
+
+  const stopRecording = () => {
+    if (!isRecording) return;
+    if (streamFinishRef.current) { streamFinishRef.current(); return; }
+    if (mediaRecorderRef.current) mediaRecorderRef.current.stop();
+  };
+
+  const followDispatch = async (jobId) => {
+    const started = Date.now();
+    let seen = 0;
+    for (;;) {
+      const job = await fetchDispatchStatus(jobId);
+      if (!job) { addMessage('agent', 'Lost track of the technician call. Our team will follow up shortly.'); return; }
+      const fresh = (job.events || []).slice(seen);
+      seen += fresh.length;
+      if (fresh.length) setEscalationEvents(job.events);
+      for (const evt of fresh) { addMessage('agent', evt); await speak(evt); await new Promise(r => setTimeout(r, 200)); }
+      if (job.done) {
+        if (job.final) { addMessage('agent', job.final); await speak(job.final); }
+        return;
+      }
+      if (Date.now() - started > DISPATCH_POLL_TIMEOUT_MS) { addMessage('agent', 'The technician call is taking longer than expected. We will notify you once it connects.'); return; }
+      await new Promise(r => setTimeout(r, DISPATCH_POLL_MS));
     }
   };
 
+  const handleResponse = async (resp) => {
+    if (resp.nextStep === 'calling') {
+      if (resp.agentMessage) { addMessage('agent', resp.agentMessage); await speak(resp.agentMessage); }
+      if (Array.isArray(resp.events) && resp.events.length) {
+        for (const evt of resp.events) { addMessage('agent', evt); await speak(evt); await new Promise(r => setTimeout(r, 200)); }
+      }
+      // The describe/diagnostic turn bumped the version; the calling turn must carry the new one
+      sessionRef.current = { ...sessionRef.current, step: resp.nextStep, sessionId: resp.sessionId ?? sessionRef.current.sessionId, version: resp.version ?? sessionRef.current.version };
+      const callPayload = { ...sessionRef.current, step:'calling', audioBase64:'' };
+      try {
+        const callResp = await sendConversation(callPayload);
+        if (Array.isArray(callResp.events) && callResp.events.length) {
+          setEscalationEvents(callResp.events);
+          for (const evt of callResp.events) { addMessage('agent', evt); await speak(evt); await new Promise(r => setTimeout(r, 200)); }
+        } else { setEscalationEvents([]); }
+        if (callResp.agentMessage) { addMessage('agent', callResp.agentMessage); await speak(callResp.agentMessage); }
+        if (callResp.dispatchJob) await followDispatch(callResp.dispatchJob);
+        sessionRef.current = { ...sessionRef.current, step: callResp.nextStep, version: callResp.version ?? sessionRef.current.version };
+        if (callResp.nextStep !== 'complete') { if (autoArmTimeoutRef.current) clearTimeout(autoArmTimeoutRef.current); autoArmTimeoutRef.current = setTimeout(() => startRecording(), 500); }
+      } catch {
+        addMessage('agent','Call escalation failed. Please try again soon.');
+      }
+      return;
+    }
+
+    if (resp.transcript) addMessage('user', resp.transcript);
+    if (Array.isArray(resp.events) && resp.events.length) {
+      setEscalationEvents(resp.events);
+      for (const evt of resp.events) { addMessage('agent', evt); await speak(evt); await new Promise(r => setTimeout(r, 200)); }
+    } else { setEscalationEvents([]); }
+    if (resp.agentMessage) { addMessage('agent', resp.agentMessage); await speak(resp.agentMessage); }
+
+    sessionRef.current = { ...sessionRef.current, step: resp.nextStep, version: resp.version ?? sessionRef.current.version };
+
+    if (autoArmTimeoutRef.current) clearTimeout(autoArmTimeoutRef.current);
+    if (resp.nextStep !== 'complete') { autoArmTimeoutRef.current = setTimeout(() => startRecording(), 500); }
+  };
+
+  const processAudio = async (blob) => {
+    setIsProcessing(true);
+    try {
+      const resp = await sendConversationAudio(sessionRef.current, blob);
+      await handleResponse(resp);
+    } catch {
+      addMessage('agent','Could not contact server. Please try again.');
+    } finally { setIsProcessing(false); }
+  };
+
   const currentIdx = stepIndexMap[sessionRef.current?.step] ?? 0;
 
   return (
@@ -292,6 +376,14 @@ const VoiceChat = () => {
               </div>
             </div>
           ))}
+          {partialTranscript && (
+            <div className="message user partial">
+              <div className="message-bubble">
+                <strong>👤 YOU</strong>
+                <p>{partialTranscript}</p>
+              </div>
+            </div>
+          )}
           <div ref={messagesEndRef} />
         </div>
 